@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -9,6 +11,22 @@ class Settings(BaseSettings):
     model_path: str = "/data/models"
     cors_origins: list[str] = ["http://localhost:5173"]
     cookie_secure: bool = True
+    import_workers: int = 2  # threads running import jobs, whose progress lives in one server process (see import_jobs)
+    parse_workers: int | None = None  # processes parsing uploaded files, defaults to the CPU count, 0 parses inline
+    parse_timeout: float = 120.0  # seconds allowed to parse a single file
+    parse_memory_limit_mb: int = 2048  # address space cap of a parsing process, 0 for none
+    upload_spool_size: int = 1024 * 1024  # bytes of each upload kept in memory before spilling to disk
+    inference_max_requests: int = 1000  # prediction batches served by the inference process before it is replaced
+    inference_memory_limit_mb: int = 1024  # resident memory past which the inference process is replaced, 0 for none
+    inference_timeout: float = 300.0  # seconds allowed to predict a batch
+    ml_n_jobs: int = 1  # processes fitting candidate models during training, -1 for one per CPU
+    ml_search: Literal["grid", "halving_grid", "halving_random"] = "grid"  # hyperparameter search strategy
+    ml_search_budget: float = 0.0  # seconds after which no more candidate models are evaluated, 0 for none
+    ml_incremental: bool = False  # train linear models on stateless features, which nightly updates train further
+    ml_full_retrain_days: int = 7  # days after which an incremental model is trained again from scratch
+    ml_feature_drift: float = 0.2  # share of labelled transactions changed past which stored features are refitted
+    parse_cache_dir: str = "/data/parse_cache"  # parsed statements cached by content hash, empty to disable
+    parse_cache_max_mb: int = 1024  # size past which least recently used parse cache entries are evicted, 0 for none
 
     model_config = {"env_prefix": "BANKING_", "env_file": ".env"}
 
@@ -74,8 +74,14 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
 
     yield
 
+    from app.ml.predictor import shutdown_inference_worker
+    from app.services.import_jobs import shutdown_import_jobs
+    from app.services.parse_pool import shutdown_parse_pool
     from app.tasks.scheduler import shutdown_scheduler
 
+    shutdown_import_jobs()
+    shutdown_inference_worker()
+    shutdown_parse_pool()
     shutdown_scheduler()
 
 
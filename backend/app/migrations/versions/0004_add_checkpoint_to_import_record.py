@@ -0,0 +1,27 @@
+"""add checkpoint to import_record
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("import_record")]
+    if "checkpoint" not in columns:
+        op.add_column("import_record", sa.Column("checkpoint", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_record", "checkpoint")
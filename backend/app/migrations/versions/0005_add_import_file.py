@@ -0,0 +1,34 @@
+"""add import_file
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    if not inspector.has_table("import_file"):
+        op.create_table(
+            "import_file",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("id_import", sa.Integer(), sa.ForeignKey("import_record.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("filename", sa.String(255), nullable=False),
+            sa.Column("content_hash", sa.String(64), nullable=False),
+        )
+        op.create_index("ix_import_file_content_hash", "import_file", ["content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_file_content_hash", table_name="import_file")
+    op.drop_table("import_file")
@@ -0,0 +1,27 @@
+"""add id_import to account
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("account")]
+    if "id_import" not in columns:
+        op.add_column("account", sa.Column("id_import", sa.Integer(), sa.ForeignKey("import_record.id"), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("account", "id_import")
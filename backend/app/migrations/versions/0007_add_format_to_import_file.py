@@ -0,0 +1,27 @@
+"""add format to import_file
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("import_file")]
+    if "format" not in columns:
+        op.add_column("import_file", sa.Column("format", sa.String(50), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_file", "format")
@@ -0,0 +1,40 @@
+"""add transaction_prediction
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    if not inspector.has_table("transaction_prediction"):
+        op.create_table(
+            "transaction_prediction",
+            sa.Column(
+                "id_transaction",
+                sa.Integer(),
+                sa.ForeignKey("transaction.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("id_model", sa.Integer(), sa.ForeignKey("ml_model.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("id_category", sa.Integer(), sa.ForeignKey("category.id", ondelete="SET NULL"), nullable=True),
+            sa.Column("probability", sa.Float(), nullable=False),
+            sa.Column("top_k", sa.JSON(), nullable=True),
+        )
+        op.create_index("ix_transaction_prediction_id_model", "transaction_prediction", ["id_model"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transaction_prediction_id_model", table_name="transaction_prediction")
+    op.drop_table("transaction_prediction")
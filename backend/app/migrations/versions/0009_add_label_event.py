@@ -0,0 +1,34 @@
+"""add label_event
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    if not inspector.has_table("label_event"):
+        op.create_table(
+            "label_event",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("kind", sa.String(20), nullable=False),
+            sa.Column("id_transaction", sa.Integer(), nullable=True),
+            sa.Column("id_group", sa.Integer(), nullable=True),
+            sa.Column("id_category", sa.Integer(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("label_event")
@@ -0,0 +1,32 @@
+"""Saved model artifacts: the fitted pipeline and what is needed to decode its predictions.
+
+The category id of each encoded label is fixed at training time, so predictions are decoded with an array lookup,
+without the database, and stay consistent with the category tree the model was trained on.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from joblib import dump, load
+
+
+@dataclass
+class ModelArtifact:
+    pipeline: Any
+    category_ids: np.ndarray  # category id of each encoded label
+    category_fingerprint: str  # see trainer.category_fingerprint
+    class_level: str
+
+    def decode(self, labels: Any) -> Any:
+        """Category ids of encoded labels, as (nested) lists of the shape of `labels`."""
+        return self.category_ids[np.asarray(labels, dtype=int)].tolist()
+
+
+def save_artifact(artifact: ModelArtifact, filepath: str) -> None:
+    dump(artifact, filepath)
+
+
+def load_artifact(filepath: str) -> ModelArtifact | Any:
+    """The artifact saved at `filepath`, or the bare pipeline of a model trained before artifacts were bundled."""
+    return load(filepath)
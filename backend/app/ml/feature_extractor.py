@@ -7,11 +7,14 @@ Ported from server/ml/feature_extractor.py with v2 adaptations:
 """
 
 import re
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
 from typing import Any
 
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.pipeline import FeatureUnion, Pipeline
 from sklearn.preprocessing import LabelEncoder, OneHotEncoder
 from sqlalchemy.orm import Session
@@ -42,25 +45,106 @@ REMOVE_PATTERNS = [
 ]
 
 
+# converts the values of each model input attribute of transactions into a column array
+_COLUMN_TYPES: dict[str, Callable[[list[Any]], np.ndarray]] = {
+    "description": lambda values: np.array([str(v) for v in values], dtype=object),
+    "date": lambda values: np.array(values, dtype="datetime64[D]"),  # NaT when missing
+    "amount": lambda values: np.array(values, dtype=np.float64),
+    "id_source": lambda values: np.array([-1 if v is None else v for v in values], dtype=np.int64),
+    "id_dest": lambda values: np.array([-1 if v is None else v for v in values], dtype=np.int64),
+}
+
+
+@dataclass
+class TransactionColumns:
+    """Model inputs of transactions, one array per attribute: transformers work on whole columns at once."""
+
+    description: np.ndarray
+    date: np.ndarray
+    amount: np.ndarray
+    id_source: np.ndarray
+    id_dest: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    @classmethod
+    def from_lists(cls, **columns: Sequence[Any]) -> "TransactionColumns":
+        """Columns from lists of attribute values (None when missing)."""
+        return cls(**{name: _COLUMN_TYPES[name](list(values)) for name, values in columns.items()})
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["TransactionColumns"]) -> "TransactionColumns":
+        if not parts:
+            return cls.from_lists(**{name: [] for name in _COLUMN_TYPES})
+        return cls(**{name: np.concatenate([getattr(part, name) for part in parts]) for name in _COLUMN_TYPES})
+
+    def take(self, indices: np.ndarray) -> "TransactionColumns":
+        """Columns of the rows at `indices` (or selected by a boolean mask)."""
+        return TransactionColumns(**{name: getattr(self, name)[indices] for name in _COLUMN_TYPES})
+
+    @classmethod
+    def from_transactions(cls, transactions: Any) -> "TransactionColumns":
+        if isinstance(transactions, TransactionColumns):
+            return transactions
+        return cls.from_lists(**{name: [getattr(t, name) for t in transactions] for name in _COLUMN_TYPES})
+
+
+def _column(X: Any, name: str) -> np.ndarray:
+    """Column `name` of transactions X, given as TransactionColumns or as a sequence of objects."""
+    if isinstance(X, TransactionColumns):
+        return getattr(X, name)  # type: ignore[no-any-return]
+    return _COLUMN_TYPES[name]([getattr(t, name) for t in X])
+
+
+class TransactionFeatureUnion(FeatureUnion):
+    """Feature union gathering the model inputs of transactions into TransactionColumns once, for all transformers."""
+
+    def fit(self, X: Any, y: Any = None, **params: Any) -> "TransactionFeatureUnion":
+        return super().fit(TransactionColumns.from_transactions(X), y, **params)  # type: ignore[no-any-return]
+
+    def fit_transform(self, X: Any, y: Any = None, **params: Any) -> Any:
+        return super().fit_transform(TransactionColumns.from_transactions(X), y, **params)
+
+    def transform(self, X: Any, **params: Any) -> Any:
+        return super().transform(TransactionColumns.from_transactions(X), **params)
+
+
 class DescriptionPreprocessor(BaseEstimator, TransformerMixin):
-    """Removes noise patterns from transaction descriptions."""
+    """Removes noise patterns from transaction descriptions, in one pass of a combined pattern.
+
+    The combined pass can clean a description differently from removing the patterns one after the other (e.g.
+    "REF. :05/0312/05/2023" gives "REF. :/" instead of "REF. :05/"). Models saved before the patterns were combined
+    keep removing them one by one, as when they were trained.
+    """
 
     def __init__(self, remove_patterns: list[str] | None = None) -> None:
         self.remove_patterns = remove_patterns or REMOVE_PATTERNS
-        self._compiled: list[re.Pattern[str]] = []
+        self._pattern: re.Pattern[str] | None = None
+        self._compiled: list[re.Pattern[str]] = []  # patterns removed one by one, by models saved before combining
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        super().__setstate__(state)
+        self.__dict__.setdefault("_pattern", None)
+        self.__dict__.setdefault("_compiled", [])
 
     def fit(self, X: Any, y: Any = None) -> "DescriptionPreprocessor":
-        self._compiled = [re.compile(p, re.IGNORECASE | re.UNICODE) for p in self.remove_patterns]
+        combined = "|".join(f"(?:{p})" for p in self.remove_patterns)
+        self._pattern = re.compile(combined, re.IGNORECASE | re.UNICODE)
+        self._compiled = []
         return self
 
     def transform(self, X: Any, y: Any = None) -> list[str]:
-        return [self._clean(t) for t in X]
+        descriptions = _column(X, "description")
+        if self._compiled:
+            return [self._clean_one_by_one(description) for description in descriptions]
+        sub = self._pattern.sub  # type: ignore[union-attr]
+        return [sub("", description) for description in descriptions]
 
-    def _clean(self, transaction: Any) -> str:
-        val = str(transaction.description)
+    def _clean_one_by_one(self, description: str) -> str:
         for pattern in self._compiled:
-            val = re.sub(pattern, "", val)
-        return val
+            description = pattern.sub("", description)
+        return description
 
 
 class DescriptionEncoder(BaseEstimator, TransformerMixin):
@@ -85,25 +169,48 @@ class DescriptionEncoder(BaseEstimator, TransformerMixin):
         return self._pipeline.transform(X)
 
 
+class DescriptionHasher(BaseEstimator, TransformerMixin):
+    """Hashed bag of words of preprocessed transaction descriptions. Stateless: needs no vocabulary to be fitted."""
+
+    def __init__(self) -> None:
+        self._preprocessor = DescriptionPreprocessor().fit(None)
+        self._hashing = HashingVectorizer(
+            decode_error="replace",
+            strip_accents="unicode",
+            stop_words=list(STOPWORDS),
+            alternate_sign=False,
+        )
+
+    def fit(self, X: Any, y: Any = None) -> "DescriptionHasher":
+        return self
+
+    def transform(self, X: Any, y: Any = None) -> Any:
+        return self._hashing.transform(self._preprocessor.transform(X))
+
+
 class DateTransformer(BaseEstimator, TransformerMixin):
-    """Extracts [year, month, day, weekday] from transaction.date."""
+    """Extracts [year, month, day, weekday] from transaction.date, -1 for all of them when missing."""
 
     def fit(self, X: Any, y: Any = None) -> "DateTransformer":
         return self
 
-    def transform(self, X: Any, y: Any = None) -> list[list[int]]:
-        return [self._date_features(t) for t in X]
-
-    @staticmethod
-    def _date_features(transaction: Any) -> list[int]:
-        d = transaction.date
-        if d is None:
-            return [-1, -1, -1, -1]
-        return [d.year, d.month, d.day, d.weekday()]
+    def transform(self, X: Any, y: Any = None) -> np.ndarray:
+        dates = _column(X, "date")
+        months = dates.astype("datetime64[M]")
+        features = np.column_stack(
+            [
+                dates.astype("datetime64[Y]").astype(np.int64) + 1970,
+                months.astype(np.int64) % 12 + 1,
+                (dates - months).astype(np.int64) + 1,
+                (dates.astype(np.int64) + 3) % 7,  # 1970-01-01 was a Thursday
+            ]
+        )
+        features[np.isnat(dates)] = -1
+        return features
 
 
 class AccountsOneHot(BaseEstimator, TransformerMixin):
-    """One-hot encodes id_source and id_dest."""
+    """One-hot encodes id_source and id_dest, as a sparse matrix."""
 
     def __init__(self) -> None:
         self._encoder = OneHotEncoder(handle_unknown="ignore")
@@ -113,33 +220,48 @@ class AccountsOneHot(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X: Any, y: Any = None) -> Any:
-        return self._encoder.transform(self._accounts(X)).toarray()
+        return self._encoder.transform(self._accounts(X))
 
     @staticmethod
     def _accounts(X: Any) -> np.ndarray:
-        return np.array(
-            [[t.id_source if t.id_source is not None else -1, t.id_dest if t.id_dest is not None else -1] for t in X]
-        )
+        return np.column_stack([_column(X, "id_source"), _column(X, "id_dest")])
+
+
+class AccountsHasher(BaseEstimator, TransformerMixin):
+    """Hashed id_source and id_dest. Stateless counterpart of AccountsOneHot."""
+
+    def __init__(self) -> None:
+        self._hasher = FeatureHasher(n_features=2**12, input_type="string", alternate_sign=False)
+
+    def fit(self, X: Any, y: Any = None) -> "AccountsHasher":
+        return self
+
+    def transform(self, X: Any, y: Any = None) -> Any:
+        pairs = zip(_column(X, "id_source").tolist(), _column(X, "id_dest").tolist())
+        return self._hasher.transform([f"source:{source}", f"dest:{dest}"] for source, dest in pairs)
 
 
 class HourMinuteTransformer(BaseEstimator, TransformerMixin):
-    """Extracts hour and minute from description text."""
+    """Extracts hour and minute from description text: the last hh:mm of its first line, or else its last 'hhHmm'."""
 
-    PATTERN_ISO = re.compile(r".*([0-9]{2}):([0-9]{2})(?::[0-9]{2})?.*")
-    PATTERN_HOUR = re.compile(r".*([0-2]?[0-9])h([0-5][0-9]).*")
+    # searched in the reversed first line, so that its first match is the last time of the line: hh:mm, else a 'hHmm'
+    # not following any hh:mm (the hour of a 'hHmm' is one digit, as the greedy ".*([0-2]?[0-9])h..." it replaces found)
+    PATTERN = re.compile(r"[0-9]{2}:[0-9]{2}|[0-9][0-5]h(?!.*[0-9]{2}:[0-9]{2})[0-9]")
 
     def fit(self, X: Any, y: Any = None) -> "HourMinuteTransformer":
         return self
 
-    def transform(self, X: Any, y: Any = None) -> list[list[int]]:
-        return [self._extract_time(t) for t in X]
-
-    def _extract_time(self, transaction: Any) -> list[int]:
-        for pattern in [self.PATTERN_ISO, self.PATTERN_HOUR]:
-            match = re.match(pattern, transaction.description)
-            if match is not None:
-                return [int(match.group(1)), int(match.group(2))]
-        return [-1, -1]
+    def transform(self, X: Any, y: Any = None) -> np.ndarray:
+        search = self.PATTERN.search
+        times = []
+        for description in _column(X, "description"):
+            match = search(description.partition("\n")[0][::-1])
+            if match is None:
+                times.append((-1, -1))
+                continue
+            found = match[0][::-1]
+            times.append((int(found[:2]), int(found[3:])) if found[2] == ":" else (int(found[0]), int(found[2:])))
+        return np.array(times, dtype=np.int64).reshape(-1, 2)
 
 
 class SingleFeatureTransformer(BaseEstimator, TransformerMixin):
@@ -148,8 +270,19 @@ class SingleFeatureTransformer(BaseEstimator, TransformerMixin):
     def fit(self, X: Any, y: Any = None) -> "SingleFeatureTransformer":
         return self
 
-    def transform(self, X: Any, y: Any = None) -> list[list[float]]:
-        return [[float(t.amount)] for t in X]
+    def transform(self, X: Any, y: Any = None) -> np.ndarray:
+        return _column(X, "amount").reshape(-1, 1)
+
+
+class LogAmountTransformer(BaseEstimator, TransformerMixin):
+    """Signed log of the amount, on a scale linear models can learn from."""
+
+    def fit(self, X: Any, y: Any = None) -> "LogAmountTransformer":
+        return self
+
+    def transform(self, X: Any, y: Any = None) -> np.ndarray:
+        amounts = _column(X, "amount")
+        return np.asarray(np.sign(amounts) * np.log1p(np.abs(amounts))).reshape(-1, 1)
 
 
 class CategoryEncoder:
@@ -195,6 +328,11 @@ class CategoryEncoder:
             descendants |= self._get_all_descendants(child.id)
         return descendants
 
+    @property
+    def classes_(self) -> np.ndarray:
+        """Category id of each encoded label."""
+        return self._label_encoder.classes_  # type: ignore[no-any-return]
+
     def transform(self, category_ids: Any) -> Any:
         mapped = [self._tag_inv_index[cid] for cid in category_ids]
         return self._label_encoder.transform(mapped)
@@ -205,7 +343,7 @@ class CategoryEncoder:
 
 def bank_csv_transformer() -> FeatureUnion:
     """Build the feature union for bank CSV transaction data."""
-    return FeatureUnion(
+    return TransactionFeatureUnion(
         [
             ("desc-tf-idf", DescriptionEncoder()),
             ("when-to-scalars", DateTransformer()),
@@ -214,3 +352,14 @@ def bank_csv_transformer() -> FeatureUnion:
             ("amount-extractor", SingleFeatureTransformer()),
         ]
     )
+
+
+def hashing_transformer() -> FeatureUnion:
+    """Build the stateless feature union of incrementally trained models: fitting it learns nothing from the data."""
+    return TransactionFeatureUnion(
+        [
+            ("desc-hashing", DescriptionHasher()),
+            ("accounts-hashing", AccountsHasher()),
+            ("amount-log", LogAmountTransformer()),
+        ]
+    )
@@ -0,0 +1,149 @@
+"""On-disk store of the features of labelled transactions, so that trainings only extract those of new or changed ones.
+
+Features are stored with the fitted transformer that extracted them, keyed by transaction id and a hash of the model
+inputs of the transaction. The transformer (TF-IDF vocabulary, account one-hot encoding) is reused until the labelled
+transactions have drifted past settings.ml_feature_drift from those it was fitted on; it is then fitted again and all
+features extracted again. Editing the feature extraction code invalidates the store.
+
+The store is an optimization only: an unreadable store is ignored, one that cannot be written is not updated.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+import sklearn
+from joblib import dump, load
+from scipy import sparse
+
+from app.config import settings
+from app.ml import feature_extractor
+from app.ml.feature_extractor import TransactionColumns
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredFeatures:
+    version: str  # see _version
+    transformer: Any
+    # transactions the transformer was fitted on
+    fitted_ids: np.ndarray
+    fitted_hashes: np.ndarray
+    # transactions of the feature rows
+    ids: np.ndarray
+    hashes: np.ndarray
+    features: sparse.csr_matrix
+
+
+@lru_cache
+def _version() -> str:
+    """Digest of the feature extraction code: features it extracted differently are not reused."""
+    with open(feature_extractor.__file__ or "", "rb") as f:
+        return f"{hashlib.sha256(f.read()).hexdigest()[:16]}-{sklearn.__version__}"
+
+
+def row_hashes(columns: TransactionColumns) -> np.ndarray:
+    """Hash of the model inputs of each transaction: its description, date, amount and accounts."""
+    rows = zip(
+        columns.description.tolist(),
+        columns.date.astype(str).tolist(),
+        columns.amount.tolist(),
+        columns.id_source.tolist(),
+        columns.id_dest.tolist(),
+    )
+    blake2b = hashlib.blake2b
+    return np.array(
+        [
+            int.from_bytes(blake2b(f"{d}\x1f{t}\x1f{a!r}\x1f{s}\x1f{e}".encode(), digest_size=8).digest(), "little")
+            for d, t, a, s, e in rows
+        ],
+        dtype=np.uint64,
+    )
+
+
+def _find(ids: np.ndarray, hashes: np.ndarray, stored_ids: np.ndarray, stored_hashes: np.ndarray) -> np.ndarray:
+    """Index in the stored rows of each (id, hash), -1 when not stored (new or changed transaction)."""
+    if not len(stored_ids):
+        return np.full(len(ids), -1)
+    order = np.argsort(stored_ids)
+    positions = np.minimum(np.searchsorted(stored_ids, ids, sorter=order), len(order) - 1)
+    indices = order[positions]
+    found = (stored_ids[indices] == ids) & (stored_hashes[indices] == hashes)
+    return np.where(found, indices, -1)
+
+
+def drift(ids: np.ndarray, hashes: np.ndarray, stored_ids: np.ndarray, stored_hashes: np.ndarray) -> float:
+    """Share of transactions added, changed or removed between the stored ones and the given ones."""
+    n_same = int((_find(ids, hashes, stored_ids, stored_hashes) >= 0).sum())
+    n_all = len(ids) + len(stored_ids) - n_same
+    return 1 - n_same / n_all if n_all else 0.0
+
+
+def _path(name: str) -> str:
+    return os.path.join(settings.model_path, "features", f"{name}.joblib")
+
+
+def load_features(name: str) -> StoredFeatures | None:
+    try:
+        stored = load(_path(name))
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Ignoring unreadable feature store '%s'", name, exc_info=True)
+        return None
+    return stored if isinstance(stored, StoredFeatures) and stored.version == _version() else None
+
+
+def store_features(name: str, stored: StoredFeatures) -> None:
+    path = _path(name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so an interrupted training never leaves a partial store
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            dump(stored, f, compress=1)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Could not write feature store %s", path, exc_info=True)
+
+
+def fit_transform(
+    name: str, make_transformer: Callable[[], Any], ids: np.ndarray, columns: TransactionColumns
+) -> tuple[Any, sparse.csr_matrix, dict[str, Any]]:
+    """Like `make_transformer().fit_transform(columns)`, reusing the transformer and features stored under `name`.
+
+    `ids` are the transaction ids of the rows of `columns`. Returns the fitted transformer, the features and details
+    on what was reused. The store is updated with the features of the given transactions only.
+    """
+    hashes = row_hashes(columns)
+    stored = load_features(name)
+    corpus_drift = 1.0 if stored is None else drift(ids, hashes, stored.fitted_ids, stored.fitted_hashes)
+
+    if stored is None or corpus_drift > settings.ml_feature_drift:
+        transformer = make_transformer()
+        features = sparse.csr_matrix(transformer.fit_transform(columns))
+        stored = StoredFeatures(_version(), transformer, ids, hashes, ids, hashes, features)
+        details = {"refitted": True, "n_extracted": len(ids)}
+    else:
+        indices = _find(ids, hashes, stored.ids, stored.hashes)
+        new = indices < 0
+        parts = [stored.features[indices[~new]]]
+        if new.any():
+            parts.append(sparse.csr_matrix(stored.transformer.transform(columns.take(new))))
+        rows = sparse.vstack(parts)
+        # rows are stacked stored first: put them back in the order of the transactions
+        order = np.concatenate([np.flatnonzero(~new), np.flatnonzero(new)])
+        features = sparse.csr_matrix(rows)[np.argsort(order, kind="stable")]
+        transformer = stored.transformer
+        stored = StoredFeatures(_version(), transformer, stored.fitted_ids, stored.fitted_hashes, ids, hashes, features)
+        details = {"refitted": False, "n_extracted": int(new.sum())}
+
+    store_features(name, stored)
+    return transformer, features, {**details, "drift": round(corpus_drift, 4)}
@@ -1,19 +1,29 @@
-"""ML prediction with subprocess isolation for memory safety."""
+"""ML prediction with subprocess isolation for memory safety.
+
+Inference runs in a long-lived worker process that keeps the current valid model loaded, so predictions do not pay
+for importing sklearn and loading the pipeline each time. Model artifacts carry the category id of each label, so
+predictions are decoded without the database. The worker receives batches over a pipe, reloads the model when a
+newer valid one appears, and is replaced after serving `inference_max_requests` batches or when its resident memory
+grows past `inference_memory_limit_mb`.
+"""
 
 import logging
 import multiprocessing
 import os
-from typing import Any
-
-import numpy as np
-from joblib import load
+import threading
+from collections.abc import Sequence
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, cast
 
 from app.config import settings
-from app.ml.feature_extractor import CategoryEncoder
 from app.models.ml_model import MLModel
 
 logger = logging.getLogger(__name__)
 
+_worker: "_InferenceWorker | None" = None
+_lock = threading.Lock()
+
 
 class NoValidModelError(Exception):
     pass
@@ -23,79 +33,178 @@ class InferenceError(Exception):
     pass
 
 
-def _run_inference(
-    model_filepath: str,
-    class_level: str,
-    db_url: str,
-    transactions_data: list[dict[str, Any]],
-    result_queue: "multiprocessing.Queue[Any]",
-) -> None:
-    """Run inference in a subprocess to avoid memory leaks."""
+def _rss_mb() -> float:
+    """Resident memory of the current process, in MiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource  # peak rather than current memory, outside Linux
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _legacy_artifact(pipeline: Any, class_level: str, db_url: str) -> Any:
+    """Artifact of a model saved as a bare pipeline, its labels decoded against the current category tree."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.ml.artifact import ModelArtifact
+    from app.ml.feature_extractor import CategoryEncoder
+
+    engine = create_engine(db_url)
     try:
-        import datetime
-        from decimal import Decimal
-        from types import SimpleNamespace
-
-        # Reconstruct lightweight transaction objects for the pipeline
-        tx_objects = []
-        for td in transactions_data:
-            tx = SimpleNamespace(
-                id=td["id"],
-                description=td["description"],
-                date=datetime.date.fromisoformat(td["date"]),
-                amount=Decimal(td["amount"]),
-                id_source=td["id_source"],
-                id_dest=td["id_dest"],
-            )
-            tx_objects.append(tx)
-
-        pipeline = load(model_filepath)
-        y_proba = pipeline.predict_proba(tx_objects)
-        y_pred = pipeline.steps[1][1].classes_[np.argmax(y_proba, axis=1)]
-
-        # Decode category IDs using a fresh DB session
-        from sqlalchemy import create_engine
-        from sqlalchemy.orm import sessionmaker
-
-        from app.database import Base
-
-        sub_engine = create_engine(db_url, pool_pre_ping=True)
-        SubSession = sessionmaker(bind=sub_engine, autoflush=False, expire_on_commit=False)
-        sub_db = SubSession()
+        with Session(engine) as db:
+            encoder = CategoryEncoder(db, level=class_level)
+    finally:
+        engine.dispose()
+    return ModelArtifact(
+        pipeline=pipeline, category_ids=encoder.classes_, category_fingerprint="", class_level=class_level
+    )
+
+
+def _load(model_filepath: str, class_level: str, db_url: str) -> Any:
+    from app.ml.artifact import ModelArtifact, load_artifact
+
+    artifact = load_artifact(model_filepath)
+    if not isinstance(artifact, ModelArtifact):
+        artifact = _legacy_artifact(artifact, class_level, db_url)
+    return artifact
+
+
+def _predict(artifact: Any, top_k: int, transactions_data: list[dict[str, Any]]) -> list[list[tuple[int, float]]]:
+    import numpy as np
+
+    from app.ml.feature_extractor import TransactionColumns
+
+    columns = TransactionColumns.from_lists(
+        **{
+            name: [td[name] for td in transactions_data]
+            for name in ("description", "date", "amount", "id_source", "id_dest")
+        }
+    )
+    y_proba = artifact.pipeline.predict_proba(columns)
+    # the top_k most likely classes of each transaction, most likely first
+    order = np.argsort(-y_proba, axis=1, kind="stable")[:, :top_k]
+    category_ids = artifact.decode(artifact.pipeline.steps[1][1].classes_[order])
+    probas = np.take_along_axis(y_proba, order, axis=1).tolist()
+    return [list(zip(ids, p)) for ids, p in zip(category_ids, probas)]
+
+
+def _serve(conn: Connection, db_url: str) -> None:
+    """Inference worker loop: answer (model id, model file, class level, top k, transactions) requests until told to
+    stop.
+
+    Replies are (error message or None, result, resident memory in MiB). The database is only used to load models
+    saved before artifacts bundled their category ids.
+    """
+    model_id, artifact = None, None
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        id_model, model_filepath, class_level, top_k, transactions_data = request
+        try:
+            if id_model != model_id:
+                # drop the previous model first, not to hold two at once
+                model_id, artifact = None, None
+                artifact = _load(model_filepath, class_level, db_url)
+                model_id = id_model
+            conn.send((None, _predict(artifact, top_k, transactions_data), _rss_mb()))
+        except Exception as e:
+            conn.send((f"{type(e).__name__}: {e}", None, _rss_mb()))
+
+
+class _InferenceWorker:
+    def __init__(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process: BaseProcess = context.Process(
+            target=_serve, args=(child_conn, str(settings.database_url)), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.requests = 0
+        self.rss_mb = 0.0
+        # timed out or crashed: a late reply would be taken for the answer to the next request
+        self.broken = False
+
+    def predict(self, request: tuple[int, str, str, int, list[dict[str, Any]]]) -> Any:
+        try:
+            self._conn.send(request)
+            if not self._conn.poll(settings.inference_timeout):
+                self.broken = True
+                raise InferenceError("Inference process did not produce results")
+            error, result, self.rss_mb = self._conn.recv()
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise InferenceError("Inference process crashed") from e
+        self.requests += 1
+        if error is not None:
+            raise InferenceError(f"Inference process failed: {error}")
+        return result
+
+    def worn_out(self) -> bool:
+        return (
+            self.broken
+            or self.requests >= settings.inference_max_requests
+            or (settings.inference_memory_limit_mb > 0 and self.rss_mb > settings.inference_memory_limit_mb)
+        )
+
+    def close(self) -> None:
         try:
-            encoder = CategoryEncoder(sub_db, level=class_level)
-            category_ids = encoder.inverse_transform(y_pred)
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self._conn.close()
+
+
+def _run_inference(request: tuple[int, str, str, int, list[dict[str, Any]]]) -> Any:
+    """Run a request in the inference worker, starting it if needed and replacing it once worn out."""
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = _InferenceWorker()
+        try:
+            return _worker.predict(request)
         finally:
-            sub_db.close()
-            sub_engine.dispose()
+            if _worker.worn_out():
+                logger.info("Recycling inference worker (%d requests, %.0f MiB)", _worker.requests, _worker.rss_mb)
+                _worker.close()
+                _worker = None
 
-        probas = np.max(y_proba, axis=1).tolist()
-        result_queue.put((category_ids.tolist(), probas))
-    except Exception as e:
-        result_queue.put(e)
 
+def shutdown_inference_worker() -> None:
+    global _worker
+    with _lock:
+        if _worker is not None:
+            _worker.close()
+            _worker = None
 
-def predict_categories(
-    db: "Any",
-    transactions: list[Any],
-) -> list[tuple[int | None, float]]:
-    """Predict categories for a list of transactions.
 
-    Returns list of (category_id, probability) tuples.
-    Raises NoValidModelError if no valid model exists.
-    """
+def valid_model(db: "Any") -> MLModel | None:
+    """The model predictions are made with: the latest valid one."""
+    model: MLModel | None = db.query(MLModel).filter(MLModel.state == "valid").order_by(MLModel.id.desc()).first()
+    return model
+
+
+def predict_top_k(model: MLModel, transactions: Sequence[Any], top_k: int) -> list[list[tuple[int, float]]]:
+    """The `top_k` most likely (category_id, probability) of each transaction according to `model`."""
     if not transactions:
         return []
 
-    valid_model = db.query(MLModel).filter(MLModel.state == "valid").order_by(MLModel.id.desc()).first()
-    if valid_model is None:
-        raise NoValidModelError("No valid model available for prediction")
-
-    model_filepath = os.path.join(settings.model_path, valid_model.filename)
-    metadata = valid_model.metadata_ or {}
-    class_level = metadata.get("class_level", "fine")
+    model_filepath = os.path.join(settings.model_path, model.filename)
+    metadata = model.metadata_ or {}
+    class_level = cast(str, metadata.get("class_level", "fine"))
 
-    # Serialize transactions for subprocess
+    # Serialize transactions for the worker process
     transactions_data = [
         {
             "id": t.id,
@@ -108,29 +217,28 @@ def predict_categories(
         for t in transactions
     ]
 
-    result_queue: multiprocessing.Queue[Any] = multiprocessing.Queue()
-    process = multiprocessing.Process(
-        target=_run_inference,
-        args=(model_filepath, class_level, str(settings.database_url), transactions_data, result_queue),
+    rankings: list[list[tuple[int, float]]] = _run_inference(
+        (model.id, model_filepath, class_level, top_k, transactions_data)
     )
-    try:
-        process.start()
-        process.join(timeout=300)
-    finally:
-        if process.is_alive():
-            process.terminate()
+    return rankings
 
-    if result_queue.empty():
-        raise InferenceError("Inference process did not produce results")
 
-    result = result_queue.get()
-    result_queue.close()
+def predict_categories(
+    db: "Any",
+    transactions: list[Any],
+) -> list[tuple[int | None, float]]:
+    """Predict categories for a list of transactions.
 
-    if isinstance(result, Exception):
-        raise InferenceError("Inference process failed") from result
+    Returns list of (category_id, probability) tuples.
+    Raises NoValidModelError if no valid model exists.
+    """
+    if not transactions:
+        return []
 
-    category_ids, probas = result
-    return list(zip(category_ids, probas))
+    model = valid_model(db)
+    if model is None:
+        raise NoValidModelError("No valid model available for prediction")
+    return [ranking[0] for ranking in predict_top_k(model, transactions, 1)]
 
 
 def predict_category(
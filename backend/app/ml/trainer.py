@@ -1,27 +1,54 @@
 """ML model training for transaction categorization."""
 
+import datetime
 import hashlib
 import logging
 import math
 import os
+import tempfile
+import time
+from collections.abc import Callable, Iterable
+from typing import Any, cast
 
 import numpy as np
-from joblib import dump
+from joblib import dump, effective_n_jobs, load
+from scipy.stats import randint
+from sklearn.base import clone
 from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import accuracy_score, make_scorer
-from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.model_selection import (
+    GridSearchCV,
+    HalvingGridSearchCV,
+    HalvingRandomSearchCV,
+    KFold,
+    cross_val_score,
+)
 from sklearn.pipeline import Pipeline
-from sqlalchemy import update
-from sqlalchemy.orm import Session
+from sqlalchemy import ColumnElement, Select, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
 
 from app.config import settings
-from app.ml.feature_extractor import CategoryEncoder, bank_csv_transformer
+from app.ml import feature_store
+from app.ml.artifact import ModelArtifact, load_artifact, save_artifact
+from app.ml.feature_extractor import CategoryEncoder, TransactionColumns, bank_csv_transformer, hashing_transformer
 from app.models.category import Category
+from app.models.category_split import CategorySplit
+from app.models.label_event import LabelEvent
 from app.models.ml_model import MLModel
 from app.models.transaction import Transaction
+from app.services.prediction_service import fill_predictions
 
 logger = logging.getLogger(__name__)
 
+# passes over the labelled transactions when an incremental model is trained from scratch
+INCREMENTAL_EPOCHS = 5
+# labelled transactions fetched per round trip when loading training data
+TRAINING_BATCH_SIZE = 10_000
+# columns of _labelled_query between the transaction id and the label
+_INPUTS = ("description", "date", "amount", "id_source", "id_dest")
+
 
 class ModelBeingTrainedError(Exception):
     pass
@@ -31,6 +58,67 @@ class NotEnoughDataError(Exception):
     pass
 
 
+def journal_head(db: Session) -> int:
+    """Id of the last label event, 0 if the journal is empty."""
+    return db.scalar(select(func.max(LabelEvent.id))) or 0
+
+
+def _labelled_query() -> Select[Any]:
+    """Model inputs and label of labelled transactions: the category of their first split, or of their group's.
+
+    Only the needed columns are selected, and splits are joined through the first split of each transaction and group
+    (category_split has no index to look them up one transaction at a time).
+    """
+    first_splits = select(func.min(CategorySplit.id)).group_by(CategorySplit.id_transaction, CategorySplit.id_group)
+    labels = (
+        select(CategorySplit.id_transaction, CategorySplit.id_group, CategorySplit.id_category)
+        .where(CategorySplit.id.in_(first_splits))
+        .subquery()
+    )
+    own, group = aliased(labels), aliased(labels)
+    label = func.coalesce(own.c.id_category, group.c.id_category)
+    return (
+        select(
+            Transaction.id,
+            Transaction.description,
+            Transaction.date,
+            Transaction.amount,
+            Transaction.id_source,
+            Transaction.id_dest,
+            label.label("id_category"),
+        )
+        .outerjoin(own, own.c.id_transaction == Transaction.id)
+        .outerjoin(group, group.c.id_group == Transaction.id_transaction_group)
+        .where(label.is_not(None))
+    )
+
+
+def load_training_data(
+    db: Session, where: ColumnElement[bool] | None = None, batch_size: int = TRAINING_BATCH_SIZE
+) -> tuple[np.ndarray, TransactionColumns, np.ndarray]:
+    """Transaction ids, model inputs and category ids of the labelled transactions (matching `where`, if given).
+
+    Rows are streamed in batches, each converted into column arrays right away.
+    """
+    q = _labelled_query()
+    if where is not None:
+        q = q.where(where)
+    ids: list[int] = []
+    parts: list[TransactionColumns] = []
+    category_ids: list[int] = []
+    for rows in db.execute(q.execution_options(yield_per=batch_size)).partitions():
+        id_transactions, *inputs, labels = zip(*rows)
+        ids.extend(id_transactions)
+        parts.append(TransactionColumns.from_lists(**dict(zip(_INPUTS, inputs))))
+        category_ids.extend(labels)
+    return np.array(ids, dtype=np.int64), TransactionColumns.concatenate(parts), np.array(category_ids, dtype=np.int64)
+
+
+def count_labelled(db: Session) -> int:
+    """Number of labelled transactions, the ones load_training_data loads."""
+    return db.scalar(select(func.count()).select_from(_labelled_query().subquery())) or 0
+
+
 def category_fingerprint(db: Session) -> str:
     """Hash of all category IDs + parent relationships. Changes when tree is modified."""
     categories = db.query(Category).order_by(Category.id).all()
@@ -43,11 +131,185 @@ def _get_min_samples_leaf(n_samples: int) -> list[int]:
     return [min_leaf, 2 * min_leaf, 5 * min_leaf, 10 * min_leaf]
 
 
+class _BudgetedSearch:
+    """Mixin for scikit-learn searches, which stops evaluating candidates once `deadline` has passed.
+
+    Candidates are then evaluated a few at a time (one per job). Those left when the budget runs out are skipped, and
+    the best of the evaluated ones is kept. Halving searches keep the best candidates of their last evaluated round.
+    """
+
+    deadline: float | None = None  # time.monotonic() value
+    n_jobs: int | None  # of the search class
+    budget_exhausted_ = False
+
+    def _run_search(self, evaluate_candidates: Callable[..., dict[str, Any]]) -> Any:
+        deadline = self.deadline
+        if deadline is None:
+            return super()._run_search(evaluate_candidates)  # type: ignore[misc]
+        results: dict[str, Any] = {}
+
+        def evaluate(
+            candidate_params: Iterable[dict[str, Any]],
+            cv: Any = None,
+            more_results: dict[str, list[Any]] | None = None,
+        ) -> dict[str, Any]:
+            nonlocal results
+            candidate_params = list(candidate_params)
+            chunk = effective_n_jobs(self.n_jobs)
+            for start in range(0, len(candidate_params), chunk):
+                if results and time.monotonic() > deadline:
+                    self.budget_exhausted_ = True
+                    break
+                more = {key: values[start : start + chunk] for key, values in (more_results or {}).items()}
+                results = evaluate_candidates(candidate_params[start : start + chunk], cv, more or None)
+            return results
+
+        return super()._run_search(evaluate)  # type: ignore[misc]
+
+
+class _GridSearch(_BudgetedSearch, GridSearchCV):
+    pass
+
+
+class _HalvingGridSearch(_BudgetedSearch, HalvingGridSearchCV):
+    pass
+
+
+class _HalvingRandomSearch(_BudgetedSearch, HalvingRandomSearchCV):
+    pass
+
+
+def _search(
+    n_samples: int, n_features: int, n_classes: int, n_estimators: int, random_state: int
+) -> GridSearchCV | HalvingGridSearchCV | HalvingRandomSearchCV:
+    """The hyperparameter search configured by settings.ml_search, settings.ml_n_jobs and settings.ml_search_budget.
+
+    Candidate forests are fitted one per job, each on a single core; halving searches fit them on growing subsamples
+    of the transactions, only keeping the best third of the candidates of a round for the next one.
+    """
+    estimator = ExtraTreesClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=1)
+    kfold = KFold(n_splits=5, shuffle=True, random_state=random_state)
+    common = dict(scoring=make_scorer(accuracy_score), refit=False, cv=kfold, n_jobs=settings.ml_n_jobs)
+    min_leaf = _get_min_samples_leaf(n_samples)
+    max_features = [int(np.sqrt(n_features)), n_features // 2, n_features]
+    if settings.ml_search == "grid":
+        param_grid = {"min_samples_leaf": min_leaf, "max_features": max_features}
+        search = _GridSearch(estimator, param_grid, **common)
+    else:
+        # the smallest subsample must hold a few transactions per category and fold, or the search is a grid search
+        enough = n_samples >= 2 * kfold.n_splits * n_classes
+        halving = dict(factor=3, random_state=random_state, **common)
+        if settings.ml_search == "halving_grid":
+            param_grid = {"min_samples_leaf": min_leaf, "max_features": max_features}
+            # the last round uses all transactions
+            halving["min_resources"] = "exhaust" if enough else n_samples
+            search = _HalvingGridSearch(estimator, param_grid, **halving)
+        else:
+            # as many candidates as the subsamples allow, starting from the smallest one
+            halving["min_resources"] = "smallest" if enough else n_samples
+            distributions = {
+                "min_samples_leaf": randint(min_leaf[0], min_leaf[-1] + 1),
+                "max_features": randint(max(1, max_features[0]), n_features + 1),
+            }
+            search = _HalvingRandomSearch(estimator, distributions, **halving)
+    if settings.ml_search_budget > 0:
+        search.deadline = time.monotonic() + settings.ml_search_budget
+    return search
+
+
+def _shared(features: Any, folder: str) -> Any:
+    """`features` memory-mapped from `folder`, so that parallel jobs share them instead of receiving copies."""
+    filepath = os.path.join(folder, "features.joblib")
+    dump(features, filepath)
+    return load(filepath, mmap_mode="r")
+
+
+def _json_params(params: dict[str, Any]) -> dict[str, Any]:
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+
+
+def _fit_forest(
+    ids: np.ndarray,
+    columns: TransactionColumns,
+    y: np.ndarray,
+    n_estimators: int,
+    random_state: int,
+    timings: dict[str, float],
+) -> tuple[Pipeline, dict[str, Any]]:
+    """An extra-trees pipeline, tuned by the configured hyperparameter search (see _search)."""
+    started = time.perf_counter()
+    transformer, features, store_details = feature_store.fit_transform("bank_csv", bank_csv_transformer, ids, columns)
+    timings["features"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    search = _search(len(columns), features.shape[1], len(np.unique(y)), n_estimators, random_state)
+    with tempfile.TemporaryDirectory(prefix="banking-train-") as folder:
+        if effective_n_jobs(settings.ml_n_jobs) > 1:
+            features = _shared(features, folder)
+        search.fit(features, y)
+        timings["search"] = time.perf_counter() - started
+        if search.budget_exhausted_:
+            logger.warning("Search budget exhausted, candidates were skipped")
+
+        # the chosen forest is fitted on all cores, and predicts on one in the inference worker
+        started = time.perf_counter()
+        forest = clone(search.estimator).set_params(**search.best_params_, n_jobs=settings.ml_n_jobs)
+        forest.fit(features, y)
+        forest.set_params(n_jobs=1)
+        timings["refit"] = time.perf_counter() - started
+
+    details = {
+        "params": _json_params(search.best_params_),
+        "cv_score": float(search.best_score_),
+        "search": settings.ml_search,
+        "n_candidates": len(search.cv_results_["params"]),
+        "budget_exhausted": search.budget_exhausted_,
+        "features": store_details,
+    }
+    return Pipeline([("features", transformer), ("model", forest)]), details
+
+
+def _fit_incremental(
+    ids: np.ndarray,
+    columns: TransactionColumns,
+    y: np.ndarray,
+    n_classes: int,
+    random_state: int,
+    timings: dict[str, float],
+) -> tuple[Pipeline, dict[str, Any]]:
+    """A linear pipeline on stateless features, which update_model can train further with new labels.
+
+    The classifier knows every category of the tree from the start, so labels of categories unused so far can be
+    learnt by updates.
+    """
+    started = time.perf_counter()
+    transformer, features, store_details = feature_store.fit_transform("hashing", hashing_transformer, ids, columns)
+    timings["features"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    kfold = KFold(n_splits=5, shuffle=True, random_state=random_state)
+    classifier = SGDClassifier(loss="log_loss", random_state=random_state)
+    cv_score = cross_val_score(classifier, features, y, scoring=make_scorer(accuracy_score), cv=kfold).mean()
+    timings["search"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(random_state)
+    classes = np.arange(n_classes)
+    for _ in range(INCREMENTAL_EPOCHS):
+        order = rng.permutation(len(columns))
+        classifier.partial_fit(features[order], y[order], classes=classes)
+    timings["refit"] = time.perf_counter() - started
+
+    details = {"incremental": True, "cv_score": float(cv_score), "n_updates": 0, "features": store_details}
+    return Pipeline([("features", transformer), ("model", classifier)]), details
+
+
 def train_model(
     db: Session,
     min_samples: int = 50,
     random_state: int = 42,
     class_level: str = "fine",
+    n_estimators: int = 500,
 ) -> MLModel:
     """Train a new ML model for transaction categorization.
 
@@ -59,9 +321,10 @@ def train_model(
     if training is not None:
         raise ModelBeingTrainedError("A model is already being trained")
 
-    # Fetch labeled transactions (those with at least one category split)
-    transactions = db.query(Transaction).filter(Transaction.category_splits.any()).all()
-    n_samples_actual = len(transactions)
+    # labels journaled after this event are not learnt by the model
+    last_event = journal_head(db)
+    ids, columns, category_ids = load_training_data(db)
+    n_samples_actual = len(columns)
 
     if n_samples_actual < min_samples:
         raise NotEnoughDataError(f"Need at least {min_samples} labeled transactions, got {n_samples_actual}")
@@ -74,34 +337,14 @@ def train_model(
     db.refresh(model_record)
 
     try:
-        transformer = bank_csv_transformer()
-        transformer.fit(transactions)
-        features = transformer.transform(transactions)
-
-        category_ids = np.array([t.category_splits[0].id_category for t in transactions])
         encoder = CategoryEncoder(db, level=class_level)
         y = encoder.transform(category_ids)
-
-        n_features = features.shape[1]
-        estimator = ExtraTreesClassifier(n_estimators=500, random_state=random_state, n_jobs=1)
-        param_grid = {
-            "min_samples_leaf": _get_min_samples_leaf(n_samples_actual),
-            "max_features": [int(np.sqrt(n_features)), n_features // 2, n_features],
-        }
-        kfold = KFold(n_splits=5, shuffle=True, random_state=random_state)
-        gsearch = GridSearchCV(
-            estimator, param_grid, scoring=make_scorer(accuracy_score), refit=True, cv=kfold, n_jobs=1
-        )
-        gsearch.fit(features, y)
-
-        logger.info(
-            "Finished tuning model '%s' (cv_score=%s, best_params=%s)",
-            model_record.filename,
-            gsearch.best_score_,
-            gsearch.best_params_,
-        )
-
-        pipeline = Pipeline([("features", transformer), ("model", gsearch.best_estimator_)])
+        timings: dict[str, float] = {}
+        if settings.ml_incremental:
+            pipeline, details = _fit_incremental(ids, columns, y, len(encoder.classes_), random_state, timings)
+        else:
+            pipeline, details = _fit_forest(ids, columns, y, n_estimators, random_state, timings)
+        logger.info("Finished training model '%s' (%s)", model_record.filename, details)
 
         model_dir = settings.model_path
         os.makedirs(model_dir, exist_ok=True)
@@ -109,13 +352,22 @@ def train_model(
 
         db.refresh(model_record)
         if model_record.state == "training":
-            dump(pipeline, model_filepath)
+            fingerprint = category_fingerprint(db)
+            artifact = ModelArtifact(
+                pipeline=pipeline,
+                category_ids=encoder.classes_,
+                category_fingerprint=fingerprint,
+                class_level=class_level,
+            )
+            save_artifact(artifact, model_filepath)
             model_record.state = "valid"
             model_record.metadata_ = {
-                "params": gsearch.best_params_,
-                "cv_score": gsearch.best_score_,
+                **details,
                 "n_samples": n_samples_actual,
-                "category_fingerprint": category_fingerprint(db),
+                "timings": {step: round(seconds, 3) for step, seconds in timings.items()},
+                "category_fingerprint": fingerprint,
+                "last_event": last_event,
+                "trained_at": datetime.datetime.now(datetime.UTC).isoformat(),
                 **(model_record.metadata_ or {}),
             }
             db.commit()
@@ -126,12 +378,92 @@ def train_model(
         db.commit()
         raise
 
+    if model_record.state == "valid":
+        # predictions of the previous model are stale: store those of the new one for all uncategorised transactions
+        try:
+            fill_predictions(db)
+        except Exception:
+            logger.exception("Could not store the predictions of model '%s'", model_record.filename)
+            db.rollback()
+
+    return model_record
+
+
+def update_model(db: Session) -> MLModel | None:
+    """Train the current incremental model further with the labels journaled since it was trained.
+
+    The updated model is saved as a new valid model, trained on the same transactions plus the new labels; cost
+    only depends on the number of new labels. Returns None if a full training is needed instead: no incremental
+    model, category tree changed, or last full training older than settings.ml_full_retrain_days. Removed labels
+    are not unlearnt until the next full training.
+    """
+    if db.query(MLModel).filter(MLModel.state == "training").first() is not None:
+        raise ModelBeingTrainedError("A model is already being trained")
+    current = db.query(MLModel).filter(MLModel.state == "valid").order_by(MLModel.id.desc()).first()
+    if current is None:
+        return None
+    metadata = current.metadata_ or {}
+    if not metadata.get("incremental") or "last_event" not in metadata:
+        return None
+    trained_at = datetime.datetime.fromisoformat(cast(str, metadata["trained_at"]))
+    if datetime.datetime.now(datetime.UTC) - trained_at > datetime.timedelta(days=settings.ml_full_retrain_days):
+        return None
+    if metadata.get("category_fingerprint") != category_fingerprint(db):
+        return None
+
+    last_event = journal_head(db)
+    events = db.execute(
+        select(LabelEvent.kind, LabelEvent.id_transaction, LabelEvent.id_group).where(
+            LabelEvent.id > cast(int, metadata["last_event"]), LabelEvent.id <= last_event
+        )
+    ).all()
+    if any(kind == "tree" for kind, _, _ in events):
+        return None
+    labelled = {id_transaction for kind, id_transaction, _ in events if kind == "label" and id_transaction is not None}
+    groups = {id_group for kind, _, id_group in events if kind == "label" and id_group is not None}
+    _, columns, category_ids = load_training_data(
+        db, where=or_(Transaction.id.in_(labelled), Transaction.id_transaction_group.in_(groups))
+    )
+
+    artifact = load_artifact(os.path.join(settings.model_path, current.filename))
+    details: dict[str, Any] = {"n_updates": cast(int, metadata.get("n_updates", 0)) + 1, "n_updated": len(columns)}
+    if len(columns):
+        features = artifact.pipeline.named_steps["features"].transform(columns)
+        encoder = CategoryEncoder(db, level=artifact.class_level)
+        y = encoder.transform(category_ids)
+        classifier = artifact.pipeline.named_steps["model"]
+        # accuracy on the new labels, before learning them
+        details["update_score"] = float(accuracy_score(y, classifier.predict(features)))
+        classifier.partial_fit(features, y)
+
+    model_record = MLModel(
+        filename=MLModel.generate_filename(),
+        state="valid",
+        metadata_={
+            **metadata,
+            **details,
+            "n_samples": count_labelled(db),
+            "last_event": last_event,
+        },
+    )
+    os.makedirs(settings.model_path, exist_ok=True)
+    save_artifact(artifact, os.path.join(settings.model_path, model_record.filename))
+    db.add(model_record)
+    current.state = "invalid"  # superseded: its file is removed with the other invalid models
+    db.commit()
+    logger.info("Updated model '%s' into '%s' (%s)", current.filename, model_record.filename, details)
+
+    try:
+        fill_predictions(db)
+    except Exception:
+        logger.exception("Could not store the predictions of model '%s'", model_record.filename)
+        db.rollback()
     return model_record
 
 
 def should_train(db: Session, min_samples: int = 50) -> bool:
     """Check if training is warranted: enough data and something changed since last valid model."""
-    n_labeled = db.query(Transaction).filter(Transaction.category_splits.any()).count()
+    n_labeled = count_labelled(db)
     if n_labeled < min_samples:
         return False
 
@@ -151,6 +483,9 @@ def should_train(db: Session, min_samples: int = 50) -> bool:
         return True
     if category_fingerprint(db) != old_fingerprint:
         return True
+    # labels changed without changing their count
+    if "last_event" in metadata and journal_head(db) > cast(int, metadata["last_event"]):
+        return True
 
     return False
 
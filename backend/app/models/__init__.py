@@ -8,7 +8,9 @@ from app.models.category_split import CategorySplit
 from app.models.wallet import Wallet, WalletAccount
 from app.models.tag_rule import TagRule
 from app.models.ml_model import MLModel
-from app.models.import_record import ImportRecord
+from app.models.import_record import ImportFile, ImportRecord
+from app.models.transaction_prediction import TransactionPrediction
+from app.models.label_event import LabelEvent
 
 __all__ = [
     "User",
@@ -24,4 +26,7 @@ __all__ = [
     "TagRule",
     "MLModel",
     "ImportRecord",
+    "ImportFile",
+    "TransactionPrediction",
+    "LabelEvent",
 ]
@@ -16,6 +16,8 @@ class Account(Base):
     id_currency: Mapped[int] = mapped_column(ForeignKey("currency.id"))
     institution: Mapped[str | None] = mapped_column(String(50))
     is_active: Mapped[bool] = mapped_column(default=True)
+    # import that created the account, if any
+    id_import: Mapped[int | None] = mapped_column(ForeignKey("import_record.id"), nullable=True)
 
     currency: Mapped["Currency"] = relationship(lazy="joined")
     aliases: Mapped[list["AccountAlias"]] = relationship(back_populates="account", lazy="joined")
@@ -1,7 +1,7 @@
 import datetime
 
-from sqlalchemy import Date, DateTime, JSON, String, func
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Date, DateTime, ForeignKey, JSON, String, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
 
@@ -23,3 +23,23 @@ class ImportRecord(Base):
     auto_tagged: Mapped[int] = mapped_column(default=0)
     date_earliest: Mapped[datetime.date | None] = mapped_column(Date, nullable=True)
     date_latest: Mapped[datetime.date | None] = mapped_column(Date, nullable=True)
+    timings: Mapped[dict[str, float] | None] = mapped_column(JSON, nullable=True)
+    # parsed rows committed so far while the import runs, None once it has completed
+    checkpoint: Mapped[int | None] = mapped_column(nullable=True)
+
+    files: Mapped[list["ImportFile"]] = relationship(back_populates="import_record", lazy="selectin")
+
+
+class ImportFile(Base):
+    """A file parsed by an import, identified by its content so that re-uploads can be skipped."""
+
+    __tablename__ = "import_file"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    id_import: Mapped[int] = mapped_column(ForeignKey("import_record.id", ondelete="CASCADE"))
+    filename: Mapped[str] = mapped_column(String(255))
+    content_hash: Mapped[str] = mapped_column(String(64), index=True)  # sha256 hex digest
+    # format the file was parsed as, None for files imported before it was recorded
+    format: Mapped[str | None] = mapped_column(String(50), nullable=True)
+
+    import_record: Mapped["ImportRecord"] = relationship(back_populates="files")
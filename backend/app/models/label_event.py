@@ -0,0 +1,68 @@
+"""Journal of the changes to what the ML models learn from: category labels and the category tree.
+
+Splits and categories changed through the ORM are journaled when the session flushes. Statements changing them in
+bulk (imports, category deletion) add their events themselves.
+"""
+
+import datetime
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import DateTime, String, event, func, insert, inspect
+from sqlalchemy.orm import Mapped, Session, UOWTransaction, mapped_column
+
+from app.database import Base
+
+if TYPE_CHECKING:
+    from app.models.category import Category
+    from app.models.category_split import CategorySplit
+
+
+class LabelEvent(Base):
+    __tablename__ = "label_event"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    kind: Mapped[str] = mapped_column(String(20))  # label, unlabel, tree
+    # no foreign keys: events outlive the rows they are about
+    id_transaction: Mapped[int | None] = mapped_column(nullable=True)
+    id_group: Mapped[int | None] = mapped_column(nullable=True)
+    id_category: Mapped[int | None] = mapped_column(nullable=True)
+
+
+def _split_event(split: "CategorySplit", kind: str) -> dict[str, Any]:
+    return {
+        "kind": kind,
+        "id_transaction": split.id_transaction,
+        "id_group": split.id_group,
+        "id_category": split.id_category,
+    }
+
+
+def _tree_event(category: "Category") -> dict[str, Any]:
+    return {"kind": "tree", "id_transaction": None, "id_group": None, "id_category": category.id}
+
+
+@event.listens_for(Session, "after_flush")
+def _journal_flush(session: Session, flush_context: UOWTransaction) -> None:
+    """Journal the splits and categories the flush inserted, deleted or moved (ids are known after the flush)."""
+    from app.models.category import Category
+    from app.models.category_split import CategorySplit
+
+    events = []
+    for obj in session.deleted:
+        if isinstance(obj, CategorySplit):
+            events.append(_split_event(obj, "unlabel"))
+        elif isinstance(obj, Category):
+            events.append(_tree_event(obj))
+    for obj in session.new:
+        if isinstance(obj, CategorySplit):
+            events.append(_split_event(obj, "label"))
+        elif isinstance(obj, Category):
+            events.append(_tree_event(obj))
+    for obj in session.dirty:
+        if isinstance(obj, CategorySplit) and inspect(obj).attrs.id_category.history.has_changes():
+            events.append(_split_event(obj, "label"))
+        elif isinstance(obj, Category) and inspect(obj).attrs.id_parent.history.has_changes():
+            events.append(_tree_event(obj))
+    if events:
+        session.connection().execute(insert(LabelEvent), events)
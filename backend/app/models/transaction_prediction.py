@@ -0,0 +1,16 @@
+from sqlalchemy import JSON, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class TransactionPrediction(Base):
+    """Category predicted for a transaction by a model, computed ahead of time."""
+
+    __tablename__ = "transaction_prediction"
+
+    id_transaction: Mapped[int] = mapped_column(ForeignKey("transaction.id", ondelete="CASCADE"), primary_key=True)
+    id_model: Mapped[int] = mapped_column(ForeignKey("ml_model.id", ondelete="CASCADE"), primary_key=True, index=True)
+    id_category: Mapped[int | None] = mapped_column(ForeignKey("category.id", ondelete="SET NULL"), nullable=True)
+    probability: Mapped[float] = mapped_column(default=0.0)
+    top_k: Mapped[list[list[float]]] = mapped_column(JSON, default=list)  # [[id_category, probability], ...]
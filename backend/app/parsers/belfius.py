@@ -1,9 +1,34 @@
 import os
 import re
+from collections.abc import Callable, Iterable, Iterator
 from datetime import date
 from decimal import Decimal
-
-from app.parsers.common import ParsedTransaction, parse_csv_file, parse_date_str, sanitize, sanitize_number
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from app.parsers.common import (
+    BATCH_SIZE,
+    AmountColumn,
+    CSV_CHUNK_SIZE,
+    ParsedBatch,
+    ParsedTransaction,
+    Source,
+    csv_row,
+    map_unique,
+    parse_csv_file,
+    parse_date_str,
+    read_csv_chunks,
+    rebatch,
+    sanitize,
+    sanitize_column,
+    sanitize_number,
+    sanitize_number_column,
+    sniff_csv_row,
+)
+
+N_COLUMNS = 15
 
 
 def _account_tag(number: str | None) -> str:
@@ -22,23 +47,29 @@ def _make_external_id(t: ParsedTransaction, valued_at: date, transaction_field:
     return f"{t.date.isoformat()}/{valued_at.isoformat()}/{_account_tag(t.source_number)}/{_account_tag(t.dest_number)}/{t.amount:.2f}/{ref}"
 
 
+def accepts(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1] not in {"pdf", "json", "db"}
+
+
+def check_file(source: Source) -> bool:
+    row = sniff_csv_row(source, 12, encoding="latin1")
+    return row is None or (len(row) > 0 and row[0] == "Compte")
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of a Belfius export (its column header on row 13)."""
+    row = csv_row(head, 12, encoding="latin1")
+    return row is not None and len(row) > 0 and row[0] == "Compte"
+
+
 def check_files(path: str) -> bool:
-    for filename in os.listdir(path):
-        filepath = os.path.join(path, filename)
-        if filename.rsplit(".", 1)[-1] in {"pdf", "json", "db"}:
-            continue
-        rows = parse_csv_file(filepath, header_length=12)
-        for row in rows:
-            if row[0] != "Compte":
-                return False
-            break
-    return True
-
-
-def parse_file(filepath: str) -> list[ParsedTransaction]:
+    return all(check_file(os.path.join(path, filename)) for filename in os.listdir(path) if accepts(filename))
+
+
+def parse_file(source: Source) -> list[ParsedTransaction]:
     transactions = []
 
-    for row in parse_csv_file(filepath):
+    for row in parse_csv_file(source):
         my_account_number = sanitize_number(row[0])
         other_acc_nb = sanitize_number(row[4])
         other_acc_name = sanitize(row[5])
@@ -85,11 +116,100 @@ def parse_file(filepath: str) -> list[ParsedTransaction]:
     return transactions
 
 
-def parse_folder(path: str) -> list[ParsedTransaction]:
+def _columns_from_frame(df: pd.DataFrame) -> ParsedBatch:
+    """Same output as `parse_file`, computed column by column."""
+    my_account_number = sanitize_number_column(df[0])
+    other_acc_nb = sanitize_number_column(df[4])
+    other_acc_name = sanitize_column(df[5])
+
+    amounts = AmountColumn.parse(df[10])
+    incoming = pd.Series(amounts.sign > 0, index=df.index)
+
+    ordinals = map_unique(df[1], lambda s: parse_date_str(s).toordinal())
+    when_iso = map_unique(df[1], lambda s: parse_date_str(s).isoformat())
+    valued_at = map_unique(df[9], lambda s: parse_date_str(s).isoformat())
+
+    src_number = my_account_number.where(~incoming, other_acc_nb)
+    src_name = other_acc_name.where(incoming, None)
+    dest_number = other_acc_nb.where(~incoming, my_account_number)
+    dest_name = other_acc_name.where(~incoming, None)
+
+    transaction_field = sanitize_column(df[8])
+    communication = sanitize_column(df[14])
+    ref = transaction_field.str.extract(r"^.*REF\. : ([0-9A-Za-z]+)(?: .*)?$", expand=False).fillna("noref")
+    amount_str = amounts.fixed()
+    external_id = (
+        when_iso
+        + "/"
+        + valued_at
+        + "/"
+        + src_number.fillna("")
+        + "/"
+        + dest_number.fillna("")
+        + "/"
+        + amount_str
+        + "/"
+        + ref
+    )
+
+    return ParsedBatch(
+        external_id=external_id.tolist(),
+        source_number=src_number.tolist(),
+        source_name=src_name.tolist(),
+        dest_number=dest_number.tolist(),
+        dest_name=dest_name.tolist(),
+        date=ordinals.to_numpy(dtype=np.int32),
+        amount=np.abs(amounts.cents),
+        currency=map_unique(df[11], str.strip).tolist(),
+        description=communication.fillna(transaction_field).fillna("").tolist(),
+        data_source="belfius",
+        metadata={
+            "valued_at": valued_at.tolist(),
+            "statement_nb": sanitize_column(df[2]).tolist(),
+            "transaction_nb": sanitize_column(df[3]).tolist(),
+            "road_number": sanitize_column(df[6]).tolist(),
+            "postal_code_city": sanitize_column(df[7]).tolist(),
+            "transaction": transaction_field.tolist(),
+            "bic": sanitize_column(df[12]).tolist(),
+            "country_code": sanitize_column(df[13]).tolist(),
+            "communication": communication.tolist(),
+        },
+    )
+
+
+def parse_file_columns(source: Source, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[ParsedBatch]:
+    """Columnar counterpart of `parse_file`: yields chunks of at most `chunk_size` transactions."""
+    for df in read_csv_chunks(source, N_COLUMNS, header_length=13, chunk_size=chunk_size):
+        yield _columns_from_frame(df)
+
+
+def _parse_file_columns(source: Source) -> list[ParsedBatch]:
+    return list(parse_file_columns(source))
+
+
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[Any]]] = map, columnar: bool = False
+) -> list[ParsedTransaction]:
+    """Parse several files, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`.
+
+    In columnar mode each file is parsed chunk by chunk with vectorized operations (see `parse_file_columns`).
+    """
     all_transactions = []
-    for filename in os.listdir(path):
-        if filename.rsplit(".", 1)[-1] in {"pdf", "json", "db"}:
-            continue
-        filepath = os.path.join(path, filename)
-        all_transactions.extend(parse_file(filepath))
+    if columnar:
+        for chunks in map_files(_parse_file_columns, sources):
+            for batch in chunks:
+                all_transactions.extend(batch.rows())
+    else:
+        for transactions in map_files(parse_file, sources):
+            all_transactions.extend(transactions)
     return all_transactions
+
+
+def parse_folder(path: str) -> list[ParsedTransaction]:
+    return parse_files(os.path.join(path, filename) for filename in os.listdir(path) if accepts(filename))
+
+
+def iter_batches(sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]:
+    """Stream the transactions of several files in batches, reading each file `batch_size` rows at a time."""
+    chunks = (batch for source in sources for batch in parse_file_columns(source, chunk_size=batch_size))
+    yield from rebatch(chunks, batch_size)
@@ -0,0 +1,204 @@
+"""ISO 20022 CAMT.053 bank-to-customer statements (XML).
+
+Files are read with `iterparse` and each entry is removed from the tree once parsed, so statements spanning
+years parse in constant memory. Any version of the message is accepted (the namespace is read from the root).
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from app.parsers.common import (
+    BATCH_SIZE,
+    ExternalIds,
+    ParsedBatch,
+    ParsedTransaction,
+    Source,
+    iter_transaction_batches,
+    open_binary,
+    read_head,
+    sanitize,
+    sanitize_number,
+)
+
+DATA_SOURCE = "camt053"
+
+_ROOT = re.compile(rb"<(?:\w+:)?Document[^>]*urn:iso:std:iso:20022:tech:xsd:camt\.053\.")
+
+# entry statuses that are not bookings yet
+_NOT_BOOKED = {"PDNG", "INFO"}
+
+
+def accepts(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1].lower() == "xml"
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of a CAMT.053 document (by its namespace)."""
+    return _ROOT.search(head) is not None
+
+
+def check_file(source: Source) -> bool:
+    return sniff(read_head(source))
+
+
+class _Paths:
+    """Element paths qualified with the namespace of the document."""
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+
+    def __call__(self, path: str) -> str:
+        return "/".join(f"{{{self.namespace}}}{name}" for name in path.split("/"))
+
+    def text(self, element: ET.Element, *paths: str) -> str | None:
+        """Sanitized text of the first of `paths` found under `element`."""
+        for path in paths:
+            found = element.find(self(path))
+            text = sanitize(found.text) if found is not None and found.text else None
+            if text is not None:
+                return text
+        return None
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _date(text: str | None) -> date | None:
+    # Dt is a date, DtTm a date and time: both start with the date
+    return date.fromisoformat(text[:10]) if text else None
+
+
+def _account(q: _Paths, account: ET.Element) -> str | None:
+    number = q.text(account, "Id/IBAN", "Id/Othr/Id")
+    return sanitize_number(number) if number else None
+
+
+def _remittance(q: _Paths, details: ET.Element) -> str | None:
+    lines = [sanitize(e.text) for e in details.iterfind(q("RmtInf/Ustrd")) if e.text]
+    return " ".join(line for line in lines if line) or q.text(details, "RmtInf/Strd/CdtrRefInf/Ref")
+
+
+def _entry(
+    q: _Paths, entry: ET.Element, account: str | None, currency: str | None, statement_id: str | None, ids: ExternalIds
+) -> ParsedTransaction | None:
+    status = q.text(entry, "Sts", "Sts/Cd")
+    amount_element = entry.find(q("Amt"))
+    if status in _NOT_BOOKED or amount_element is None or not amount_element.text:
+        return None
+    amount = Decimal(amount_element.text.strip())
+    incoming = q.text(entry, "CdtDbtInd") == "CRDT"
+    booked = _date(q.text(entry, "BookgDt/Dt", "BookgDt/DtTm"))
+    valued = _date(q.text(entry, "ValDt/Dt", "ValDt/DtTm"))
+    when = booked or valued
+    if when is None:
+        return None
+
+    # the counterparty: the debtor of a credit, the creditor of a debit
+    party = "Dbtr" if incoming else "Cdtr"
+    other_number = other_name = communication = end_to_end_id = None
+    details = entry.find(q("NtryDtls/TxDtls"))
+    if details is not None:
+        other_name = q.text(details, f"RltdPties/{party}/Nm", f"RltdPties/{party}/Pty/Nm")
+        other_account = details.find(q(f"RltdPties/{party}Acct"))
+        other_number = _account(q, other_account) if other_account is not None else None
+        communication = _remittance(q, details)
+        end_to_end_id = q.text(details, "Refs/EndToEndId")
+        if end_to_end_id == "NOTPROVIDED":
+            end_to_end_id = None
+    additional_info = q.text(entry, "AddtlNtryInf")
+
+    src_number, src_name = account, None
+    dest_number, dest_name = other_number, other_name
+    if incoming:
+        src_number, src_name = other_number, other_name
+        dest_number, dest_name = account, None
+
+    booking_ref = q.text(entry, "AcctSvcrRef")
+    if booking_ref is not None:
+        external_id = f"{account or ''}/{booking_ref}"
+    else:
+        signed = amount if incoming else -amount
+        valued_at = valued.isoformat() if valued else ""
+        external_id = ids(f"{account or ''}/{when.isoformat()}/{valued_at}/{signed}/{other_number or ''}", when)
+
+    return ParsedTransaction(
+        external_id=external_id,
+        source_number=src_number,
+        source_name=src_name,
+        dest_number=dest_number,
+        dest_name=dest_name,
+        date=when,
+        amount=amount,
+        currency=amount_element.get("Ccy") or currency or "EUR",
+        description=communication or additional_info or "",
+        data_source=DATA_SOURCE,
+        raw_metadata={
+            "valued_at": valued.isoformat() if valued else None,
+            "statement_id": statement_id,
+            "booking_ref": booking_ref,
+            "entry_ref": q.text(entry, "NtryRef"),
+            "end_to_end_id": end_to_end_id,
+            "communication": communication,
+            "additional_info": additional_info,
+        },
+    )
+
+
+def iter_transactions(source: Source) -> Iterator[ParsedTransaction]:
+    """Transactions of a statement file, in file order, parsed as the file is read."""
+    q = _Paths("")
+    ids = ExternalIds()
+    account = currency = statement_id = None
+    # open elements, to remove parsed entries from their parent
+    open_elements: list[ET.Element] = []
+    with open_binary(source) as f:
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if not open_elements:
+                    q = _Paths(element.tag[1:].split("}", 1)[0] if element.tag.startswith("{") else "")
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            name = _local_name(element.tag)
+            if name == "Ntry":
+                transaction = _entry(q, element, account, currency, statement_id, ids)
+                if transaction is not None:
+                    yield transaction
+                open_elements[-1].remove(element)
+            elif name == "Acct" and open_elements and _local_name(open_elements[-1].tag) == "Stmt":
+                # the account and id come before the entries of a statement
+                account = _account(q, element)
+                currency = q.text(element, "Ccy")
+                statement_id = q.text(open_elements[-1], "Id")
+            elif name == "Stmt":
+                open_elements[-1].remove(element)
+                account = currency = statement_id = None
+
+
+def parse_file(source: Source) -> list[ParsedTransaction]:
+    return list(iter_transactions(source))
+
+
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[Any]]] = map
+) -> list[ParsedTransaction]:
+    """Parse several files, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`."""
+    all_transactions = []
+    for transactions in map_files(parse_file, sources):
+        all_transactions.extend(transactions)
+    return all_transactions
+
+
+def parse_folder(path: str) -> list[ParsedTransaction]:
+    return parse_files(os.path.join(path, filename) for filename in os.listdir(path) if accepts(filename))
+
+
+def iter_batches(sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]:
+    """Stream the transactions of several statement files in batches, reading each file as batches are consumed."""
+    return iter_transaction_batches((t for source in sources for t in iter_transactions(source)), batch_size)
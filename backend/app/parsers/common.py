@@ -1,12 +1,36 @@
 import csv
+import io
+import os
 import re
-from collections.abc import Generator
+import sys
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from datetime import date
-from decimal import Decimal
+from datetime import date as Date  # the type, in classes having a `date` field
+from decimal import ROUND_HALF_UP, Decimal
+from enum import Enum
+from typing import Any, BinaryIO, Protocol, TextIO, TypeVar, overload
 
+import numpy as np
+import pandas as pd
 
-@dataclass
+# a parser input: a path on disk or an open binary file (e.g. an upload spooled in memory)
+Source = str | os.PathLike[str] | BinaryIO
+
+# how many bytes format sniffing reads from the start of a file
+SNIFF_SIZE = 4096
+
+# rows per chunk in the columnar CSV parsers
+CSV_CHUNK_SIZE = 50_000
+
+# transactions per batch handed from the parsers to the import
+BATCH_SIZE = 5000
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
 class ParsedTransaction:
     """Intermediate representation of a parsed transaction before DB insertion."""
 
@@ -23,6 +47,268 @@ class ParsedTransaction:
     raw_metadata: dict[str, object] = field(default_factory=dict)
 
 
+class _Absent(Enum):
+    ABSENT = "absent"
+
+
+# metadata value of a row that does not have the key
+ABSENT = _Absent.ABSENT
+
+# ParsedBatch columns held as lists of objects
+_OBJECT_COLUMNS = (
+    "external_id",
+    "source_number",
+    "source_name",
+    "dest_number",
+    "dest_name",
+    "currency",
+    "description",
+)
+
+
+def amount_to_cents(amount: Decimal) -> int:
+    """Cents of an amount. Sub-cent digits are rounded half away from zero, as the numeric(20, 2) amount columns
+    round them when storing."""
+    return int(amount.scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _shared(values: Iterable[T]) -> list[T]:
+    """Copy `values`, with equal values sharing a single object (names, currencies... repeat across a batch)."""
+    seen: dict[Any, Any] = {}
+    shared = []
+    for value in values:
+        try:
+            shared.append(seen.setdefault(value, value))
+        except TypeError:  # unhashable
+            shared.append(value)
+    return shared
+
+
+@dataclass(eq=False)
+class ParsedBatch(Sequence["ParsedRow"]):
+    """Parsed transactions of a single data source, stored column by column.
+
+    Dates are day ordinals and amounts cents, in numpy arrays. Metadata is stored per (interned) key with one
+    value per row, ABSENT where a row does not have the key. Indexing and iterating give `ParsedRow` views.
+    """
+
+    data_source: str
+    external_id: list[str]
+    source_number: list[str | None]
+    source_name: list[str | None]
+    dest_number: list[str | None]
+    dest_name: list[str | None]
+    date: np.ndarray  # int32, date.toordinal()
+    amount: np.ndarray  # int64, cents
+    currency: list[str]
+    description: list[str]
+    metadata: dict[str, list[Any]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.metadata = {sys.intern(key): values for key, values in self.metadata.items()}
+
+    @classmethod
+    def from_columns(
+        cls,
+        data_source: str,
+        dates: Iterable[Date],
+        amounts: Iterable[Decimal],
+        metadata: dict[str, list[Any]],
+        **columns: Iterable[Any],
+    ) -> "ParsedBatch":
+        """Build a batch from plain columns (`columns` holds the external_id, ..., description lists)."""
+        return cls(
+            data_source=data_source,
+            date=np.fromiter((d.toordinal() for d in dates), dtype=np.int32),
+            amount=np.fromiter(map(amount_to_cents, amounts), dtype=np.int64),
+            metadata={key: _shared(values) for key, values in metadata.items() if any(v is not ABSENT for v in values)},
+            **{name: _shared(columns[name]) for name in _OBJECT_COLUMNS},
+        )
+
+    @classmethod
+    def from_transactions(cls, transactions: Sequence[ParsedTransaction]) -> "ParsedBatch":
+        keys = dict.fromkeys(key for t in transactions for key in t.raw_metadata)
+        return cls.from_columns(
+            transactions[0].data_source if transactions else "",
+            dates=[t.date for t in transactions],
+            amounts=[t.amount for t in transactions],
+            metadata={key: [t.raw_metadata.get(key, ABSENT) for t in transactions] for key in keys},
+            **{name: [getattr(t, name) for t in transactions] for name in _OBJECT_COLUMNS},
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence["ParsedBatch"]) -> "ParsedBatch":
+        keys = dict.fromkeys(key for batch in batches for key in batch.metadata)
+        return cls(
+            data_source=batches[0].data_source,
+            date=np.concatenate([batch.date for batch in batches]),
+            amount=np.concatenate([batch.amount for batch in batches]),
+            metadata={
+                key: [v for batch in batches for v in batch.metadata.get(key, [ABSENT] * len(batch))] for key in keys
+            },
+            **{name: [v for batch in batches for v in getattr(batch, name)] for name in _OBJECT_COLUMNS},
+        )
+
+    def __len__(self) -> int:
+        return len(self.external_id)
+
+    @overload
+    def __getitem__(self, index: int) -> "ParsedRow": ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "ParsedBatch": ...
+
+    def __getitem__(self, index: int | slice) -> "ParsedRow | ParsedBatch":
+        if isinstance(index, slice):
+            return ParsedBatch(
+                data_source=self.data_source,
+                date=self.date[index],
+                amount=self.amount[index],
+                metadata={key: values[index] for key, values in self.metadata.items()},
+                **{name: getattr(self, name)[index] for name in _OBJECT_COLUMNS},
+            )
+        if not -len(self) <= index < len(self):
+            raise IndexError("batch index out of range")
+        return ParsedRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator["ParsedRow"]:
+        return (ParsedRow(self, i) for i in range(len(self)))
+
+    def rows(self) -> list[ParsedTransaction]:
+        return [row.to_transaction() for row in self]
+
+
+class ParsedRow:
+    """One transaction of a ParsedBatch, with the attributes of a ParsedTransaction (read-only)."""
+
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch: ParsedBatch, index: int) -> None:
+        self.batch = batch
+        self.index = index
+
+    @property
+    def external_id(self) -> str:
+        return self.batch.external_id[self.index]
+
+    @property
+    def source_number(self) -> str | None:
+        return self.batch.source_number[self.index]
+
+    @property
+    def source_name(self) -> str | None:
+        return self.batch.source_name[self.index]
+
+    @property
+    def dest_number(self) -> str | None:
+        return self.batch.dest_number[self.index]
+
+    @property
+    def dest_name(self) -> str | None:
+        return self.batch.dest_name[self.index]
+
+    @property
+    def amount(self) -> Decimal:
+        return Decimal(int(self.batch.amount[self.index])).scaleb(-2)
+
+    @property
+    def currency(self) -> str:
+        return self.batch.currency[self.index]
+
+    @property
+    def description(self) -> str:
+        return self.batch.description[self.index]
+
+    @property
+    def data_source(self) -> str:
+        return self.batch.data_source
+
+    @property
+    def raw_metadata(self) -> dict[str, object]:
+        i = self.index
+        return {key: values[i] for key, values in self.batch.metadata.items() if values[i] is not ABSENT}
+
+    @property
+    def date(self) -> date:
+        return date.fromordinal(int(self.batch.date[self.index]))
+
+    def to_transaction(self) -> ParsedTransaction:
+        return ParsedTransaction(
+            external_id=self.external_id,
+            source_number=self.source_number,
+            source_name=self.source_name,
+            dest_number=self.dest_number,
+            dest_name=self.dest_name,
+            date=self.date,
+            amount=self.amount,
+            currency=self.currency,
+            description=self.description,
+            data_source=self.data_source,
+            raw_metadata=self.raw_metadata,
+        )
+
+
+# what the import consumes: ParsedBatch objects, or lists of ParsedTransaction from the row parsers
+TransactionLike = ParsedTransaction | ParsedRow
+TransactionBatch = Sequence[TransactionLike]
+
+
+class BatchParser(Protocol):
+    """What every parser module exposes as `iter_batches`: transactions in order, `batch_size` at a time at most."""
+
+    def __call__(self, sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]: ...
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebatch(batches: Iterable[ParsedBatch], size: int) -> Iterator[ParsedBatch]:
+    """Regroup batches (e.g. the chunks of several files) into batches of `size` rows, the last one aside."""
+    pending: list[ParsedBatch] = []
+    count = 0
+    for batch in batches:
+        pending.append(batch)
+        count += len(batch)
+        while count >= size:
+            merged = pending[0] if len(pending) == 1 else ParsedBatch.concat(pending)
+            yield merged[:size]
+            rest = merged[size:]
+            pending, count = ([rest] if len(rest) else []), len(rest)
+    if pending:
+        yield pending[0] if len(pending) == 1 else ParsedBatch.concat(pending)
+
+
+class ExternalIds:
+    """Numbers the repeats of external ids built from transaction fields, so that they stay unique within a file.
+
+    One instance numbers the ids of one file. Repeats are counted per date and key, the key holding the account and
+    content of the transaction, so that the numbering does not depend on the statement being sorted by date.
+    """
+
+    def __init__(self) -> None:
+        self._seen: dict[tuple[date, str], int] = {}
+
+    def __call__(self, key: str, when: date) -> str:
+        repeats = self._seen.get((when, key), 0)
+        self._seen[(when, key)] = repeats + 1
+        return key if repeats == 0 else f"{key}/{repeats}"
+
+
+def iter_transaction_batches(
+    transactions: Iterable[ParsedTransaction], batch_size: int = BATCH_SIZE
+) -> Iterator[ParsedBatch]:
+    """`transactions` in batches of `batch_size`, for parsers that produce them one at a time."""
+    return map(ParsedBatch.from_transactions, batched(transactions, batch_size))
+
+
 def sanitize(e: str) -> str | None:
     cleaned = re.sub(r"\s+", " ", e.strip())
     return None if len(cleaned) == 0 else cleaned
@@ -33,10 +319,76 @@ def sanitize_number(e: str) -> str | None:
     return None if len(cleaned) == 0 else cleaned
 
 
+@contextmanager
+def open_text(source: Source, encoding: str, errors: str = "strict") -> Iterator[TextIO]:
+    """Open `source` for text reading. File objects are read from the start and left open for the caller."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding=encoding, errors=errors, newline="") as f:
+            yield f
+        return
+    source.seek(0)
+    wrapper = io.TextIOWrapper(source, encoding=encoding, errors=errors, newline="")
+    try:
+        yield wrapper
+    finally:
+        wrapper.detach()
+
+
+@contextmanager
+def open_binary(source: Source) -> Iterator[BinaryIO]:
+    """Open `source` for binary reading. File objects are read from the start and left open for the caller."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield f
+        return
+    source.seek(0)
+    yield source
+
+
+def guess_encoding(head: bytes) -> str:
+    """UTF-8 if the first bytes of a text file decode as such, else Windows-1252 (what older bank exports use)."""
+    if len(head) == SNIFF_SIZE:
+        # a multibyte character could be cut by the read boundary
+        head = head[:-3]
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError:
+        return "cp1252"
+    return "utf-8-sig"
+
+
+def read_head(source: Source, size: int = SNIFF_SIZE) -> bytes:
+    """First `size` bytes of `source`, without consuming a file object."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(size)
+    source.seek(0)
+    head = source.read(size)
+    source.seek(0)
+    return head
+
+
+def sniff_csv_row(source: Source, row_index: int, encoding: str) -> list[str] | None:
+    """Row `row_index` of a CSV file, read from its first few KB only. None if it is not in there."""
+    return csv_row(read_head(source), row_index, encoding)
+
+
+def csv_row(head: bytes, row_index: int, encoding: str) -> list[str] | None:
+    """Row `row_index` of a CSV file, given its first bytes (see `read_head`). None if it is not in there."""
+    if len(head) == SNIFF_SIZE and b"\n" in head:
+        # drop the line cut by the read boundary (could also split a multibyte character)
+        head = head.rsplit(b"\n", 1)[0]
+    rows = csv.reader(io.StringIO(head.decode(encoding), newline=""), delimiter=";")
+    for i, row in enumerate(rows):
+        if i == row_index:
+            return row
+    return None
+
+
 def parse_csv_file(
-    filepath: str, encoding: str = "latin1", header_length: int = 13, skip_header: bool = True
+    source: Source, encoding: str = "latin1", header_length: int = 13, skip_header: bool = True
 ) -> Generator[list[str], None, None]:
-    with open(filepath, "r", encoding=encoding) as f:
+    with open_text(source, encoding) as f:
         reader = csv.reader(f, delimiter=";")
         for i, row in enumerate(reader):
             if skip_header and i < header_length:
@@ -44,6 +396,121 @@ def parse_csv_file(
             yield row
 
 
+def read_csv_chunks(
+    source: Source, n_columns: int, encoding: str = "latin1", header_length: int = 13, chunk_size: int = CSV_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Read the first `n_columns` columns of a CSV file as raw strings, `chunk_size` rows at a time."""
+    with open_text(source, encoding) as f:
+        yield from pd.read_csv(
+            f,
+            sep=";",
+            header=None,
+            skiprows=header_length,
+            usecols=range(n_columns),
+            dtype=object,
+            na_filter=False,
+            chunksize=chunk_size,
+        )
+
+
+def map_unique(column: pd.Series, func: Callable[[Any], Any]) -> pd.Series:
+    """Apply `func` once per distinct value of `column`: exports repeat the same dates, accounts, names, etc."""
+    codes, uniques = pd.factorize(column)
+    results = np.empty(len(uniques), dtype=object)
+    results[:] = [func(value) for value in uniques]
+    return pd.Series(results[codes], index=column.index, dtype=object)
+
+
+# text of the two decimals of cents
+_CENTS_TEXT = np.array([f"{i:02d}" for i in range(100)])
+
+
+@dataclass
+class AmountColumn:
+    """Amounts of a CSV column, parsed digit by digit on a character matrix rather than one Decimal at a time."""
+
+    cents: np.ndarray  # int64, signed, rounded as amount_to_cents does
+    sign: np.ndarray  # -1, 0 or 1, of the exact amount
+    decimals: np.ndarray  # number of digits after the decimal separator
+    text: pd.Series  # str() of the absolute Decimal amount
+
+    @classmethod
+    def parse(cls, column: pd.Series, thousands: str | None = None) -> "AmountColumn":
+        """Parse the amounts `Decimal(value.replace(",", "."))` would parse, once `thousands` separators are removed.
+
+        Plain ASCII amounts (optional sign, digits, at most one "." or "," separator) are parsed with array
+        operations. The others (spaces, exponents...) go through Decimal one by one, which raises on invalid ones.
+        """
+        values = column.to_numpy(dtype=object)
+        n = len(values)
+        try:
+            chars = values.astype(bytes)
+        except UnicodeEncodeError:
+            chars = np.zeros(n, dtype="S1")  # nothing plain: every value goes through Decimal
+        m = chars.view(np.uint8).reshape(n, -1) if n else np.zeros((0, 1), dtype=np.uint8)
+        digits = m.astype(np.int64) - ord("0")
+        is_digit = (digits >= 0) & (digits <= 9)
+        skipped = m == ord(thousands) if thousands is not None else np.zeros_like(is_digit)
+        separator = ((m == ord(",")) | (m == ord("."))) & ~skipped
+        signed = (m[:, 0] == ord("-")) | (m[:, 0] == ord("+"))
+        other = ~(is_digit | separator | skipped | (m == 0))
+        other[:, 0] &= ~signed
+
+        position = np.arange(m.shape[1])
+        point = np.where(separator.any(axis=1), separator.argmax(axis=1), m.shape[1])[:, None]
+        integer_digit = is_digit & (position < point)
+        fraction_digit = is_digit & (position > point)
+        n_integer = integer_digit.sum(axis=1)
+        plain = ~other.any(axis=1) & (separator.sum(axis=1) <= 1) & is_digit.any(axis=1) & (n_integer <= 15)
+
+        exponent = np.where(integer_digit, n_integer[:, None] - np.cumsum(integer_digit, axis=1), 0)
+        integer = np.where(integer_digit, digits * 10**exponent, 0).sum(axis=1)
+        rank = np.where(fraction_digit, np.cumsum(fraction_digit, axis=1), 0)
+        fraction = np.where(rank == 1, digits * 10, 0).sum(axis=1) + np.where(rank == 2, digits, 0).sum(axis=1)
+        half_up = ((rank == 3) & (digits >= 5)).any(axis=1)
+        negative = m[:, 0] == ord("-")
+        magnitude = integer * 100 + fraction + half_up
+        cents = np.where(negative, -magnitude, magnitude)
+        sign = np.where((is_digit & (digits > 0)).any(axis=1), np.where(negative, -1, 1), 0)
+        decimals = fraction_digit.sum(axis=1)
+
+        text_array = integer.astype(str)
+        two_decimals = plain & (decimals == 2)
+        text_array = np.where(
+            two_decimals, np.char.add(np.char.add(text_array, "."), _CENTS_TEXT[fraction]), text_array
+        )
+        text = pd.Series(text_array.astype(object), index=column.index)
+        for i in np.flatnonzero(~plain | ((decimals != 0) & (decimals != 2))):
+            value = values[i].replace(thousands, "") if thousands is not None else values[i]
+            amount = Decimal(value.replace(",", "."))
+            cents[i], sign[i], text.iat[i] = amount_to_cents(amount), int(amount.compare(0)), str(amount.copy_abs())
+            decimals[i] = max(0, -int(amount.as_tuple().exponent))
+        return cls(cents=cents, sign=sign, decimals=decimals, text=text)
+
+    def fixed(self) -> pd.Series:
+        """The absolute amounts with two decimals, as formatted by f"{amount:.2f}"."""
+        abs_cents = np.abs(self.cents)
+        fixed_array = np.char.add(np.char.add((abs_cents // 100).astype(str), "."), _CENTS_TEXT[abs_cents % 100])
+        fixed = pd.Series(fixed_array.astype(object), index=self.text.index)
+        # f-strings round the few sub-cent amounts half to even
+        sub_cent = self.decimals > 2
+        fixed[sub_cent] = [f"{Decimal(t):.2f}" for t in self.text[sub_cent]]
+        return fixed
+
+    def take(self, mask: np.ndarray) -> "AmountColumn":
+        return AmountColumn(
+            cents=self.cents[mask], sign=self.sign[mask], decimals=self.decimals[mask], text=self.text[mask]
+        )
+
+
+def sanitize_column(column: pd.Series) -> pd.Series:
+    return map_unique(column, sanitize)
+
+
+def sanitize_number_column(column: pd.Series) -> pd.Series:
+    return map_unique(column, sanitize_number)
+
+
 def parse_date_str(s: str) -> date:
     sanitized = sanitize(s)
     assert sanitized is not None, f"Cannot parse empty date string: {s!r}"
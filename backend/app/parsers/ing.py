@@ -1,9 +1,33 @@
 import os
+from collections.abc import Callable, Iterable, Iterator
 from decimal import Decimal
-
-from app.parsers.common import ParsedTransaction, parse_csv_file, parse_date_str, sanitize, sanitize_number
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from app.parsers.common import (
+    BATCH_SIZE,
+    AmountColumn,
+    CSV_CHUNK_SIZE,
+    ParsedBatch,
+    ParsedTransaction,
+    Source,
+    csv_row,
+    map_unique,
+    parse_csv_file,
+    parse_date_str,
+    read_csv_chunks,
+    rebatch,
+    sanitize,
+    sanitize_column,
+    sanitize_number,
+    sanitize_number_column,
+    sniff_csv_row,
+)
 
 ING_ENCODING = "utf-8-sig"
+N_COLUMNS = 11
 
 
 def _account_tag(number: str | None) -> str:
@@ -16,26 +40,35 @@ def _make_external_id(t: ParsedTransaction, valued_at: str, statement_nb: str, t
     return f"{t.date.isoformat()}/{valued_at}/{_account_tag(t.source_number)}/{_account_tag(t.dest_number)}/{t.amount}/{statement_nb}-{transaction_nb}"
 
 
+def accepts(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1] not in {"pdf", "json", "db"}
+
+
+def check_file(source: Source) -> bool:
+    try:
+        row = sniff_csv_row(source, 0, encoding=ING_ENCODING)
+    except UnicodeDecodeError:
+        return False
+    return row is None or (len(row) > 0 and row[0] == "Numéro de compte")
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of an ING export (its column header on the first row)."""
+    try:
+        row = csv_row(head, 0, encoding=ING_ENCODING)
+    except UnicodeDecodeError:
+        return False
+    return row is not None and len(row) > 0 and row[0] == "Numéro de compte"
+
+
 def check_files(path: str) -> bool:
-    for filename in os.listdir(path):
-        filepath = os.path.join(path, filename)
-        if filename.rsplit(".", 1)[-1] in {"pdf", "json", "db"}:
-            continue
-        try:
-            rows = parse_csv_file(filepath, header_length=0, encoding=ING_ENCODING)
-            for row in rows:
-                if row[0] != "Numéro de compte":
-                    return False
-                break
-        except UnicodeDecodeError:
-            return False
-    return True
-
-
-def parse_file(filepath: str) -> list[ParsedTransaction]:
+    return all(check_file(os.path.join(path, filename)) for filename in os.listdir(path) if accepts(filename))
+
+
+def parse_file(source: Source) -> list[ParsedTransaction]:
     transactions = []
 
-    for row in parse_csv_file(filepath, header_length=1, encoding=ING_ENCODING):
+    for row in parse_csv_file(source, header_length=1, encoding=ING_ENCODING):
         my_account_number = sanitize_number(row[0])
         other_acc_nb = sanitize_number(row[2])
 
@@ -83,11 +116,103 @@ def parse_file(filepath: str) -> list[ParsedTransaction]:
     return transactions
 
 
-def parse_folder(path: str) -> list[ParsedTransaction]:
+def _columns_from_frame(df: pd.DataFrame) -> ParsedBatch:
+    """Same output as `parse_file`, computed column by column."""
+    amounts = AmountColumn.parse(df[6], thousands=".")
+    non_zero = amounts.sign != 0
+    df = df[non_zero]
+    amounts = amounts.take(non_zero)
+    incoming = pd.Series(amounts.sign > 0, index=df.index)
+
+    my_account_number = sanitize_number_column(df[0])
+    other_acc_nb = sanitize_number_column(df[2])
+    my_account_name = sanitize_column(df[1])
+
+    ordinals = map_unique(df[4], lambda s: parse_date_str(s).toordinal())
+    when_iso = map_unique(df[4], lambda s: parse_date_str(s).isoformat())
+    statement_nb = map_unique(df[4], lambda s: str(parse_date_str(s).year))
+    valued_at = map_unique(df[5], lambda s: parse_date_str(s).isoformat())
+
+    src_number = my_account_number.where(~incoming, other_acc_nb)
+    src_name = my_account_name.where(~incoming, None)
+    dest_number = other_acc_nb.where(~incoming, my_account_number)
+    dest_name = my_account_name.where(incoming, None)
+
+    communication = sanitize_column(df[8])
+    details = sanitize_column(df[9])
+    transaction_nb = sanitize_column(df[3])
+    amount_str = amounts.text
+    external_id = (
+        when_iso
+        + "/"
+        + valued_at
+        + "/"
+        + src_number.fillna("")
+        + "/"
+        + dest_number.fillna("")
+        + "/"
+        + amount_str
+        + "/"
+        + statement_nb
+        + "-"
+        + transaction_nb.fillna("None")
+    )
+
+    return ParsedBatch(
+        external_id=external_id.tolist(),
+        source_number=src_number.tolist(),
+        source_name=src_name.tolist(),
+        dest_number=dest_number.tolist(),
+        dest_name=dest_name.tolist(),
+        date=ordinals.to_numpy(dtype=np.int32),
+        amount=np.abs(amounts.cents),
+        currency=map_unique(df[7], str.strip).tolist(),
+        description=details.fillna(communication).fillna("").tolist(),
+        data_source="ing",
+        metadata={
+            "valued_at": valued_at.tolist(),
+            "transaction_nb": transaction_nb.tolist(),
+            "statement_nb": statement_nb.tolist(),
+            "communication": communication.tolist(),
+            "details": details.tolist(),
+            "message": sanitize_column(df[10]).tolist(),
+        },
+    )
+
+
+def parse_file_columns(source: Source, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[ParsedBatch]:
+    """Columnar counterpart of `parse_file`: yields chunks of at most `chunk_size` transactions."""
+    for df in read_csv_chunks(source, N_COLUMNS, encoding=ING_ENCODING, header_length=1, chunk_size=chunk_size):
+        yield _columns_from_frame(df)
+
+
+def _parse_file_columns(source: Source) -> list[ParsedBatch]:
+    return list(parse_file_columns(source))
+
+
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[Any]]] = map, columnar: bool = False
+) -> list[ParsedTransaction]:
+    """Parse several files, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`.
+
+    In columnar mode each file is parsed chunk by chunk with vectorized operations (see `parse_file_columns`).
+    """
     all_transactions = []
-    for filename in os.listdir(path):
-        if filename.rsplit(".", 1)[-1] in {"pdf", "json", "db"}:
-            continue
-        filepath = os.path.join(path, filename)
-        all_transactions.extend(parse_file(filepath))
+    if columnar:
+        for chunks in map_files(_parse_file_columns, sources):
+            for batch in chunks:
+                all_transactions.extend(batch.rows())
+    else:
+        for transactions in map_files(parse_file, sources):
+            all_transactions.extend(transactions)
     return all_transactions
+
+
+def parse_folder(path: str) -> list[ParsedTransaction]:
+    return parse_files(os.path.join(path, filename) for filename in os.listdir(path) if accepts(filename))
+
+
+def iter_batches(sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]:
+    """Stream the transactions of several files in batches, reading each file `batch_size` rows at a time."""
+    chunks = (batch for source in sources for batch in parse_file_columns(source, chunk_size=batch_size))
+    yield from rebatch(chunks, batch_size)
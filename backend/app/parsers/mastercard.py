@@ -5,74 +5,105 @@ Parses MasterCard statement PDFs into structured transaction data.
 
 import os
 import re
-from collections import defaultdict
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
 from datetime import date, datetime
 from decimal import Decimal
-from io import StringIO
-from typing import Any
+from typing import Any, NamedTuple
 
-from bs4 import BeautifulSoup
-from pdfminer.converter import HTMLConverter
-from pdfminer.layout import LAParams
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTFigure, LTItem, LTPage, LTText, LTTextBox
 from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
 from pdfminer.pdfpage import PDFPage
 
-from app.parsers.common import ParsedTransaction
+from app.parsers.common import ABSENT, BATCH_SIZE, ParsedBatch, Source, batched
 
 SMALL_DATE_PATTERN = r"^[0-9]{2}/[0-9]{2}$"
 
-# Type alias for BeautifulSoup Tag (avoid strict import issues)
-Tag = Any
+# vertical gap between stacked pages, as in the HTML rendering the parser was first written against
+PAGE_MARGIN = 50
+
+_small_date_re = re.compile(SMALL_DATE_PATTERN)
+_date_re = re.compile(r"[0-9]{2}/[0-9]{2}/[0-9]{4}")
+
+
+class _Box(NamedTuple):
+    """A block of text. Coordinates are whole pixels from the top of the document, pages stacked vertically."""
+
+    top: int
+    left: int
+    raw: str
+    text: str  # raw, stripped
+
+
+def _collect_boxes(items: Iterable[LTItem], yoffset: float, boxes: list[_Box | None]) -> str:
+    """Append a box per text box or figure (in reading order, a figure before its content) and return their text."""
+    texts = []
+    for item in items:
+        if isinstance(item, LTFigure):
+            index = len(boxes)
+            boxes.append(None)
+            text = _collect_boxes(item, yoffset, boxes)
+            boxes[index] = _Box(int(yoffset - item.y1), int(item.x0), text, text.strip())
+        elif isinstance(item, LTTextBox):
+            text = item.get_text()
+            boxes.append(_Box(int(yoffset - item.y1), int(item.x0), text, text.strip()))
+        elif isinstance(item, LTText):
+            text = item.get_text()
+        else:
+            continue
+        texts.append(text)
+    return "".join(texts)
+
+
+def _page_boxes(page: LTPage, yoffset: float) -> list[_Box]:
+    boxes: list[_Box | None] = []
+    _collect_boxes(page, yoffset, boxes)
+    return [box for box in boxes if box is not None]
 
 
-def _pdf2soups(filename: str) -> list[BeautifulSoup]:
-    outfp = StringIO()
+def _pdf_pages(source: Source) -> Iterator[list[_Box]]:
+    """Lay out the PDF page by page and yield the text boxes of each page."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fp:
+            yield from _pdf_pages(fp)
+        return
+    source.seek(0)
     rsrcmgr = PDFResourceManager()
-    laparams = LAParams()
-    device = HTMLConverter(rsrcmgr, outfp, laparams=laparams)
-    pages: list[BeautifulSoup] = []
-    with open(filename, "rb") as fp:
-        interpreter = PDFPageInterpreter(rsrcmgr, device)
-        for page in PDFPage.get_pages(fp, set()):
-            interpreter.process_page(page)
-            outfp.seek(0)
-            pages.append(BeautifulSoup(outfp, "html.parser"))
-            outfp.truncate(0)
-    return pages
-
-
-def _extract_pos(div: Tag) -> tuple[int, int]:
-    style = div.attrs["style"]
-    style_dict = {s.split(":")[0].strip(): s.split(":")[1].strip() for s in style.split(";") if len(s.strip()) > 0}
-    return int(style_dict["top"][:-2]), int(style_dict["left"][:-2])
-
-
-def _index_rows(divs: list[Tag], first_div_index: int) -> tuple[dict[int, int], int]:
-    top_div = divs[first_div_index]
-    top_y, top_x = _extract_pos(top_div)
-    y_to_row_index: dict[int, int] = {}
-    curr_div_index = first_div_index
-    index_last_row = first_div_index
-    max_y = top_y - 1
-    pattern = re.compile(SMALL_DATE_PATTERN)
-    while curr_div_index < len(divs):
-        div = divs[curr_div_index]
-        div_y, div_x = _extract_pos(div)
-        if div_y > max_y and div_x == top_x and pattern.match(div.text.strip()) is not None:
-            max_y = div_y
-            index_last_row = curr_div_index
-            y_to_row_index[div_y] = len(y_to_row_index)
-        curr_div_index += 1
-    return y_to_row_index, index_last_row
-
-
-def _get_closest_y(index: dict[int, int], y: int, eps: int = 1) -> int:
-    if y in index:
-        return y
-    sorted_keys = sorted(index.keys(), key=lambda k: abs(k - y))
-    if sorted_keys and abs(sorted_keys[0] - y) <= eps:
-        return sorted_keys[0]
-    return -1
+    device = PDFPageAggregator(rsrcmgr, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    yoffset: float = PAGE_MARGIN
+    for page in PDFPage.get_pages(source, set()):
+        interpreter.process_page(page)
+        layout = device.get_result()
+        yoffset += layout.y1
+        yield _page_boxes(layout, yoffset)
+        yoffset += PAGE_MARGIN
+
+
+def _index_rows(boxes: list[_Box], first_box_index: int) -> list[int]:
+    """Tops of the transaction rows (ascending): small dates aligned with the first one, going down the page."""
+    top_box = boxes[first_box_index]
+    row_tops: list[int] = []
+    max_y = top_box.top - 1
+    for box in boxes[first_box_index:]:
+        if box.top > max_y and box.left == top_box.left and _small_date_re.match(box.text) is not None:
+            max_y = box.top
+            row_tops.append(box.top)
+    return row_tops
+
+
+def _find_row(row_tops: list[int], y: int, eps: int = 1) -> int:
+    """Index of the row closest to `y` (the upper one on ties), -1 if none is within `eps`."""
+    i = bisect_left(row_tops, y)
+    if i < len(row_tops) and row_tops[i] == y:
+        return i
+    best = -1
+    for candidate in (i - 1, i):
+        if 0 <= candidate < len(row_tops) and abs(row_tops[candidate] - y) <= eps:
+            if best < 0 or abs(row_tops[candidate] - y) < abs(row_tops[best] - y):
+                best = candidate
+    return best
 
 
 def _parse_amount(s: str) -> tuple[Decimal, str]:
@@ -95,63 +126,53 @@ def _process_dates(date1: str, date2: str, _from: date, _to: date) -> tuple[date
     return fdate1, fdate2
 
 
-def _closing_debit_dates(page_soup: BeautifulSoup) -> dict[str, date]:
-    divs = page_soup.find_all("div")
-    closings = [d for d in divs if d.text.strip() == "Date de clôture"]
-    debits = [d for d in divs if d.text.strip() == "Date de débit"]
+def _closing_debit_dates(boxes: list[_Box]) -> dict[str, date]:
+    closings = [b for b in boxes if b.text == "Date de clôture"]
+    debits = [b for b in boxes if b.text == "Date de débit"]
     if len(closings) != 1 or len(debits) != 1:
         raise ValueError("no or several match(es) for closing and debit dates fields")
-    closing_y, _ = _extract_pos(closings[0])
-    debit_y, _ = _extract_pos(debits[0])
-    date_pattern = re.compile(r"[0-9]{2}/[0-9]{2}/[0-9]{4}")
-    found_divs = [
-        d for d in divs if date_pattern.match(d.text.strip()) is not None and _extract_pos(d)[0] in {closing_y, debit_y}
-    ]
-    if len(found_divs) != 2:
+    closing_y, debit_y = closings[0].top, debits[0].top
+    found = [b for b in boxes if _date_re.match(b.text) is not None and b.top in {closing_y, debit_y}]
+    if len(found) != 2:
         raise ValueError("did not find date divs for debit and closing")
-    if _extract_pos(found_divs[0])[0] == debit_y:
-        debit_div, closing_div = found_divs
+    if found[0].top == debit_y:
+        debit_box, closing_box = found
     else:
-        closing_div, debit_div = found_divs
+        closing_box, debit_box = found
     return {
-        "closing_date": datetime.strptime(closing_div.text.strip(), "%d/%m/%Y").date(),
-        "debit_date": datetime.strptime(debit_div.text.strip(), "%d/%m/%Y").date(),
+        "closing_date": datetime.strptime(closing_box.text, "%d/%m/%Y").date(),
+        "debit_date": datetime.strptime(debit_box.text, "%d/%m/%Y").date(),
     }
 
 
-def _transactions_date_range(page_soup: BeautifulSoup) -> list[date]:
-    filtered = [div for div in page_soup.find_all("div") if div.text.startswith("Transactions du")]
+def _transactions_date_range(boxes: list[_Box]) -> list[date]:
+    filtered = [b for b in boxes if b.raw.startswith("Transactions du")]
     if len(filtered) != 1:
         raise ValueError("transaction date range div cannot be found")
-    matches = re.findall(r"([0-9]{2})/([0-9]{2})/([0-9]{4})", filtered[0].text)
+    matches = re.findall(r"([0-9]{2})/([0-9]{2})/([0-9]{4})", filtered[0].raw)
     return [date(year=int(m[2]), month=int(m[1]), day=int(m[0])) for m in matches]
 
 
-def _parse_page_transactions(page_soup: BeautifulSoup) -> list[dict[str, Any]]:
-    divs = page_soup.find_all("div")
+def _parse_page_transactions(boxes: list[_Box]) -> list[dict[str, Any]]:
+    index_first_row = next((i for i, b in enumerate(boxes) if _small_date_re.match(b.text) is not None), None)
+    if index_first_row is None:
+        raise ValueError("no transaction rows found on a transactions page")
 
-    index_first_row = 0
-    small_date_pattern = re.compile(SMALL_DATE_PATTERN)
-    while small_date_pattern.match(divs[index_first_row].text.strip()) is None:
-        index_first_row += 1
+    row_tops = _index_rows(boxes, index_first_row)
 
-    y_to_row_index, _ = _index_rows(divs, index_first_row)
-
-    data = defaultdict(list)
-    for div_index in range(index_first_row, len(divs)):
-        div = divs[div_index]
-        y, _ = _extract_pos(div)
-        actual_y = _get_closest_y(y_to_row_index, y)
-        if actual_y < 0:
-            continue
-        data[y_to_row_index[actual_y]].append(div)
+    # rows in the order their first box appears
+    rows: dict[int, list[_Box]] = {}
+    for box in boxes[index_first_row:]:
+        row = _find_row(row_tops, box.top)
+        if row >= 0:
+            rows.setdefault(row, []).append(box)
 
-    debit_closing = _closing_debit_dates(page_soup)
-    date_start, date_end = _transactions_date_range(page_soup)
+    debit_closing = _closing_debit_dates(boxes)
+    date_start, date_end = _transactions_date_range(boxes)
 
     formatted = []
-    for t_divs in data.values():
-        t_data = [d.text.strip() for d in sorted(t_divs, key=lambda div: _extract_pos(div)[1])]
+    for row_boxes in rows.values():
+        t_data = [b.text for b in sorted(row_boxes, key=lambda b: b.left)]
         early_date, late_date = _process_dates(t_data[0], t_data[1], date_start, date_end)
 
         c_data = {}
@@ -191,17 +212,27 @@ def _ms_identifier(t: dict[str, Any], index: int) -> str:
     )
 
 
-def parse_pdf(filename: str) -> list[dict[str, Any]]:
-    pages = _pdf2soups(filename)
+def accepts(filename: str) -> bool:
+    return filename.lower().endswith(".pdf")
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of a PDF (the statements are the only PDFs supported)."""
+    return head.startswith(b"%PDF-")
+
+
+def parse_pdf(source: Source) -> list[dict[str, Any]]:
     all_transactions = []
-    for page_soup in pages:
-        if len([div for div in page_soup.find_all("div") if div.text.startswith("Transactions -")]) > 0:
-            all_transactions.extend(_parse_page_transactions(page_soup))
+    for boxes in _pdf_pages(source):
+        if any(b.raw.startswith("Transactions -") for b in boxes):
+            all_transactions.extend(_parse_page_transactions(boxes))
     return all_transactions
 
 
-def parse_folder(dirname: str) -> tuple[list[dict[str, Any]], set[str], dict[str, str]]:
-    """Parse all PDFs in a folder.
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[dict[str, Any]]]] = map
+) -> tuple[list[dict[str, Any]], set[str], dict[str, str]]:
+    """Parse MasterCard statement PDFs, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`.
 
     Returns:
         (transactions, account_names, account2currency)
@@ -210,10 +241,7 @@ def parse_folder(dirname: str) -> tuple[list[dict[str, Any]], set[str], dict[str
     account_names = set()
     account2currency = {}
 
-    for filename in os.listdir(dirname):
-        if not filename.lower().endswith(".pdf"):
-            continue
-        page_transactions = parse_pdf(os.path.join(dirname, filename))
+    for page_transactions in map_files(parse_pdf, sources):
         for i, t in enumerate(page_transactions):
             t["index"] = i
             t["external_id"] = _ms_identifier(t, i)
@@ -222,3 +250,46 @@ def parse_folder(dirname: str) -> tuple[list[dict[str, Any]], set[str], dict[str
         transactions.extend(page_transactions)
 
     return transactions, account_names, account2currency
+
+
+def parse_folder(dirname: str) -> tuple[list[dict[str, Any]], set[str], dict[str, str]]:
+    """Parse all PDFs in a folder, see `parse_files`."""
+    return parse_files(os.path.join(dirname, filename) for filename in os.listdir(dirname) if accepts(filename))
+
+
+def to_parsed_batch(transactions: list[dict[str, Any]]) -> ParsedBatch:
+    incoming = [t["amount"] > 0 for t in transactions]
+    n = len(transactions)
+    return ParsedBatch.from_columns(
+        "mastercard",
+        dates=[t["when"] for t in transactions],
+        amounts=[t["amount"].copy_abs() for t in transactions],
+        external_id=[t["external_id"] for t in transactions],
+        source_number=[None] * n,
+        source_name=[t["account"] if inc else None for t, inc in zip(transactions, incoming)],
+        dest_number=[None] * n,
+        dest_name=[None if inc else t["account"] for t, inc in zip(transactions, incoming)],
+        currency=[t["currency"] for t in transactions],
+        description=[""] * n,
+        metadata={
+            "country_code": [t.get("country_code") for t in transactions],
+            "country_or_site": [t.get("country_or_site") for t in transactions],
+            "closing_date": [t["closing_date"].isoformat() for t in transactions],
+            "debit_date": [t["debit_date"].isoformat() for t in transactions],
+            "value_date": [t["value_date"].isoformat() for t in transactions],
+            **{
+                key: [t.get(key, ABSENT) for t in transactions]
+                for key in ("original_amount", "original_currency", "rate_to_final")
+            },
+        },
+    )
+
+
+def iter_batches(
+    sources: Iterable[Source],
+    batch_size: int = BATCH_SIZE,
+    map_files: Callable[..., Iterable[list[dict[str, Any]]]] = map,
+) -> Iterator[ParsedBatch]:
+    """Transactions of several statements in batches. Statements are small, each one is parsed whole."""
+    transactions, _, _ = parse_files(sources, map_files=map_files)
+    yield from map(to_parsed_batch, batched(transactions, batch_size))
@@ -0,0 +1,234 @@
+"""SWIFT MT940 customer statements (text).
+
+Files are read line by line and each statement line (`:61:`) is parsed as soon as its information field (`:86:`)
+is complete, so files of any length parse in constant memory. The information field is understood in the
+`/KEY/value` (Dutch banks) and `?NN` (German banks) structured layouts, and kept as free text otherwise.
+"""
+
+import os
+import re
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from app.parsers.common import (
+    BATCH_SIZE,
+    ExternalIds,
+    ParsedBatch,
+    ParsedTransaction,
+    Source,
+    guess_encoding,
+    iter_transaction_batches,
+    open_text,
+    read_head,
+    sanitize,
+    sanitize_number,
+)
+
+DATA_SOURCE = "mt940"
+
+_FIELD = re.compile(r":(\d{2}[A-Z]?):(.*)")
+_STATEMENT_LINE = re.compile(
+    r"(?P<value_date>\d{6})(?P<entry_date>\d{4})?(?P<mark>R?[CD])(?P<funds_code>[A-Z])?(?P<amount>\d+,\d*)"
+    r"(?P<type>[NSF][A-Z0-9]{3})(?P<customer_ref>[^/\n]*)(?://(?P<bank_ref>[^\n]*))?(?:\n(?P<details>.*))?",
+    re.DOTALL,
+)
+# the end of a message: "-", or "-}" in the SWIFT envelope, possibly followed by its trailer block
+_END = re.compile(r"-(\}.*)?")
+# an IBAN, optionally followed by the currency of the account
+_IBAN = re.compile(r"([A-Z]{2}\d{2}[A-Z0-9]{10,30}?)(?:[A-Z]{3})?")
+# keys of the /KEY/value layout of the information field
+_INFO_KEY = re.compile(r"/(TRTP|IBAN|BIC|NAME|REMI|EREF|MARF|CSID|CNTP|ORDP|BENM|ADDR|PREF|RTRN|ISDT|ID)/")
+_SNIFF = re.compile(rb"^:20:.*^:25:", re.MULTILINE | re.DOTALL)
+
+
+def accepts(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1].lower() in {"sta", "mt940", "940", "swi", "txt"}
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of an MT940 statement (reference then account fields)."""
+    return _SNIFF.search(head) is not None
+
+
+def check_file(source: Source) -> bool:
+    return sniff(read_head(source))
+
+
+def _fields(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """(tag, value) of the fields of the messages, continuation lines included in the value."""
+    tag, value = None, []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _FIELD.match(line)
+        # continuation lines may start with "-" too, blocks start with "{"
+        if match is not None or _END.fullmatch(line.strip()) or line.startswith("{"):
+            if tag is not None:
+                yield tag, "\n".join(value)
+            tag, value = (match.group(1), [match.group(2)]) if match is not None else (None, [])
+        elif tag is not None:
+            value.append(line)
+    if tag is not None:
+        yield tag, "\n".join(value)
+
+
+def _account(value: str) -> str | None:
+    iban = _IBAN.fullmatch(value.replace(" ", ""))
+    if iban is not None:
+        return iban.group(1)
+    # bank code/account number, optionally followed by the currency
+    return sanitize_number(value.split("/")[-1].split()[0]) if value.strip() else None
+
+
+def _date(yymmdd: str) -> date:
+    return date(2000 + int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:6]))
+
+
+def _entry_date(value_date: date, mmdd: str | None) -> date:
+    """The booking date of a statement line, whose year is that of the value date unless they straddle new year."""
+    if mmdd is None:
+        return value_date
+    month, day = int(mmdd[:2]), int(mmdd[2:])
+    year = value_date.year
+    if month == 12 and value_date.month == 1:
+        year -= 1
+    elif month == 1 and value_date.month == 12:
+        year += 1
+    return date(year, month, day)
+
+
+def _parse_info(text: str) -> dict[str, str | None]:
+    """Counterparty name and account, remittance and end-to-end reference of an information field."""
+    flat = text.replace("\n", "")
+    if flat.startswith("/") and _INFO_KEY.match(flat):
+        parts = _INFO_KEY.split(flat)[1:]
+        values = dict(zip(parts[::2], (value.strip("/") for value in parts[1::2])))
+        name, number = values.get("NAME"), values.get("IBAN")
+        if "CNTP" in values:
+            # /CNTP/account/BIC/name/city
+            account, _, name_city = values["CNTP"].partition("/")
+            number = number or account
+            name = name or name_city.partition("/")[2].partition("/")[0]
+        remittance = values.get("REMI", "")
+        # /REMI/USTD//text or /REMI/STRD/CUR/reference
+        remittance = re.sub(r"^(USTD|STRD)/+(CUR/)?", "", remittance)
+        return {"name": name, "number": number, "communication": remittance, "end_to_end_id": values.get("EREF")}
+    if re.match(r"\d{3}\?", flat):
+        subfields: dict[str, str] = {}
+        for code, value in re.findall(r"\?(\d{2})([^?]*)", flat):
+            subfields[code] = subfields.get(code, "") + value
+        purpose = "".join(subfields.get(str(code), "") for code in range(20, 30))
+        end_to_end_id = None
+        match = re.search(r"EREF\+(.*?)(?=[A-Z]{4}\+|$)", purpose)
+        if match is not None:
+            end_to_end_id = match.group(1)
+        purpose = re.sub(r"^.*SVWZ\+", "", purpose) if "SVWZ+" in purpose else purpose
+        name = (subfields.get("32", "") + subfields.get("33", "")) or None
+        return {"name": name, "number": subfields.get("31"), "communication": purpose, "end_to_end_id": end_to_end_id}
+    return {"name": None, "number": None, "communication": text.replace("\n", " "), "end_to_end_id": None}
+
+
+def _transaction(
+    statement_line: str, info: str, account: str | None, currency: str, statement_nb: str | None, ids: ExternalIds
+) -> ParsedTransaction:
+    match = _STATEMENT_LINE.match(statement_line)
+    if match is None:
+        raise ValueError(f"Unreadable MT940 statement line: {statement_line!r}")
+    valued = _date(match.group("value_date"))
+    when = _entry_date(valued, match.group("entry_date"))
+    amount = Decimal(match.group("amount").replace(",", "."))
+    # a reversal of a debit is money coming in, and conversely
+    incoming = match.group("mark") in {"C", "RD"}
+
+    parsed = _parse_info(info)
+    other_number = sanitize_number(parsed["number"] or "")
+    other_name = sanitize(parsed["name"] or "")
+    communication = sanitize(parsed["communication"] or "")
+
+    src_number, src_name = account, None
+    dest_number, dest_name = other_number, other_name
+    if incoming:
+        src_number, src_name = other_number, other_name
+        dest_number, dest_name = account, None
+
+    bank_ref = sanitize(match.group("bank_ref") or "")
+    customer_ref = sanitize(match.group("customer_ref") or "")
+    if customer_ref == "NONREF":
+        customer_ref = None
+    signed = amount if incoming else -amount
+    key = f"{account or ''}/{when.isoformat()}/{valued.isoformat()}/{signed}/{bank_ref or customer_ref or ''}"
+
+    return ParsedTransaction(
+        external_id=ids(key, when),
+        source_number=src_number,
+        source_name=src_name,
+        dest_number=dest_number,
+        dest_name=dest_name,
+        date=when,
+        amount=amount,
+        currency=currency,
+        description=communication or sanitize(info.replace("\n", " ")) or "",
+        data_source=DATA_SOURCE,
+        raw_metadata={
+            "valued_at": valued.isoformat(),
+            "statement_nb": statement_nb,
+            "transaction_type": match.group("type"),
+            "customer_ref": customer_ref,
+            "bank_ref": bank_ref,
+            "end_to_end_id": sanitize(parsed["end_to_end_id"] or ""),
+            "communication": communication,
+            "information": sanitize(info.replace("\n", " ")),
+        },
+    )
+
+
+def iter_transactions(source: Source) -> Iterator[ParsedTransaction]:
+    """Transactions of a statement file, in file order, parsed as the file is read."""
+    ids = ExternalIds()
+    account = statement_nb = None
+    currency = "EUR"
+    statement_line: str | None = None
+    with open_text(source, guess_encoding(read_head(source)), errors="replace") as f:
+        for tag, value in _fields(f):
+            if statement_line is not None and tag != "86":
+                # a statement line without information
+                yield _transaction(statement_line, "", account, currency, statement_nb, ids)
+                statement_line = None
+            if tag == "25":
+                account = _account(value)
+            elif tag == "28C":
+                statement_nb = sanitize(value)
+            elif tag in {"60F", "60M"}:
+                # D/C mark, date, then the currency of the balance
+                currency = value[7:10]
+            elif tag == "61":
+                statement_line = value
+            elif tag == "86" and statement_line is not None:
+                yield _transaction(statement_line, value, account, currency, statement_nb, ids)
+                statement_line = None
+    if statement_line is not None:
+        yield _transaction(statement_line, "", account, currency, statement_nb, ids)
+
+
+def parse_file(source: Source) -> list[ParsedTransaction]:
+    return list(iter_transactions(source))
+
+
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[Any]]] = map
+) -> list[ParsedTransaction]:
+    """Parse several files, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`."""
+    all_transactions = []
+    for transactions in map_files(parse_file, sources):
+        all_transactions.extend(transactions)
+    return all_transactions
+
+
+def parse_folder(path: str) -> list[ParsedTransaction]:
+    return parse_files(os.path.join(path, filename) for filename in os.listdir(path) if accepts(filename))
+
+
+def iter_batches(sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]:
+    """Stream the transactions of several statement files in batches, reading each file as batches are consumed."""
+    return iter_transaction_batches((t for source in sources for t in iter_transactions(source)), batch_size)
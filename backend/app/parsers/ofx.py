@@ -0,0 +1,188 @@
+"""OFX statements, in the SGML (1.x, leaf elements not closed) and XML (2.x) flavours.
+
+Files are scanned tag by tag, a chunk at a time, and each transaction is parsed as soon as it is closed, so files
+of any length parse in constant memory. Bank and credit card statements are supported.
+"""
+
+import os
+import re
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from app.parsers.common import (
+    BATCH_SIZE,
+    ExternalIds,
+    ParsedBatch,
+    ParsedTransaction,
+    Source,
+    guess_encoding,
+    iter_transaction_batches,
+    open_text,
+    read_head,
+    sanitize,
+    sanitize_number,
+)
+
+DATA_SOURCE = "ofx"
+
+# characters read at a time
+READ_SIZE = 64 * 1024
+
+_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+_SNIFF = re.compile(rb"OFXHEADER|<OFX>", re.IGNORECASE)
+# elements holding other elements: in SGML files, an element without text is an empty leaf unless it is one of these
+_AGGREGATES = frozenset(
+    "OFX SIGNONMSGSRSV1 SONRS STATUS FI BANKMSGSRSV1 STMTTRNRS STMTRS STMTENDTRNRS STMTENDRS CREDITCARDMSGSRSV1"
+    " CCSTMTTRNRS CCSTMTRS CCSTMTENDTRNRS CCSTMTENDRS BANKACCTFROM BANKACCTTO CCACCTFROM CCACCTTO EXTBANKACCTTO"
+    " BANKTRANLIST STMTTRN PAYEE CURRENCY ORIGCURRENCY LEDGERBAL AVAILBAL BALLIST BAL IMAGEDATA".split()
+)
+_ENTITIES = {"&lt;": "<", "&gt;": ">", "&amp;": "&", "&apos;": "'", "&quot;": '"', "&nbsp;": " "}
+
+
+def accepts(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1].lower() in {"ofx", "qfx"}
+
+
+def sniff(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of an OFX document (its header or root element)."""
+    return _SNIFF.search(head) is not None
+
+
+def check_file(source: Source) -> bool:
+    return sniff(read_head(source))
+
+
+def _tags(source: Source) -> Iterator[tuple[bool, str, str]]:
+    """(closing, tag, text following the tag) of each tag of the document, in order."""
+    with open_text(source, guess_encoding(read_head(source)), errors="replace") as f:
+        pending = ""
+        while chunk := f.read(READ_SIZE):
+            pending += chunk
+            # the last tag may be cut by the read boundary: keep it for the next round
+            cut = pending.rfind("<")
+            if cut <= 0:
+                continue
+            for match in _TAG.finditer(pending, 0, cut):
+                yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+            pending = pending[cut:]
+        for match in _TAG.finditer(pending):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+
+
+def _text(value: str) -> str | None:
+    for entity, char in _ENTITIES.items():
+        value = value.replace(entity, char)
+    return sanitize(value)
+
+
+def _date(value: str) -> date:
+    # YYYYMMDD, optionally followed by the time and timezone
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def _transaction(
+    fields: dict[str, str], account: str | None, currency: str, ids: ExternalIds
+) -> ParsedTransaction | None:
+    if "TRNAMT" not in fields or "DTPOSTED" not in fields:
+        return None
+    signed = Decimal(fields["TRNAMT"].replace(",", "."))
+    incoming = signed > 0
+    when = _date(fields["DTPOSTED"])
+    other_name = fields.get("NAME") or fields.get("PAYEE.NAME")
+    other_number = sanitize_number(fields.get("BANKACCTTO.ACCTID") or fields.get("CCACCTTO.ACCTID") or "")
+    memo = fields.get("MEMO")
+
+    src_number, src_name = account, None
+    dest_number, dest_name = other_number, other_name
+    if incoming:
+        src_number, src_name = other_number, other_name
+        dest_number, dest_name = account, None
+
+    fitid = fields.get("FITID")
+    if fitid is not None:
+        external_id = f"{account or ''}/{fitid}"
+    else:
+        external_id = ids(f"{account or ''}/{when.isoformat()}/{signed}/{other_name or ''}", when)
+
+    return ParsedTransaction(
+        external_id=external_id,
+        source_number=src_number,
+        source_name=src_name,
+        dest_number=dest_number,
+        dest_name=dest_name,
+        date=when,
+        amount=abs(signed),
+        currency=fields.get("CURRENCY.CURSYM") or currency,
+        description=memo or other_name or "",
+        data_source=DATA_SOURCE,
+        raw_metadata={
+            "valued_at": _date(fields["DTUSER"]).isoformat() if "DTUSER" in fields else None,
+            "fitid": fitid,
+            "transaction_type": fields.get("TRNTYPE"),
+            "check_number": fields.get("CHECKNUM"),
+            "reference": fields.get("REFNUM"),
+            "memo": memo,
+        },
+    )
+
+
+def iter_transactions(source: Source) -> Iterator[ParsedTransaction]:
+    """Transactions of a statement file, in file order, parsed as the file is read."""
+    ids = ExternalIds()
+    account = None
+    currency = "EUR"
+    # open aggregates; leaf elements are not closed in SGML files, so aggregates are told apart by their name
+    open_elements: list[str] = []
+    transaction: dict[str, str] | None = None
+    for closing, tag, raw_text in _tags(source):
+        if closing:
+            if tag not in open_elements:
+                continue  # the closing tag of a leaf (XML flavour)
+            while open_elements.pop() != tag:
+                pass
+            if tag == "STMTTRN" and transaction is not None:
+                parsed = _transaction(transaction, account, currency, ids)
+                if parsed is not None:
+                    yield parsed
+                transaction = None
+            continue
+        text = _text(raw_text)
+        if text is None and tag in _AGGREGATES:
+            open_elements.append(tag)
+            if tag == "STMTTRN":
+                transaction = {}
+        elif text is None:
+            continue  # an empty leaf
+        elif transaction is not None:
+            # keyed by the path under STMTTRN, e.g. PAYEE.NAME
+            path = open_elements[open_elements.index("STMTTRN") + 1 :]
+            transaction[".".join([*path, tag])] = text
+        elif tag == "ACCTID" and open_elements and open_elements[-1] in {"BANKACCTFROM", "CCACCTFROM"}:
+            account = sanitize_number(text)
+        elif tag == "CURDEF":
+            currency = text
+
+
+def parse_file(source: Source) -> list[ParsedTransaction]:
+    return list(iter_transactions(source))
+
+
+def parse_files(
+    sources: Iterable[Source], map_files: Callable[..., Iterable[list[Any]]] = map
+) -> list[ParsedTransaction]:
+    """Parse several files, in order. `map_files` can spread the work, e.g. `parse_pool.map_files`."""
+    all_transactions = []
+    for transactions in map_files(parse_file, sources):
+        all_transactions.extend(transactions)
+    return all_transactions
+
+
+def parse_folder(path: str) -> list[ParsedTransaction]:
+    return parse_files(os.path.join(path, filename) for filename in os.listdir(path) if accepts(filename))
+
+
+def iter_batches(sources: Iterable[Source], batch_size: int = BATCH_SIZE) -> Iterator[ParsedBatch]:
+    """Stream the transactions of several statement files in batches, reading each file as batches are consumed."""
+    return iter_transaction_batches((t for source in sources for t in iter_transactions(source)), batch_size)
@@ -0,0 +1,41 @@
+"""The supported statement formats, and recognizing the format of a file from its first bytes."""
+
+from types import ModuleType
+
+from app.parsers import belfius, camt053, ing, mastercard, mt940, ofx
+from app.parsers.common import Source, read_head
+
+# parser of each format, in sniffing order
+PARSERS: dict[str, ModuleType] = {
+    "belfius": belfius,
+    "ing": ing,
+    "mastercard_pdf": mastercard,
+    "camt053": camt053,
+    "mt940": mt940,
+    "ofx": ofx,
+}
+
+# data source the parser of each format sets on its transactions
+DATA_SOURCES = {
+    "belfius": "belfius",
+    "ing": "ing",
+    "mastercard_pdf": "mastercard",
+    "camt053": "camt053",
+    "mt940": "mt940",
+    "ofx": "ofx",
+}
+
+# recorded as the format of an import made of files of several formats
+MIXED = "mixed"
+
+
+def sniff_format(source: Source) -> str | None:
+    """Format of a file, recognized from its first few KB (PDF magic, CSV header row). None if not supported."""
+    head = read_head(source)
+    return next((name for name, parser in PARSERS.items() if parser.sniff(head)), None)
+
+
+def data_source_of(formats: list[str]) -> str:
+    """Data source of an import of files in `formats`: the common one, or MIXED."""
+    data_sources = {DATA_SOURCES[name] for name in formats}
+    return data_sources.pop() if len(data_sources) == 1 else MIXED
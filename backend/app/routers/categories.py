@@ -1,11 +1,11 @@
 import re
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import delete, update
+from sqlalchemy import delete, insert, update
 from sqlalchemy.orm import Session
 
 from app.dependencies import get_current_user, get_db
-from app.models import Category, CategorySplit, MLModel, User
+from app.models import Category, CategorySplit, LabelEvent, MLModel, User
 from app.schemas.category import CategoryCreate, CategoryResponse, CategoryUpdate
 
 router = APIRouter()
@@ -72,6 +72,7 @@ def delete_category(category_id: int, db: Session = Depends(get_db), _user: User
     db.execute(delete(CategorySplit).where(CategorySplit.id_category == category_id))
     # delete
     db.execute(delete(Category).where(Category.id == category_id))
+    db.execute(insert(LabelEvent).values(kind="tree", id_category=category_id))
     # invalidate ML models
     db.execute(update(MLModel).where(MLModel.state != "deleted").values(state="invalid"))
 
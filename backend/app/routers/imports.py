@@ -1,109 +1,291 @@
-import os
+import hashlib
+import logging
 import tempfile
+from collections.abc import Iterator
+from functools import partial
+from itertools import chain
+from typing import Any, BinaryIO
 
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.dependencies import get_current_user, get_db
 from app.models import Account, ImportRecord, Transaction, User
-from app.parsers import belfius, ing, mastercard
-from app.schemas.import_record import ImportRecordResponse
+from app.parsers import mastercard
+from app.parsers.common import BatchParser
+from app.parsers.registry import DATA_SOURCES, PARSERS, data_source_of, sniff_format
+from app.schemas.import_record import (
+    ImportDeletionResponse,
+    ImportJobResponse,
+    ImportPreviewResponse,
+    ImportRecordResponse,
+)
 from app.schemas.account import AccountResponse
 from app.schemas.transaction import TransactionResponse
-from app.services.import_service import import_parsed_transactions
+from app.services import parse_cache, parse_pool
+from app.services.import_jobs import ImportJob, get_job, submit_import
+from app.services.import_service import (
+    ImportDeletion,
+    ImportPreview,
+    PreviewFile,
+    SkippedFile,
+    delete_import,
+    find_imported_files,
+    import_batches,
+    preview_batches,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
+FORMAT_NAMES = {"belfius": "Belfius", "ing": "ING", "camt053": "CAMT.053", "mt940": "MT940", "ofx": "OFX"}
+# detect the format of each file rather than expect one
+AUTO_FORMAT = "auto"
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
-@router.post("/upload", response_model=ImportRecordResponse)
+
+def _iter_format_batches(uploads: list[BinaryIO], format: str, content_hashes: list[str]) -> Iterator[Any]:
+    if format == "mastercard_pdf":
+        # statement PDFs are small but slow to lay out: parse them in parallel, whole, unless already cached
+        map_files = partial(parse_cache.map_cached, content_hashes=content_hashes, map_files=parse_pool.map_files)
+        return mastercard.iter_batches(uploads, map_files=map_files)
+    # CSV exports can be huge: read them chunk by chunk in the calling thread
+    iter_batches: BatchParser = PARSERS[format].iter_batches
+    return iter_batches(uploads)
+
+
+def _iter_batches(
+    uploads: list[BinaryIO], format: str, files: list[tuple[str, str, str]]
+) -> tuple[Iterator[Any], str]:
+    """Parsed batches of the uploads and their data source.
+
+    `files` holds the (filename, content hash, format) of each upload. The files of each format are parsed
+    together, formats in registry order, so the batches of a resumed import come in the same order.
+    """
+    by_format = [
+        (name, [(upload, content_hash) for upload, (_, content_hash, f) in zip(uploads, files) if f == name])
+        for name in PARSERS
+    ]
+    batches = chain.from_iterable(
+        _iter_format_batches([upload for upload, _ in group], name, [content_hash for _, content_hash in group])
+        for name, group in by_format
+        if group
+    )
+    if format != AUTO_FORMAT:
+        return batches, DATA_SOURCES[format]
+    return batches, data_source_of([file_format for _, _, file_format in files])
+
+
+def _run_import(
+    uploads: list[BinaryIO],
+    format: str,
+    filenames: list[str],
+    files: list[tuple[str, str, str]],
+    resume_import: int | None,
+    db: Session,
+    job: ImportJob,
+) -> int:
+    """Stream the spooled uploads through the import, batch by batch. Runs in an import worker thread."""
+    try:
+        batches, data_source = _iter_batches(uploads, format, files)
+        resume = db.get(ImportRecord, resume_import) if resume_import is not None else None
+        record = import_batches(db, batches, data_source, filenames=filenames, progress=job, resume=resume, files=files)
+        _predict_import(db, record.id)
+        return record.id
+    finally:
+        for upload in uploads:
+            upload.close()
+
+
+def _predict_import(db: Session, id_import: int) -> None:
+    """Store the predicted categories of the new transactions. The import is done even if this fails."""
+    from app.ml.predictor import InferenceError
+    from app.services.prediction_service import fill_predictions
+
+    try:
+        fill_predictions(db, id_import=id_import)
+    except InferenceError:
+        logger.exception("Could not predict the categories of import %d", id_import)
+        db.rollback()
+
+
+async def _spool(file: UploadFile) -> tuple[BinaryIO, str]:
+    """Copy an upload chunk by chunk into a file the import job owns (the request closes `file` when it ends).
+
+    Returns the spooled file and the sha256 hex digest of its content.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.upload_spool_size)
+    digest = hashlib.sha256()
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            spooled.write(chunk)
+            digest.update(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, digest.hexdigest()  # type: ignore[return-value]
+
+
+def _check_format(format: str, id_mscard_account: int | None) -> None:
+    if format != AUTO_FORMAT and format not in PARSERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported format: {format}")
+    _check_mscard_account([format], id_mscard_account)
+
+
+def _check_mscard_account(formats: list[str], id_mscard_account: int | None) -> None:
+    if "mastercard_pdf" in formats and id_mscard_account is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="id_mscard_account required for MasterCard import"
+        )
+
+
+def _file_format(upload: BinaryIO, filename: str, format: str) -> str:
+    """Format of a spooled upload: sniffed in auto mode, else `format` once the file is checked against it."""
+    if format == AUTO_FORMAT:
+        file_format = sniff_format(upload)
+        if file_format is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unrecognized file format: {filename}"
+            )
+        return file_format
+    if format in FORMAT_NAMES and not PARSERS[format].check_file(upload):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File format not matching {FORMAT_NAMES[format]} data source",
+        )
+    return format
+
+
+async def _spool_accepted(
+    files: list[UploadFile], filenames: list[str], format: str, id_mscard_account: int | None
+) -> tuple[list[BinaryIO], list[tuple[str, str, str]]]:
+    """Spool the files of the upload, checking or detecting their format. Returns them with (filename, hash, format).
+
+    With an explicit format, the files its parser does not accept (by extension) are left out, also from
+    `filenames`. Fails if no file is left.
+    """
+    if format != AUTO_FORMAT:
+        accepted = [(filename, file) for filename, file in zip(filenames, files) if PARSERS[format].accepts(filename)]
+        filenames[:] = [filename for filename, _ in accepted]
+        files = [file for _, file in accepted]
+    if not files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No file to import as {FORMAT_NAMES.get(format, format)} data",
+        )
+    uploads: list[BinaryIO] = []
+    hashed: list[tuple[str, str, str]] = []
+    try:
+        for filename, file in zip(filenames, files):
+            upload, content_hash = await _spool(file)
+            uploads.append(upload)
+            hashed.append((filename, content_hash, _file_format(upload, filename, format)))
+        _check_mscard_account([file_format for _, _, file_format in hashed], id_mscard_account)
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    return uploads, hashed
+
+
+def _drop_imported(
+    db: Session, uploads: list[BinaryIO], hashed: list[tuple[str, str, str]], filenames: list[str]
+) -> tuple[list[BinaryIO], list[tuple[str, str, str]], list[SkippedFile]]:
+    """Close and leave out the uploads already imported (or copies of another upload), also from `filenames`."""
+    imported = find_imported_files(db, (content_hash for _, content_hash, _ in hashed))
+    seen: set[str] = set()
+    keep = []
+    skipped = []
+    for upload, (filename, content_hash, _) in zip(uploads, hashed):
+        keep.append(content_hash not in imported and content_hash not in seen)
+        seen.add(content_hash)
+        if not keep[-1]:
+            skipped.append(SkippedFile(filename=filename, id_import=imported.get(content_hash)))
+            filenames.remove(filename)
+            upload.close()
+    uploads = [upload for upload, kept in zip(uploads, keep) if kept]
+    hashed = [file for file, kept in zip(hashed, keep) if kept]
+    return uploads, hashed, skipped
+
+
+def _check_resumable(db: Session, id_import: int) -> None:
+    record = db.get(ImportRecord, id_import)
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import record not found")
+    if record.checkpoint is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Import has already completed")
+
+
+@router.post("/upload", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_files(
     files: list[UploadFile],
-    format: str = Query(...),
+    format: str = Query(default=AUTO_FORMAT),
     id_mscard_account: int | None = Query(default=None),
+    resume: int | None = Query(default=None),
     db: Session = Depends(get_db),
     _user: User = Depends(get_current_user),
-) -> ImportRecord:
-    if format not in {"belfius", "ing", "mastercard_pdf"}:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported format: {format}")
+) -> ImportJob:
+    """Spool the uploaded files and queue their import. Poll GET /imports/jobs/{id} for progress.
+
+    Files whose content was already imported are skipped, the job lists them with the import that has them. If
+    all files are skipped the job finishes right away, pointing at that import. `resume` continues an
+    interrupted import of the same files from its last committed batch (nothing is skipped then).
+
+    With the default `auto` format, the format of each file is recognized from its first bytes, so one upload
+    can mix the statements of several banks. The record then has the `mixed` format, and lists each file with
+    its own.
+    """
+    _check_format(format, id_mscard_account)
+    if resume is not None:
+        await run_in_threadpool(_check_resumable, db, resume)
 
     filenames = [f.filename or f"file_{i}" for i, f in enumerate(files)]
+    # the job owns the spooled files and closes them once done
+    uploads, hashed = await _spool_accepted(files, filenames, format, id_mscard_account)
+    skipped: list[SkippedFile] = []
+    if resume is None:
+        uploads, hashed, skipped = await run_in_threadpool(_drop_imported, db, uploads, hashed, filenames)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # save uploaded files
-        for i, file in enumerate(files):
-            ext = os.path.splitext(file.filename or "")[1] or ""
-            filepath = os.path.join(tmpdir, f"{i}{ext}")
-            content = await file.read()
-            with open(filepath, "wb") as f:
-                f.write(content)
-
-        if format == "belfius":
-            if not belfius.check_files(tmpdir):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, detail="File format not matching Belfius data source"
-                )
-            parsed = belfius.parse_folder(tmpdir)
-            import_record = import_parsed_transactions(db, parsed, "belfius", filenames=filenames)
+    if skipped and not uploads:
+        first_import = next(s.id_import for s in skipped if s.id_import is not None)
+        return submit_import(lambda db, job: first_import, skipped_files=skipped)
+    return submit_import(partial(_run_import, uploads, format, filenames, hashed, resume), skipped_files=skipped)
 
-        elif format == "ing":
-            if not ing.check_files(tmpdir):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, detail="File format not matching ING data source"
-                )
-            parsed = ing.parse_folder(tmpdir)
-            import_record = import_parsed_transactions(db, parsed, "ing", filenames=filenames)
 
-        elif format == "mastercard_pdf":
-            if id_mscard_account is None:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, detail="id_mscard_account required for MasterCard import"
-                )
-            raw_transactions, account_names, account2currency = mastercard.parse_folder(tmpdir)
-
-            # convert mastercard dicts to ParsedTransactions
-            from app.parsers.common import ParsedTransaction
-
-            parsed = []
-            for t in raw_transactions:
-                amount = t["amount"]
-                src_name, dest_name = None, t["account"]
-                if amount > 0:
-                    src_name, dest_name = t["account"], None
-
-                parsed.append(
-                    ParsedTransaction(
-                        external_id=t["external_id"],
-                        source_number=None,
-                        source_name=src_name,
-                        dest_number=None,
-                        dest_name=dest_name,
-                        date=t["when"],
-                        amount=amount.copy_abs(),
-                        currency=t["currency"],
-                        description="",
-                        data_source="mastercard",
-                        raw_metadata={
-                            "country_code": t.get("country_code"),
-                            "country_or_site": t.get("country_or_site"),
-                            "closing_date": t["closing_date"].isoformat(),
-                            "debit_date": t["debit_date"].isoformat(),
-                            "value_date": t["value_date"].isoformat(),
-                            **(
-                                {
-                                    "original_amount": t["original_amount"],
-                                    "original_currency": t["original_currency"],
-                                    "rate_to_final": t["rate_to_final"],
-                                }
-                                if "original_amount" in t
-                                else {}
-                            ),
-                        },
-                    )
-                )
-            import_record = import_parsed_transactions(db, parsed, "mastercard", filenames=filenames)
+@router.post("/preview", response_model=ImportPreviewResponse)
+async def preview_files(
+    files: list[UploadFile],
+    format: str = Query(default=AUTO_FORMAT),
+    id_mscard_account: int | None = Query(default=None),
+    db: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+) -> ImportPreview:
+    """What uploading the files would do (statistics and samples), computed without writing anything."""
+    _check_format(format, id_mscard_account)
+    filenames = [f.filename or f"file_{i}" for i, f in enumerate(files)]
+    uploads, hashed = await _spool_accepted(files, filenames, format, id_mscard_account)
+    try:
+        uploads, hashed, skipped = await run_in_threadpool(_drop_imported, db, uploads, hashed, filenames)
+        batches, data_source = _iter_batches(uploads, format, hashed)
+        preview = await run_in_threadpool(preview_batches, db, batches, data_source)
+    finally:
+        for upload in uploads:
+            upload.close()
+    preview.files = [PreviewFile(filename, file_format) for filename, _, file_format in hashed]
+    preview.skipped_files = skipped
+    return preview
+
 
-    return import_record
+@router.get("/jobs/{job_id}", response_model=ImportJobResponse)
+def get_import_job(job_id: str, _user: User = Depends(get_current_user)) -> ImportJob:
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
 
 
 @router.get("", response_model=list[ImportRecordResponse])
@@ -129,6 +311,19 @@ def get_import(
     return record
 
 
+@router.delete("/{import_id}", response_model=ImportDeletionResponse)
+def delete_import_record(
+    import_id: int,
+    db: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+) -> ImportDeletion:
+    """Undo an import: remove its transactions, the accounts only it created and the record itself."""
+    record = db.get(ImportRecord, import_id)
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import record not found")
+    return delete_import(db, record)
+
+
 @router.get("/{import_id}/transactions", response_model=list[TransactionResponse])
 def get_import_transactions(
     import_id: int,
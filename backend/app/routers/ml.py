@@ -34,18 +34,21 @@ def train_model(db: Session = Depends(get_db), _user: User = Depends(get_current
 def predict_transactions(
     body: PredictRequest, db: Session = Depends(get_db), _user: User = Depends(get_current_user)
 ) -> PredictResponse:
-    from app.ml.predictor import InferenceError, NoValidModelError, predict_categories
+    from app.ml.predictor import InferenceError, NoValidModelError
+    from app.services.prediction_service import get_predictions
 
     transactions = db.query(Transaction).filter(Transaction.id.in_(body.transaction_ids)).all()
     if not transactions:
         return PredictResponse(predictions=[])
 
     try:
-        results = predict_categories(db, transactions)
+        results = get_predictions(db, transactions)
     except NoValidModelError:
         return PredictResponse(predictions=[])
     except InferenceError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    # keep the predictions of misses
+    db.commit()
 
     category_map = {c.id: c for c in db.query(Category).all()}
     predictions = []
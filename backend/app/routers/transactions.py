@@ -1,4 +1,5 @@
 import datetime
+import logging
 import uuid
 from decimal import Decimal
 from typing import Any
@@ -26,6 +27,7 @@ from app.schemas.transaction import (
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 def _build_transaction_query(
@@ -175,9 +177,10 @@ def list_transactions(
     import_id: int | None = None,
     exclude_grouped: bool = False,
     category: int | None = None,
+    with_predictions: bool = False,
     db: Session = Depends(get_db),
     _user: User = Depends(get_current_user),
-) -> list[Transaction]:
+) -> list[Transaction] | list[TransactionResponse]:
     q = _build_transaction_query(
         db,
         account=account,
@@ -201,9 +204,45 @@ def list_transactions(
         category=category,
     )
     results = db.execute(q.offset(start).limit(count)).scalars().unique().all()
+    if with_predictions:
+        return _with_predictions(db, list(results))
     return list(results)
 
 
+def _with_predictions(db: Session, transactions: list[Transaction]) -> list[TransactionResponse]:
+    """Responses with the predicted category of uncategorised transactions (none if prediction is unavailable)."""
+    from app.ml.predictor import InferenceError, NoValidModelError
+    from app.services.prediction_service import get_predictions
+
+    uncategorised = [t for t in transactions if not t.category_splits]
+    try:
+        results = get_predictions(db, uncategorised)
+        db.commit()
+    except NoValidModelError:
+        results = []
+    except InferenceError:
+        logger.exception("Could not predict the categories of listed transactions")
+        results = []
+
+    category_map = {c.id: c for c in db.query(Category).all()}
+    predictions = {}
+    for t, (cat_id, prob) in zip(uncategorised, results):
+        cat = category_map.get(cat_id) if cat_id is not None else None
+        # If predicted category no longer exists (stale model), no prediction
+        if cat is not None:
+            predictions[t.id] = PredictionItem(
+                transaction_id=t.id,
+                category_id=cat.id,
+                category_name=cat.name,
+                category_color=cat.color,
+                probability=round(prob, 4),
+            )
+    return [
+        TransactionResponse.model_validate(t).model_copy(update={"prediction": predictions.get(t.id)})
+        for t in transactions
+    ]
+
+
 @router.get("/count", response_model=TransactionCountResponse)
 def count_transactions(
     account: int | None = None,
@@ -451,6 +490,8 @@ def update_transaction(
     if t.data_source != "manual":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot edit a non-manual transaction")
 
+    from app.services.prediction_service import MODEL_INPUTS, drop_predictions
+
     update_data = body.model_dump(exclude_unset=True)
 
     # handle amount sign flip
@@ -463,6 +504,8 @@ def update_transaction(
 
     for key, value in update_data.items():
         setattr(t, key, value)
+    if MODEL_INPUTS.intersection(update_data):
+        drop_predictions(db, [t.id])
 
     db.commit()
     db.refresh(t)
@@ -619,15 +662,17 @@ def unset_duplicate(
 def predict_single(
     transaction_id: int, db: Session = Depends(get_db), _user: User = Depends(get_current_user)
 ) -> PredictionItem:
-    from app.ml.predictor import InferenceError, NoValidModelError, predict_category
+    from app.ml.predictor import InferenceError, NoValidModelError
     from app.models import Category
+    from app.services.prediction_service import get_predictions
 
     t = db.get(Transaction, transaction_id)
     if t is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
 
     try:
-        cat_id, prob = predict_category(db, t)
+        [(cat_id, prob)] = get_predictions(db, [t])
+        db.commit()
     except NoValidModelError:
         return PredictionItem(
             transaction_id=t.id, category_id=None, category_name=None, category_color=None, probability=0.0
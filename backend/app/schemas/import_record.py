@@ -1,8 +1,16 @@
 import datetime
+from decimal import Decimal
 
 from pydantic import BaseModel
 
 
+class ImportFileResponse(BaseModel):
+    filename: str
+    format: str | None
+
+    model_config = {"from_attributes": True}
+
+
 class ImportRecordResponse(BaseModel):
     id: int
     created_at: datetime.datetime
@@ -16,5 +24,86 @@ class ImportRecordResponse(BaseModel):
     auto_tagged: int
     date_earliest: datetime.date | None
     date_latest: datetime.date | None
+    timings: dict[str, float] | None = None
+    checkpoint: int | None = None
+    files: list[ImportFileResponse] = []
+
+    model_config = {"from_attributes": True}
+
+
+class ImportDeletionResponse(BaseModel):
+    transactions: int
+    category_splits: int
+    duplicates_cleared: int
+    groups_dissolved: int
+    accounts: int
+
+    model_config = {"from_attributes": True}
+
+
+class SkippedFileResponse(BaseModel):
+    filename: str
+    id_import: int | None
+
+    model_config = {"from_attributes": True}
+
+
+class ImportJobResponse(BaseModel):
+    id: str
+    status: str
+    stage: str
+    rows_total: int
+    rows_processed: int
+    timings: dict[str, float]
+    id_import: int | None
+    error: str | None
+    skipped_files: list[SkippedFileResponse] = []
+
+
+class PreviewRowResponse(BaseModel):
+    external_id: str
+    date: datetime.date
+    amount: Decimal
+    description: str
+    status: str
+    id_source: int | None
+    id_dest: int | None
+    id_duplicate_of: int | None
+    id_category: int | None
+
+    model_config = {"from_attributes": True}
+
+
+class PreviewAccountResponse(BaseModel):
+    number: str | None
+    name: str | None
+
+    model_config = {"from_attributes": True}
+
+
+class DuplicatePairResponse(BaseModel):
+    external_id: str
+    id_duplicate_of: int | None
+
+    model_config = {"from_attributes": True}
+
+
+class ImportPreviewResponse(BaseModel):
+    format: str
+    files: list[ImportFileResponse]
+    total_transactions: int
+    new_transactions: int
+    duplicate_transactions: int
+    skipped_transactions: int
+    new_accounts: int
+    auto_tagged: int
+    date_earliest: datetime.date | None
+    date_latest: datetime.date | None
+    skipped_ids: list[str]
+    duplicates: list[DuplicatePairResponse]
+    accounts: list[PreviewAccountResponse]
+    sample: list[PreviewRowResponse]
+    skipped_files: list[SkippedFileResponse]
+    timings: dict[str, float]
 
     model_config = {"from_attributes": True}
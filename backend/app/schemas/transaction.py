@@ -5,6 +5,7 @@ from pydantic import BaseModel
 
 from app.schemas.account import AccountResponse, CurrencyResponse
 from app.schemas.category import CategoryResponse
+from app.schemas.ml import PredictionItem
 
 
 class CategorySplitItem(BaseModel):
@@ -46,6 +47,7 @@ class TransactionResponse(BaseModel):
     dest: AccountResponse | None = None
     currency: CurrencyResponse
     category_splits: list[CategorySplitResponse] = []
+    prediction: PredictionItem | None = None  # listed with `with_predictions`, for uncategorised transactions
 
     model_config = {"from_attributes": True}
 
@@ -0,0 +1,96 @@
+"""Background import jobs: uploads are parsed and imported in worker threads while clients poll progress.
+
+Jobs are kept in memory, in the process that received the upload: polling only works when the API runs as a single
+server process (uvicorn without --workers). The outcome of a job is also kept in its ImportRecord.
+"""
+
+import logging
+import threading
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.import_service import ImportProgress, SkippedFile
+
+logger = logging.getLogger(__name__)
+
+MAX_FINISHED_JOBS = 100
+
+_executor: ThreadPoolExecutor | None = None
+_jobs: dict[str, "ImportJob"] = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class ImportJob(ImportProgress):
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued, running, done, failed
+    id_import: int | None = None
+    error: str | None = None
+    skipped_files: list[SkippedFile] = field(default_factory=list)
+    future: "Future[None] | None" = field(default=None, repr=False)
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Block until the job has finished (used by tests and scripts)."""
+        if self.future is not None:
+            self.future.result(timeout=timeout)
+
+
+ImportRunner = Callable[[Session, ImportJob], int]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.import_workers, thread_name_prefix="import")
+    return _executor
+
+
+def _prune() -> None:
+    finished = [job_id for job_id, job in _jobs.items() if job.status in {"done", "failed"}]
+    for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _run(job: ImportJob, runner: ImportRunner) -> None:
+    from app.database import SessionLocal
+
+    job.status = "running"
+    db = SessionLocal()
+    try:
+        job.id_import = runner(db, job)
+        job.status = "done"
+        job.stage = "done"
+    except Exception as e:
+        logger.exception("Import job %s failed during stage '%s'", job.id, job.stage)
+        db.rollback()
+        job.error = str(e) or e.__class__.__name__
+        job.status = "failed"
+    finally:
+        db.close()
+
+
+def submit_import(runner: ImportRunner, skipped_files: list[SkippedFile] | None = None) -> ImportJob:
+    """Queue an import. `runner` gets its own session and the job, and returns the ImportRecord id."""
+    job = ImportJob(skipped_files=skipped_files or [])
+    with _lock:
+        _prune()
+        _jobs[job.id] = job
+    job.future = _get_executor().submit(_run, job, runner)
+    return job
+
+
+def get_job(job_id: str) -> ImportJob | None:
+    return _jobs.get(job_id)
+
+
+def shutdown_import_jobs() -> None:
+    """Stop accepting jobs; running imports finish in the background."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
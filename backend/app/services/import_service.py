@@ -1,212 +1,838 @@
 """Import service: handles file parsing, account resolution, duplicate detection, and transaction creation."""
 
-import bisect
 import datetime
 import logging
+import time
+from collections.abc import Iterable, Iterator, Sequence, Set
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from decimal import Decimal
+from itertools import islice
+from typing import Any, cast
 
-from sqlalchemy import func, select
+from sqlalchemy import ColumnElement, CursorResult, Executable, delete, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.models import Account, AccountAlias, Currency, ImportRecord, Transaction
-from app.parsers.common import ParsedTransaction
+from app.models import (
+    Account,
+    AccountAlias,
+    CategorySplit,
+    Currency,
+    ImportFile,
+    ImportRecord,
+    LabelEvent,
+    TagRule,
+    Transaction,
+    TransactionGroup,
+    TransactionPrediction,
+    WalletAccount,
+)
+from app.parsers.common import BATCH_SIZE, ParsedTransaction, TransactionBatch, TransactionLike, batched
+from app.services.tag_rule_service import find_matching_rule, get_active_rules
 
 logger = logging.getLogger(__name__)
 
+EXISTENCE_CHECK_CHUNK_SIZE = 500
+PREVIEW_SAMPLE_SIZE = 50
 
-def resolve_account(
-    db: Session, number: str | None, name: str | None, id_currency: int, *, _new_account_ids: set[int] | None = None
-) -> Account | None:
-    """Find or create an account by number/name.
 
-    If _new_account_ids is provided, newly created account ids are added to it.
+class AccountResolver:
+    """Resolves accounts for a whole import batch from in-memory indexes.
+
+    Accounts and aliases are loaded once. Lookups try, in order: number, alias number, name, alias name. Unknown
+    accounts are staged under negative placeholder ids (so later rows of the batch resolve to them) and inserted in
+    one statement by create_pending().
     """
-    if number is None and name is None:
+
+    def __init__(self, db: Session) -> None:
+        self._db = db
+        self._by_number: dict[str, int] = {}
+        self._by_name: dict[str, int] = {}
+        self._alias_by_number: dict[str, int] = {}
+        self._alias_by_name: dict[str, int] = {}
+        self._pending: list[dict[str, object]] = []
+        self._created: dict[int, int] = {}
+        self.new_account_ids: set[int] = set()
+
+        # ordered by id so that the first match wins, like .first() on the original queries
+        for id_account, number, name in db.execute(
+            select(Account.id, Account.number, Account.name).order_by(Account.id)
+        ):
+            self._index(self._by_number, self._by_name, number, name, id_account)
+        for id_account, number, name in db.execute(
+            select(AccountAlias.id_account, AccountAlias.number, AccountAlias.name).order_by(AccountAlias.id)
+        ):
+            self._index(self._alias_by_number, self._alias_by_name, number, name, id_account)
+
+    @staticmethod
+    def _index(
+        by_number: dict[str, int], by_name: dict[str, int], number: str | None, name: str | None, id_account: int
+    ) -> None:
+        if number is not None:
+            by_number.setdefault(number, id_account)
+        if name is not None:
+            by_name.setdefault(name, id_account)
+
+    def lookup(self, number: str | None, name: str | None) -> int | None:
+        """Return the id (or placeholder id) of a known account, without creating anything."""
+        if number is not None:
+            found = self._by_number.get(number, self._alias_by_number.get(number))
+            if found is not None:
+                return found
+        if name is not None:
+            return self._by_name.get(name, self._alias_by_name.get(name))
         return None
 
-    # try by number first
-    if number is not None:
-        account = db.query(Account).filter(Account.number == number).first()
-        if account:
-            return account
-        # try aliases
-        alias = db.query(AccountAlias).filter(AccountAlias.number == number).first()
-        if alias:
-            return db.get(Account, alias.id_account)
-
-    # try by name
-    if name is not None:
-        account = db.query(Account).filter(Account.name == name).first()
-        if account:
-            return account
-        alias = db.query(AccountAlias).filter(AccountAlias.name == name).first()
-        if alias:
-            return db.get(Account, alias.id_account)
-
-    # create new account
-    account = Account(number=number, name=name, initial_balance=0, id_currency=id_currency)
-    db.add(account)
-    db.flush()
-    if _new_account_ids is not None:
-        _new_account_ids.add(account.id)
-    return account
-
-
-def find_duplicates(db: Session, transactions: list[Transaction]) -> dict[str | None, int | None]:
-    """Find duplicate transactions. Returns mapping of external_id -> id of the original."""
-
-    def key_fn(t: Transaction) -> tuple[int, int, datetime.date, Decimal]:
-        return (t.id_source or -1, t.id_dest or -1, t.date, t.amount)
-
-    remaining = list(transactions)
-    checked: list[Transaction] = []
+    def resolve(self, number: str | None, name: str | None, id_currency: int) -> int | None:
+        """Find an account or stage a new one. Staged accounts get a negative placeholder id."""
+        if number is None and name is None:
+            return None
+        found = self.lookup(number, name)
+        if found is not None:
+            return found
+        placeholder = -(len(self._pending) + 1)
+        self._pending.append({"number": number, "name": name, "initial_balance": 0, "id_currency": id_currency})
+        self._index(self._by_number, self._by_name, number, name, placeholder)
+        return placeholder
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def staged_accounts(self) -> list[tuple[str | None, str | None]]:
+        """(number, name) of the accounts staged and not created yet."""
+        return [(account["number"], account["name"]) for account in self._pending]  # type: ignore[misc]
+
+    def create_pending(self, id_import: int | None = None) -> None:
+        """Insert all staged accounts in a single statement, recording the import that creates them."""
+        if not self._pending:
+            return
+        ids = self._db.scalars(
+            insert(Account).values(id_import=id_import).returning(Account.id, sort_by_parameter_order=True),
+            self._pending,
+        ).all()
+        for i, id_account in enumerate(ids):
+            self._created[-(i + 1)] = id_account
+        for index in (self._by_number, self._by_name):
+            for key, value in index.items():
+                if value < 0:
+                    index[key] = self._created[value]
+        self.new_account_ids.update(ids)
+        self._pending = []
+
+    def real_id(self, id_account: int | None) -> int | None:
+        """Translate a placeholder id returned by resolve() once create_pending() has run."""
+        if id_account is None or id_account >= 0:
+            return id_account
+        return self._created[id_account]
+
+
+def _account_in(column: Any, ids: Set[int | None]) -> ColumnElement[bool]:
+    """`column` is one of `ids`, None standing for a missing account."""
+    known = [id_account for id_account in ids if id_account is not None]
+    condition = column.in_(known)
+    return or_(condition, column.is_(None)) if None in ids else condition
+
+
+def find_duplicates(db: Session, transactions: Sequence[Any]) -> dict[str | None, int | None]:
+    """Find duplicate transactions. Returns mapping of external_id -> id of the original.
+
+    Candidates are fetched with one query bounded by the batch's date range and accounts, then matched
+    in memory on (id_source, id_dest, date, amount). Transactions that only duplicate another transaction
+    of the batch map to None.
+    """
+    if not transactions:
+        return {}
+
+    dates = [t.date for t in transactions]
+    candidates = db.execute(
+        select(Transaction.id, Transaction.id_source, Transaction.id_dest, Transaction.date, Transaction.amount)
+        .where(
+            Transaction.date.between(min(dates), max(dates)),
+            _account_in(Transaction.id_source, {t.id_source for t in transactions}),
+            _account_in(Transaction.id_dest, {t.id_dest for t in transactions}),
+            Transaction.id_duplicate_of.is_(None),
+        )
+        .order_by(Transaction.id)
+    )
+    # missing accounts (one-sided card transactions) are keyed by None, so they match each other as in SQL IS NULL
+    originals: dict[tuple[int | None, int | None, datetime.date, Decimal], int] = {}
+    for id_transaction, id_source, id_dest, date, amount in candidates:
+        originals.setdefault((id_source, id_dest, date, amount), id_transaction)
+
+    # walk the batch backwards so that, within the batch, the last occurrence is kept as the original
+    checked: set[tuple[int | None, int | None, datetime.date, Decimal]] = set()
     duplicate_map: dict[str | None, int | None] = {}
+    for t in reversed(transactions):
+        original = originals.get((t.id_source, t.id_dest, t.date, t.amount))
+        if original is not None:
+            duplicate_map[t.external_id] = original
+            continue
+        key = (t.id_source, t.id_dest, t.date, t.amount)
+        if key in checked:
+            duplicate_map[t.external_id] = None  # dup within batch, will resolve after flush
+        else:
+            checked.add(key)
 
-    while remaining:
-        t = remaining.pop()
-        results = (
-            db.execute(
-                select(Transaction).where(
-                    Transaction.id_source == t.id_source,
-                    Transaction.id_dest == t.id_dest,
-                    Transaction.date == t.date,
-                    Transaction.amount == t.amount,
-                    Transaction.id_duplicate_of.is_(None),
-                )
+    return duplicate_map
+
+
+@dataclass
+class ImportProgress:
+    """Current stage, processed rows and cumulated per-stage durations (seconds) of an import."""
+
+    stage: str = "queued"
+    rows_total: int = 0
+    rows_processed: int = 0
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def track(self, stage: str) -> Iterator[None]:
+        self.stage = stage
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+@dataclass(slots=True)
+class _ImportRow:
+    """A transaction on its way into the database, written without going through ORM objects."""
+
+    external_id: str
+    id_source: int | None
+    id_dest: int | None
+    date: datetime.date
+    amount: Decimal
+    id_currency: int
+    description: str
+    raw_metadata: dict[str, object]
+    data_source: str
+    id_duplicate_of: int | None = None
+    id_category: int | None = None
+    id: int | None = None
+
+
+def insert_transactions(db: Session, rows: Sequence[_ImportRow], id_import: int) -> None:
+    """Write rows with batched multi-row INSERT ... RETURNING and their auto-tag splits with a second one.
+
+    Duplicate references and auto-tagging flags are part of the inserted values, so no row is touched twice.
+    """
+    ids = db.scalars(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+        [
+            {
+                "external_id": row.external_id,
+                "id_source": row.id_source,
+                "id_dest": row.id_dest,
+                "date": row.date,
+                "raw_metadata": row.raw_metadata,
+                "amount": row.amount,
+                "id_currency": row.id_currency,
+                "data_source": row.data_source,
+                "id_duplicate_of": row.id_duplicate_of,
+                "description": row.description,
+                "is_reviewed": row.id_category is not None,
+                "id_import": id_import,
+                "auto_tagged_at_import": row.id_category is not None,
+            }
+            for row in rows
+        ],
+    ).all()
+    for row, id_transaction in zip(rows, ids):
+        row.id = id_transaction
+
+    splits = [
+        {"id_transaction": row.id, "id_category": row.id_category, "amount": row.amount}
+        for row in rows
+        if row.id_category is not None
+    ]
+    if splits:
+        db.execute(insert(CategorySplit), splits)
+        labels = [{"id_transaction": s["id_transaction"], "id_category": s["id_category"]} for s in splits]
+        db.execute(insert(LabelEvent).values(kind="label", id_group=None), labels)
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def account_watermarks(db: Session, since: datetime.date) -> dict[int, datetime.date]:
+    """Latest transaction date of every account with transactions on or after `since`.
+
+    Only the date range is scanned (through the date index), so the cost follows the size of the
+    imported window rather than the size of the whole table.
+    """
+    watermarks: dict[int, datetime.date] = {}
+    latest_per_pair = db.execute(
+        select(Transaction.id_source, Transaction.id_dest, func.max(Transaction.date))
+        .where(Transaction.date >= since)
+        .group_by(Transaction.id_source, Transaction.id_dest)
+    )
+    for id_source, id_dest, latest in latest_per_pair:
+        for id_account in (id_source, id_dest):
+            if id_account is not None and (id_account not in watermarks or watermarks[id_account] < latest):
+                watermarks[id_account] = latest
+    return watermarks
+
+
+def find_imported_external_ids(
+    db: Session, parsed: TransactionBatch, resolver: AccountResolver, check_all: bool = False
+) -> set[str]:
+    """Return the external ids of `parsed` that were already imported.
+
+    An imported transaction keeps the date it was parsed with and is attached to the accounts its
+    numbers/names resolve to. A row dated after the latest transaction of every known account it
+    involves therefore should not exist yet and is not looked up, unless `check_all` is set. The
+    remaining ids are checked with chunked IN queries against the unique external_id index.
+    """
+    if not parsed:
+        return set()
+    if check_all:
+        return _existing_external_ids(db, {p.external_id for p in parsed})
+    watermarks = account_watermarks(db, min(p.date for p in parsed))
+
+    to_check = []
+    for p in parsed:
+        id_accounts = [
+            id_account
+            for id_account in (
+                resolver.lookup(p.source_number, p.source_name),
+                resolver.lookup(p.dest_number, p.dest_name),
             )
-            .scalars()
-            .unique()
-            .all()
+            if id_account is not None
+        ]
+        if not id_accounts or any(
+            id_account in watermarks and watermarks[id_account] >= p.date for id_account in id_accounts
+        ):
+            to_check.append(p.external_id)
+    return _existing_external_ids(db, set(to_check))
+
+
+def _existing_external_ids(db: Session, external_ids: Set[str]) -> set[str]:
+    existing: set[str] = set()
+    for chunk in _chunks(sorted(external_ids), EXISTENCE_CHECK_CHUNK_SIZE):
+        q = select(Transaction.external_id).where(
+            Transaction.external_id.in_(chunk), Transaction.external_id.is_not(None)
         )
+        existing.update(cast(Iterable[str], db.execute(q).scalars()))
+    return existing
+
+
+def _timed(batches: Iterable[TransactionBatch], progress: ImportProgress) -> Iterator[TransactionBatch]:
+    """Count the time spent producing each batch (parsers stream them lazily) as the "parse" stage."""
+    iterator = iter(batches)
+    while True:
+        with progress.track("parse"):
+            batch = next(iterator, None)
+        if batch is None:
+            return
+        yield batch
+
+
+@dataclass
+class _ImportContext:
+    """What stays loaded across the batches of an import."""
+
+    resolver: AccountResolver
+    currencies: dict[str, Currency]
+    default_currency_id: int | None
+    rules: list[TagRule]
+    progress: ImportProgress
+    new_accounts_before: int = 0
+
+
+def _load_context(db: Session, progress: ImportProgress) -> _ImportContext:
+    with progress.track("resolve"):
+        resolver = AccountResolver(db)
+    with progress.track("rules"):
+        rules = get_active_rules(db)
+    currencies = {c.short_name: c for c in db.query(Currency).all()}
+    default_currency = currencies.get("EUR", next(iter(currencies.values()), None))
+    return _ImportContext(
+        resolver=resolver,
+        currencies=currencies,
+        default_currency_id=default_currency.id if default_currency else None,
+        rules=rules,
+        progress=progress,
+    )
 
-        if results:
-            duplicate_map[t.external_id] = results[0].id
-        else:
-            idx = bisect.bisect_left(checked, key_fn(t), key=key_fn)
-            if idx < len(checked) and key_fn(checked[idx]) == key_fn(t):
-                duplicate_map[t.external_id] = None  # dup within batch, will resolve after flush
+
+@dataclass
+class _BatchPlan:
+    """What importing a batch would do, worked out with read-only lookups (new accounts are only staged)."""
+
+    rows: list[_ImportRow]  # rows to insert, accounts still as placeholder ids
+    skipped_ids: list[str]  # already imported or repeated external ids
+    duplicate_map: dict[str | None, int | None]  # see find_duplicates
+
+
+def _plan_batch(
+    db: Session,
+    ctx: _ImportContext,
+    parsed: TransactionBatch,
+    known_ids: Set[str] = frozenset(),
+    check_all: bool = False,
+) -> _BatchPlan:
+    """`known_ids` are skipped like the external ids already in the database (see find_imported_external_ids)."""
+    progress, resolver = ctx.progress, ctx.resolver
+
+    with progress.track("dedupe"):
+        existing_ids = find_imported_external_ids(db, parsed, resolver, check_all) | known_ids
+
+        # filter already imported and deduplicate within batch
+        seen: set[str] = set()
+        new_parsed: list[TransactionLike] = []
+        skipped_ids: list[str] = []
+        for p in parsed:
+            if p.external_id not in existing_ids and p.external_id not in seen:
+                seen.add(p.external_id)
+                new_parsed.append(p)
             else:
-                checked.insert(idx, t)
+                skipped_ids.append(p.external_id)
+
+    # resolve accounts in memory; missing ones are staged and only created once duplicates are known
+    with progress.track("resolve"):
+        rows = []
+        for p in new_parsed:
+            currency = ctx.currencies.get(p.currency)
+            currency_id = currency.id if currency else ctx.default_currency_id
+            if currency_id is None:
+                raise ValueError(f"No currency to import {p.external_id} in: add currencies first")
+            rows.append(
+                _ImportRow(
+                    external_id=p.external_id,
+                    id_source=resolver.resolve(p.source_number, p.source_name, currency_id),
+                    id_dest=resolver.resolve(p.dest_number, p.dest_name, currency_id),
+                    date=p.date,
+                    amount=p.amount,
+                    id_currency=currency_id,
+                    description=p.description,
+                    raw_metadata=p.raw_metadata,
+                    data_source=p.data_source,
+                )
+            )
 
-    return duplicate_map
+    # detect duplicates (staged accounts have no history, so placeholder ids cannot match the database)
+    with progress.track("dedupe"):
+        duplicate_map = find_duplicates(db, rows) if rows else {}
+
+    return _BatchPlan(rows=rows, skipped_ids=skipped_ids, duplicate_map=duplicate_map)
+
+
+def _apply_rules(ctx: _ImportContext, rows: list[_ImportRow]) -> int:
+    """Auto-apply tag rules to the rows that are not duplicates, before they are written. Returns the tagged count."""
+    with ctx.progress.track("rules"):
+        rules_applied = 0
+        if ctx.rules:
+            for row in rows:
+                if row.id_duplicate_of is not None:
+                    continue
+                rule = find_matching_rule(ctx.rules, row)
+                if rule is not None:
+                    row.id_category = rule.id_category
+                    rules_applied += 1
+    return rules_applied
+
+
+def _create_accounts(ctx: _ImportContext, record: ImportRecord, plan: _BatchPlan) -> None:
+    """Create the accounts staged by a plan and give its rows their real account ids and duplicate references."""
+    resolver = ctx.resolver
+    with ctx.progress.track("resolve"):
+        resolver.create_pending(record.id)
+        for row in plan.rows:
+            row.id_source = resolver.real_id(row.id_source)
+            row.id_dest = resolver.real_id(row.id_dest)
+            row.id_duplicate_of = plan.duplicate_map.get(row.external_id)
+
+
+def _insert_rows(db: Session, ctx: _ImportContext, record: ImportRecord, plan: _BatchPlan) -> int:
+    """Tag and insert the rows of a plan. Returns the tagged count."""
+    rules_applied = _apply_rules(ctx, plan.rows)
+    with ctx.progress.track("insert"):
+        if plan.rows:
+            insert_transactions(db, plan.rows, record.id)
+    return rules_applied
+
+
+def _import_batch(db: Session, ctx: _ImportContext, record: ImportRecord, parsed: TransactionBatch) -> None:
+    """Deduplicate, resolve, tag and insert one batch, then commit it along with the updated record statistics."""
+    progress, resolver = ctx.progress, ctx.resolver
+
+    # rows of earlier batches are committed, so the existence check also catches repeats across batches
+    plan = _plan_batch(db, ctx, parsed)
+    _create_accounts(ctx, record, plan)
+    try:
+        with db.begin_nested():
+            rules_applied = _insert_rows(db, ctx, record, plan)
+    except IntegrityError:
+        # a row the account watermarks took for new was already imported (e.g. through another alias of the account)
+        logger.warning("Import %s: external id conflict, checking every external id of the batch", record.id)
+        plan = _plan_batch(db, ctx, parsed, check_all=True)
+        _create_accounts(ctx, record, plan)
+        rules_applied = _insert_rows(db, ctx, record, plan)
+    rows, duplicate_map = plan.rows, plan.duplicate_map
+    progress.rows_processed += len(parsed)
+
+    # Update import record stats (flushed as a single UPDATE with the batch)
+    record.total_transactions += len(parsed)
+    record.skipped_transactions += len(plan.skipped_ids)
+    record.new_transactions += len(rows) - len(duplicate_map)
+    record.duplicate_transactions += len(duplicate_map)
+    record.new_accounts = len(resolver.new_account_ids) + ctx.new_accounts_before
+    record.auto_tagged += rules_applied
+    if rows:
+        earliest, latest = min(row.date for row in rows), max(row.date for row in rows)
+        record.date_earliest = min(earliest, record.date_earliest or earliest)
+        record.date_latest = max(latest, record.date_latest or latest)
+    record.checkpoint = (record.checkpoint or 0) + len(parsed)
+    record.timings = dict(progress.timings)
+    db.commit()
 
 
-def import_parsed_transactions(
+def import_batches(
     db: Session,
-    parsed: list[ParsedTransaction],
+    batches: Iterable[TransactionBatch],
     data_source: str,
     filenames: list[str] | None = None,
+    progress: ImportProgress | None = None,
+    resume: ImportRecord | None = None,
+    files: list[tuple[str, str, str]] | None = None,
 ) -> ImportRecord:
-    """Import parsed transactions into the database.
-
-    Resolves accounts, detects duplicates, creates transactions.
-    Returns an ImportRecord with statistics.
+    """Import parsed transactions batch by batch, so memory is bounded by the batch size rather than the import.
+
+    Each batch gets its own dedupe, resolve and insert pass and is committed with the statistics of the
+    ImportRecord accumulated so far. While the import runs, `checkpoint` on the record counts the parsed rows
+    already committed; passing an interrupted record as `resume` skips that many rows and carries on with it.
+    Stage durations are reported through `progress` and stored on the record. `files` lists the (filename,
+    content hash, format) of the parsed files, recorded so that `find_imported_files` can spot them when
+    re-uploaded. `data_source` is the format of the record; each transaction keeps the data source it was
+    parsed with, so one import can mix statements of several banks.
     """
-    currencies = {c.short_name: c for c in db.query(Currency).all()}
-    existing_ids = {row[0] for row in db.execute(select(Transaction.external_id)).all()}
+    if progress is None:
+        progress = ImportProgress()
+
+    ctx = _load_context(db, progress)
+
+    if resume is None:
+        record = ImportRecord(
+            format=data_source,
+            filenames=filenames or [],
+            total_transactions=0,
+            new_transactions=0,
+            duplicate_transactions=0,
+            skipped_transactions=0,
+            new_accounts=0,
+            auto_tagged=0,
+            checkpoint=0,
+            files=[
+                ImportFile(filename=filename, content_hash=content_hash, format=file_format)
+                for filename, content_hash, file_format in files or []
+            ],
+        )
+        db.add(record)
+        db.commit()
+    else:
+        if resume.checkpoint is None:
+            raise ValueError(f"Import {resume.id} has already completed")
+        record = resume
+
+    ctx.new_accounts_before = record.new_accounts
+
+    to_skip = record.checkpoint or 0
+    for batch in _timed(batches, progress):
+        progress.rows_total += len(batch)
+        if to_skip >= len(batch):
+            to_skip -= len(batch)
+            progress.rows_processed += len(batch)
+            continue
+        progress.rows_processed += to_skip
+        _import_batch(db, ctx, record, batch[to_skip:])
+        to_skip = 0
+
+    record.checkpoint = None
+    record.timings = dict(progress.timings)
+    db.commit()
+
+    logger.info(
+        "Imported %d new transaction(s) (%d duplicates, %d auto-tagged)",
+        record.new_transactions,
+        record.duplicate_transactions,
+        record.auto_tagged,
+    )
+    return record
 
-    total_parsed = len(parsed)
 
-    # filter already imported and deduplicate within batch
-    seen: set[str] = set()
-    new_parsed: list[ParsedTransaction] = []
-    skipped = 0
+@dataclass
+class SkippedFile:
+    filename: str
+    id_import: int | None  # import that already has the same content, None for a copy within the upload
+
+
+@dataclass
+class PreviewFile:
+    filename: str
+    format: str
+
+
+@dataclass
+class PreviewRow:
+    """A parsed transaction and what importing it would do. Accounts that would be created have no id yet."""
+
+    external_id: str
+    date: datetime.date
+    amount: Decimal
+    description: str
+    status: str  # new, duplicate or skipped
+    id_source: int | None = None
+    id_dest: int | None = None
+    id_duplicate_of: int | None = None
+    id_category: int | None = None
+
+
+@dataclass
+class PreviewAccount:
+    number: str | None
+    name: str | None
+
+
+@dataclass
+class DuplicatePair:
+    external_id: str
+    id_duplicate_of: int | None  # None when it duplicates another transaction of the upload
+
+
+@dataclass
+class ImportPreview:
+    """Statistics of an import that was not written, with the first `sample_size` of each detail list."""
+
+    format: str
+    total_transactions: int = 0
+    new_transactions: int = 0
+    duplicate_transactions: int = 0
+    skipped_transactions: int = 0
+    new_accounts: int = 0
+    auto_tagged: int = 0
+    date_earliest: datetime.date | None = None
+    date_latest: datetime.date | None = None
+    skipped_ids: list[str] = field(default_factory=list)
+    duplicates: list[DuplicatePair] = field(default_factory=list)
+    accounts: list[PreviewAccount] = field(default_factory=list)
+    sample: list[PreviewRow] = field(default_factory=list)
+    files: list[PreviewFile] = field(default_factory=list)
+    skipped_files: list[SkippedFile] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def _add_sample(items: list[Any], new_items: Iterable[Any], size: int) -> None:
+    items.extend(islice(new_items, max(0, size - len(items))))
+
+
+def preview_batches(
+    db: Session,
+    batches: Iterable[TransactionBatch],
+    data_source: str,
+    sample_size: int = PREVIEW_SAMPLE_SIZE,
+) -> ImportPreview:
+    """Dry run of `import_batches`: the same pipeline on read-only lookups, nothing is added to the session.
+
+    Accounts are only staged and rows are not inserted, so the repeats and duplicates of earlier batches,
+    which the import finds in the database, are tracked in memory instead.
+    """
+    progress = ImportProgress()
+    ctx = _load_context(db, progress)
+    preview = ImportPreview(format=data_source)
+    previewed_ids: set[str] = set()
+    previewed_keys: set[tuple[int | None, int | None, datetime.date, Decimal]] = set()
+
+    for batch in _timed(batches, progress):
+        plan = _plan_batch(db, ctx, batch, known_ids=previewed_ids)
+        rows = plan.rows
+        previewed_ids.update(row.external_id for row in rows)
+
+        duplicates = dict(plan.duplicate_map)
+        of_earlier_batch: set[str] = set()
+        batch_keys = set()
+        for row in rows:
+            row.id_duplicate_of = duplicates.get(row.external_id)
+            if row.id_duplicate_of is not None:
+                continue
+            key = (row.id_source, row.id_dest, row.date, row.amount)
+            if key in previewed_keys:
+                duplicates[row.external_id] = None
+                of_earlier_batch.add(row.external_id)
+            else:
+                batch_keys.add(key)
+        previewed_keys |= batch_keys
+        # like database duplicates, those of an earlier batch are not tagged
+        preview.auto_tagged += _apply_rules(ctx, [row for row in rows if row.external_id not in of_earlier_batch])
+
+        preview.total_transactions += len(batch)
+        preview.skipped_transactions += len(plan.skipped_ids)
+        preview.new_transactions += len(rows) - len(duplicates)
+        preview.duplicate_transactions += len(duplicates)
+        if rows:
+            earliest, latest = min(row.date for row in rows), max(row.date for row in rows)
+            preview.date_earliest = min(earliest, preview.date_earliest or earliest)
+            preview.date_latest = max(latest, preview.date_latest or latest)
+
+        _add_sample(preview.skipped_ids, plan.skipped_ids, sample_size)
+        _add_sample(preview.duplicates, (DuplicatePair(e, i) for e, i in duplicates.items() if e), sample_size)
+        by_id = {row.external_id: row for row in rows}
+        _add_sample(preview.sample, _preview_rows(batch, by_id, duplicates), sample_size)
+
+    staged = ctx.resolver.staged_accounts()
+    preview.new_accounts = len(staged)
+    preview.accounts = [PreviewAccount(number, name) for number, name in staged[:sample_size]]
+    preview.timings = dict(progress.timings)
+    return preview
+
+
+def _preview_rows(
+    parsed: TransactionBatch, rows: dict[str, _ImportRow], duplicates: dict[str | None, int | None]
+) -> Iterator[PreviewRow]:
+    """Outcome of each parsed transaction of a batch, given the rows planned for it (by external id)."""
+    taken: set[str] = set()
     for p in parsed:
-        if p.external_id in existing_ids:
-            skipped += 1
-        elif p.external_id not in seen:
-            seen.add(p.external_id)
-            new_parsed.append(p)
-        else:
-            skipped += 1
-
-    # Create import record early so we have the id
-    import_record = ImportRecord(
-        format=data_source,
-        filenames=filenames or [],
-        total_transactions=total_parsed,
-        new_transactions=0,
-        duplicate_transactions=0,
-        skipped_transactions=skipped,
-        new_accounts=0,
-        auto_tagged=0,
+        row = rows.get(p.external_id)
+        if row is None or p.external_id in taken:
+            yield PreviewRow(p.external_id, p.date, p.amount, p.description, status="skipped")
+            continue
+        taken.add(p.external_id)
+        yield PreviewRow(
+            p.external_id,
+            p.date,
+            p.amount,
+            p.description,
+            status="duplicate" if p.external_id in duplicates else "new",
+            id_source=row.id_source if row.id_source is None or row.id_source >= 0 else None,
+            id_dest=row.id_dest if row.id_dest is None or row.id_dest >= 0 else None,
+            id_duplicate_of=row.id_duplicate_of,
+            id_category=row.id_category,
+        )
+
+
+def find_imported_files(db: Session, content_hashes: Iterable[str]) -> dict[str, int]:
+    """Map the given content hashes that were already imported to the id of their (first) completed import."""
+    q = (
+        select(ImportFile.content_hash, func.min(ImportFile.id_import))
+        .join(ImportRecord, ImportRecord.id == ImportFile.id_import)
+        .where(ImportFile.content_hash.in_(set(content_hashes)), ImportRecord.checkpoint.is_(None))
+        .group_by(ImportFile.content_hash)
     )
-    db.add(import_record)
-    db.flush()
+    return {content_hash: id_import for content_hash, id_import in db.execute(q)}
 
-    if not new_parsed:
-        db.commit()
-        return import_record
-
-    default_currency_id = currencies.get("EUR", next(iter(currencies.values()))).id
-
-    # resolve accounts and build Transaction objects
-    new_account_ids: set[int] = set()
-    transactions = []
-    for p in new_parsed:
-        currency = currencies.get(p.currency)
-        currency_id = currency.id if currency else default_currency_id
-
-        source = resolve_account(db, p.source_number, p.source_name, currency_id, _new_account_ids=new_account_ids)
-        dest = resolve_account(db, p.dest_number, p.dest_name, currency_id, _new_account_ids=new_account_ids)
-
-        t = Transaction(
-            external_id=p.external_id,
-            id_source=source.id if source else None,
-            id_dest=dest.id if dest else None,
-            date=p.date,
-            raw_metadata=p.raw_metadata,
-            amount=p.amount,
-            id_currency=currency_id,
-            data_source=data_source,
-            description=p.description,
-            is_reviewed=False,
-            id_import=import_record.id,
-        )
-        transactions.append(t)
 
-    # detect duplicates
-    duplicate_map = find_duplicates(db, transactions)
+@dataclass
+class ImportDeletion:
+    """Row counts of an import rollback."""
 
-    # save all
-    db.add_all(transactions)
-    db.flush()
+    transactions: int = 0
+    category_splits: int = 0
+    duplicates_cleared: int = 0
+    groups_dissolved: int = 0
+    accounts: int = 0
 
-    # set duplicate references
-    for t in transactions:
-        if t.external_id in duplicate_map:
-            parent_id = duplicate_map[t.external_id]
-            if parent_id is not None:
-                t.id_duplicate_of = parent_id
 
-    db.commit()
+def _journal_unlabel(db: Session, splits: ColumnElement[bool]) -> None:
+    """Journal the removal of the splits matching `splits`, before they are deleted in bulk."""
+    columns = ["kind", "id_transaction", "id_group", "id_category"]
+    removed = select(
+        literal("unlabel"), CategorySplit.id_transaction, CategorySplit.id_group, CategorySplit.id_category
+    ).where(splits)
+    db.execute(insert(LabelEvent).from_select(columns, removed))
 
-    # Auto-apply tag rules to newly imported transactions
-    from app.services.tag_rule_service import apply_rules
 
-    non_duplicate = [t for t in transactions if t.id_duplicate_of is None]
-    rules_applied = apply_rules(db, non_duplicate)
-    if rules_applied:
-        logger.info("Auto-applied tag rules to %d transaction(s)", rules_applied)
-        # Mark auto-tagged transactions for frozen-in-time import view
-        for t in non_duplicate:
-            if len(t.category_splits) > 0:
-                t.auto_tagged_at_import = True
+def _rowcount(db: Session, statement: Executable) -> int:
+    """Rows matched by an UPDATE or DELETE statement."""
+    return cast(CursorResult[Any], db.execute(statement)).rowcount
 
-    # Compute date range
-    dates = [t.date for t in transactions]
-    date_earliest = min(dates) if dates else None
-    date_latest = max(dates) if dates else None
-
-    # Update import record stats
-    new_count = len(transactions) - len(duplicate_map)
-    import_record.new_transactions = new_count
-    import_record.duplicate_transactions = len(duplicate_map)
-    import_record.new_accounts = len(new_account_ids)
-    import_record.auto_tagged = rules_applied
-    import_record.date_earliest = date_earliest
-    import_record.date_latest = date_latest
+
+def delete_import(db: Session, record: ImportRecord) -> ImportDeletion:
+    """Remove an import and everything it brought in, with set-based statements, in one transaction.
+
+    Transactions of other imports that were flagged as duplicates of removed ones are no longer duplicates.
+    Groups with a removed member are dissolved like DELETE /transaction-groups/{id} does. Accounts created by
+    the import are removed unless something else (another transaction, a wallet, a tag rule) uses them.
+    """
+    id_import = record.id
+    imported = select(Transaction.id).where(Transaction.id_import == id_import)
+    deletion = ImportDeletion()
+
+    deletion.duplicates_cleared = _rowcount(
+        db,
+        update(Transaction)
+        .where(Transaction.id_duplicate_of.in_(imported), Transaction.id_import.is_distinct_from(id_import))
+        .values(id_duplicate_of=None),
+    )
+
+    groups = (
+        select(Transaction.id_transaction_group)
+        .where(Transaction.id_import == id_import, Transaction.id_transaction_group.is_not(None))
+        .distinct()
+    )
+    group_ids = db.scalars(groups).all()
+    for chunk in _chunks(group_ids, EXISTENCE_CHECK_CHUNK_SIZE):
+        db.execute(
+            update(Transaction)
+            .where(Transaction.id_transaction_group.in_(chunk))
+            .values(id_transaction_group=None, effective_amount=None)
+        )
+        _journal_unlabel(db, CategorySplit.id_group.in_(chunk))
+        db.execute(delete(CategorySplit).where(CategorySplit.id_group.in_(chunk)))
+        db.execute(delete(TransactionGroup).where(TransactionGroup.id.in_(chunk)))
+    deletion.groups_dissolved = len(group_ids)
+
+    _journal_unlabel(db, CategorySplit.id_transaction.in_(imported))
+    deletion.category_splits = _rowcount(db, delete(CategorySplit).where(CategorySplit.id_transaction.in_(imported)))
+    db.execute(delete(TransactionPrediction).where(TransactionPrediction.id_transaction.in_(imported)))
+    deletion.transactions = _rowcount(db, delete(Transaction).where(Transaction.id_import == id_import))
+
+    in_use = (
+        select(Transaction.id_source.label("id_account"))
+        .where(Transaction.id_source.is_not(None))
+        .union(
+            select(Transaction.id_dest).where(Transaction.id_dest.is_not(None)),
+            select(WalletAccount.id_account),
+            select(TagRule.match_account_from).where(TagRule.match_account_from.is_not(None)),
+            select(TagRule.match_account_to).where(TagRule.match_account_to.is_not(None)),
+        )
+    )
+    unused = select(Account.id).where(Account.id_import == id_import, Account.id.not_in(in_use))
+    db.execute(delete(AccountAlias).where(AccountAlias.id_account.in_(unused)))
+    deletion.accounts = _rowcount(db, delete(Account).where(Account.id_import == id_import, Account.id.not_in(in_use)))
+    # accounts still in use stay, without the import that created them
+    db.execute(update(Account).where(Account.id_import == id_import).values(id_import=None))
+
+    db.execute(delete(ImportFile).where(ImportFile.id_import == id_import))
+    db.execute(delete(ImportRecord).where(ImportRecord.id == id_import))
     db.commit()
+    db.expire_all()
+
+    logger.info(
+        "Deleted import %d: %d transaction(s), %d account(s), %d group(s) dissolved",
+        id_import,
+        deletion.transactions,
+        deletion.accounts,
+        deletion.groups_dissolved,
+    )
+    return deletion
+
+
+def import_parsed_transactions(
+    db: Session,
+    parsed: Iterable[ParsedTransaction],
+    data_source: str,
+    filenames: list[str] | None = None,
+    progress: ImportProgress | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> ImportRecord:
+    """Import parsed transactions into the database, `batch_size` at a time (see `import_batches`).
 
-    logger.info("Imported %d new transaction(s) (%d duplicates)", len(transactions), len(duplicate_map))
-    return import_record
+    Resolves accounts, detects duplicates, creates transactions.
+    Returns an ImportRecord with statistics.
+    """
+    return import_batches(db, batched(parsed, batch_size), data_source, filenames=filenames, progress=progress)
@@ -0,0 +1,126 @@
+"""On-disk cache of parser output, keyed by file content hash.
+
+Entries are also keyed by the parsing function and a digest of the source of its module, so editing a parser
+invalidates what it cached. The cache is an optimization only: unreadable or unwritable entries are ignored, and
+least recently used entries are evicted once the cache grows past `parse_cache_max_mb`.
+
+Entries are unpickled when loaded, and unpickling runs arbitrary code: the cache directory must only be writable by
+the application itself.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from functools import lru_cache
+from typing import Any, TypeVar, cast
+
+from app.config import settings
+from app.parsers.common import Source
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@lru_cache
+def _module_digest(module_name: str) -> str:
+    with open(sys.modules[module_name].__file__ or "", "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _entry_path(parse: Callable[..., Any], content_hash: str) -> str:
+    name = f"{parse.__module__}.{parse.__qualname__}-{_module_digest(parse.__module__)}"
+    return os.path.join(settings.parse_cache_dir, content_hash[:2], f"{content_hash}-{name}.pickle")
+
+
+def load(parse: Callable[[Source], T], content_hash: str) -> T | None:
+    if not settings.parse_cache_dir:
+        return None
+    path = _entry_path(parse, content_hash)
+    try:
+        with open(path, "rb") as f:
+            result = cast(T, pickle.load(f))
+        os.utime(path)  # entries are evicted by modification time, which hits refresh
+        return result
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Ignoring unreadable parse cache entry for %s", content_hash, exc_info=True)
+        return None
+
+
+def store(parse: Callable[[Source], T], content_hash: str, result: T) -> None:
+    if not settings.parse_cache_dir:
+        return
+    path = _entry_path(parse, content_hash)
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so concurrent imports never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        tmp_path = None
+    except Exception:
+        logger.warning("Could not write parse cache entry %s", path, exc_info=True)
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def evict() -> None:
+    """Remove the least recently used entries until the cache fits in `parse_cache_max_mb`."""
+    if not settings.parse_cache_dir or settings.parse_cache_max_mb <= 0:
+        return
+    entries = []
+    for directory, _, filenames in os.walk(settings.parse_cache_dir):
+        for filename in filenames:
+            if filename.endswith(".pickle"):
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+    size = sum(entry_size for _, entry_size, _ in entries)
+    limit = settings.parse_cache_max_mb * 1024 * 1024
+    for _, entry_size, path in sorted(entries):
+        if size <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning("Could not evict parse cache entry %s", path, exc_info=True)
+            continue
+        size -= entry_size
+
+
+def map_cached(
+    parse: Callable[[Source], T],
+    sources: Iterable[Source],
+    content_hashes: Sequence[str],
+    map_files: Callable[..., Iterable[T]] = map,
+) -> Iterator[T]:
+    """Like `map_files(parse, sources)`, but files whose content hash is cached are not parsed again.
+
+    `content_hashes` are those of `sources`, in the same order. Fresh results are added to the cache, which is then
+    trimmed to its size limit.
+    """
+    sources = list(sources)
+    cached = [load(parse, content_hash) for content_hash in content_hashes]
+    fresh = iter(map_files(parse, [source for source, result in zip(sources, cached) if result is None]))
+    for content_hash, result in zip(content_hashes, cached):
+        if result is None:
+            result = next(fresh)
+            store(parse, content_hash, result)
+        yield result
+    if any(result is None for result in cached):
+        evict()
@@ -0,0 +1,120 @@
+"""Process pool that parses the files of an upload in parallel.
+
+Each file is parsed in a worker process under a CPU time budget and an address-space cap, so one pathological
+statement cannot hang or exhaust the server. Results come back in input order, which keeps external ids and
+per-file indexes stable whatever the scheduling.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TypeVar
+
+from app.config import settings
+from app.parsers.common import Source
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_pool: ProcessPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+class ParseTimeoutError(Exception):
+    pass
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    if memory_limit_mb > 0:
+        try:
+            import resource
+        except ImportError:  # not available on Windows
+            return
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _parse_in_worker(parse: Callable[[Source], T], data: bytes, timeout: float) -> T:
+    if timeout > 0 and hasattr(signal, "setitimer"):
+
+        def on_alarm(signum: int, frame: object) -> None:
+            raise ParseTimeoutError(f"parsing a file took longer than {timeout:g}s")
+
+        signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse(io.BytesIO(data))
+    finally:
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _workers() -> int:
+    return settings.parse_workers if settings.parse_workers is not None else (os.cpu_count() or 1)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.parse_memory_limit_mb,),
+            )
+        return _pool
+
+
+def _read(source: Source) -> bytes:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+
+def map_files(parse: Callable[[Source], T], sources: Iterable[Source]) -> Iterator[T]:
+    """Like `map(parse, sources)`, but each call runs in a worker process.
+
+    `parse` must be a module-level function (it is pickled). At most one file per worker is in flight, so memory
+    stays bounded by the number of workers rather than the size of the upload. With `parse_workers = 0` files are
+    parsed in the calling process.
+    """
+    if _workers() == 0:
+        yield from map(parse, sources)
+        return
+
+    pool = _get_pool()
+    pending: deque[Future[T]] = deque()
+    try:
+        for source in sources:
+            pending.append(pool.submit(_parse_in_worker, parse, _read(source), settings.parse_timeout))
+            if len(pending) >= _workers():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # a worker died (e.g. killed when hitting the memory cap): start from a fresh pool next time
+        logger.exception("Parse worker crashed")
+        shutdown_parse_pool()
+        raise RuntimeError("a file could not be parsed: the parsing process crashed (out of memory?)") from None
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,142 @@
+"""Category predictions of the current model, stored in `transaction_prediction`.
+
+Predictions are computed in large batches for every uncategorised transaction when a model becomes valid, and for
+the transactions of each import. Prediction endpoints read them from the table and only run the model on misses.
+"""
+
+import logging
+from collections.abc import Sequence
+from typing import Any
+
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.ml.predictor import NoValidModelError, predict_top_k, valid_model
+from app.models import MLModel, Transaction, TransactionPrediction
+
+logger = logging.getLogger(__name__)
+
+# transactions predicted per call to the inference worker
+PREDICTION_BATCH_SIZE = 2000
+# alternatives kept for each transaction
+TOP_K = 3
+
+# what the model needs from a transaction (see predictor.predict_categories)
+_FEATURE_COLUMNS = (
+    Transaction.id,
+    Transaction.description,
+    Transaction.date,
+    Transaction.amount,
+    Transaction.id_source,
+    Transaction.id_dest,
+)
+# fields of a transaction whose change makes its stored predictions stale
+MODEL_INPUTS = frozenset(column.key for column in _FEATURE_COLUMNS[1:])
+
+
+def _store(db: Session, model: MLModel, transactions: Sequence[Any], rankings: list[list[tuple[int, float]]]) -> int:
+    """Insert predictions, returning how many were stored.
+
+    If another session stored some of them meanwhile, its predictions are kept instead and the others are inserted.
+    """
+    rows = [
+        {
+            "id_transaction": t.id,
+            "id_model": model.id,
+            "id_category": ranking[0][0] if ranking else None,
+            "probability": ranking[0][1] if ranking else 0.0,
+            "top_k": [list(item) for item in ranking],
+        }
+        for t, ranking in zip(transactions, rankings)
+    ]
+    while rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(TransactionPrediction), rows)
+            return len(rows)
+        except IntegrityError:
+            stored = set(
+                db.scalars(
+                    select(TransactionPrediction.id_transaction).where(
+                        TransactionPrediction.id_model == model.id,
+                        TransactionPrediction.id_transaction.in_([row["id_transaction"] for row in rows]),
+                    )
+                )
+            )
+            if not stored:
+                # not a conflict with another session (e.g. the transaction was deleted meanwhile)
+                logger.warning("Could not store predictions of model '%s'", model.filename, exc_info=True)
+                return 0
+            rows = [row for row in rows if row["id_transaction"] not in stored]
+    return 0
+
+
+def drop_predictions(db: Session, transaction_ids: Sequence[int]) -> None:
+    """Delete the stored predictions of transactions whose model inputs changed, for the caller to commit."""
+    db.execute(delete(TransactionPrediction).where(TransactionPrediction.id_transaction.in_(transaction_ids)))
+
+
+def fill_predictions(db: Session, id_import: int | None = None, batch_size: int = PREDICTION_BATCH_SIZE) -> int:
+    """Predict the uncategorised transactions (of an import, if given) without a prediction of the current model.
+
+    Predictions of older models are dropped. Each batch is committed. Returns the number of predictions stored.
+    """
+    model = valid_model(db)
+    if model is None:
+        return 0
+    db.execute(delete(TransactionPrediction).where(TransactionPrediction.id_model != model.id))
+    db.commit()
+
+    predicted = exists().where(
+        TransactionPrediction.id_transaction == Transaction.id, TransactionPrediction.id_model == model.id
+    )
+    q = (
+        select(*_FEATURE_COLUMNS)
+        .where(
+            ~Transaction.category_splits.any(),
+            Transaction.id_transaction_group.is_(None),
+            Transaction.id_duplicate_of.is_(None),
+            ~predicted,
+        )
+        .order_by(Transaction.id)
+    )
+    if id_import is not None:
+        q = q.where(Transaction.id_import == id_import)
+
+    stored = 0
+    last_id = 0
+    while batch := db.execute(q.where(Transaction.id > last_id).limit(batch_size)).all():
+        stored += _store(db, model, batch, predict_top_k(model, batch, TOP_K))
+        db.commit()
+        last_id = batch[-1].id
+    logger.info("Stored %d predictions of model '%s'", stored, model.filename)
+    return stored
+
+
+def get_predictions(db: Session, transactions: Sequence[Transaction]) -> list[tuple[int | None, float]]:
+    """(category id, probability) of each transaction, from stored predictions, running the model on misses.
+
+    Predictions of misses are added to the session, for the caller to commit.
+    Raises NoValidModelError if no valid model exists.
+    """
+    if not transactions:
+        return []
+    model = valid_model(db)
+    if model is None:
+        raise NoValidModelError("No valid model available for prediction")
+
+    ids = [t.id for t in transactions]
+    stored = db.execute(
+        select(
+            TransactionPrediction.id_transaction, TransactionPrediction.id_category, TransactionPrediction.probability
+        ).where(TransactionPrediction.id_model == model.id, TransactionPrediction.id_transaction.in_(ids))
+    ).all()
+    predictions = {id_transaction: (id_category, probability) for id_transaction, id_category, probability in stored}
+    misses = list({t.id: t for t in transactions if t.id not in predictions}.values())
+    if misses:
+        rankings = predict_top_k(model, misses, TOP_K)
+        for t, ranking in zip(misses, rankings):
+            predictions[t.id] = ranking[0] if ranking else (None, 0.0)
+        _store(db, model, misses, rankings)
+    return [predictions[t.id] for t in transactions]
@@ -1,6 +1,7 @@
 """Tag rule matching service for auto-categorizing transactions."""
 
 import re
+from typing import Any
 
 from sqlalchemy.orm import Session
 
@@ -15,7 +16,7 @@ def apply_rules(db: Session, transactions: list[Transaction]) -> int:
     Rules are checked in priority order (highest first). First match wins.
     Returns the number of transactions that were categorized.
     """
-    rules = db.query(TagRule).filter(TagRule.is_active == True).order_by(TagRule.priority.desc()).all()  # noqa: E712
+    rules = get_active_rules(db)
     if not rules:
         return 0
 
@@ -26,15 +27,14 @@ def apply_rules(db: Session, transactions: list[Transaction]) -> int:
         # Skip grouped transactions (they can't have individual categories)
         if t.id_transaction_group is not None:
             continue
-        for rule in rules:
-            if _matches(rule, t):
-                effective = t.effective_amount if t.effective_amount is not None else t.amount
-                t.category_splits.append(
-                    CategorySplit(id_category=rule.id_category, amount=effective)
-                )
-                t.is_reviewed = True
-                applied += 1
-                break
+        rule = find_matching_rule(rules, t)
+        if rule is not None:
+            effective = t.effective_amount if t.effective_amount is not None else t.amount
+            t.category_splits.append(
+                CategorySplit(id_category=rule.id_category, amount=effective)
+            )
+            t.is_reviewed = True
+            applied += 1
 
     if applied > 0:
         db.commit()
@@ -42,7 +42,20 @@ def apply_rules(db: Session, transactions: list[Transaction]) -> int:
     return applied
 
 
-def _matches(rule: TagRule, transaction: Transaction) -> bool:
+def get_active_rules(db: Session) -> list[TagRule]:
+    """Active rules, highest priority first."""
+    return db.query(TagRule).filter(TagRule.is_active == True).order_by(TagRule.priority.desc()).all()  # noqa: E712
+
+
+def find_matching_rule(rules: list[TagRule], transaction: Any) -> TagRule | None:
+    """First rule of `rules` matching the transaction (any object with description, amount and account ids)."""
+    for rule in rules:
+        if _matches(rule, transaction):
+            return rule
+    return None
+
+
+def _matches(rule: TagRule, transaction: Any) -> bool:
     """Check if a transaction matches all conditions of a rule."""
     if rule.match_description is not None:
         try:
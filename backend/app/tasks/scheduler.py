@@ -27,7 +27,8 @@ def _cleanup_models() -> None:
 def _auto_train() -> None:
     """Train a new model if data has changed since last training."""
     from app.database import SessionLocal
-    from app.ml.trainer import should_train, train_model
+    from app.config import settings
+    from app.ml.trainer import should_train, train_model, update_model
 
     db = SessionLocal()
     try:
@@ -35,6 +36,11 @@ def _auto_train() -> None:
             logger.debug("Auto-train skipped: no data changes since last model")
             return
 
+        model = update_model(db) if settings.ml_incremental else None
+        if model is not None:
+            n_updated = (model.metadata_ or {}).get("n_updated")
+            logger.info("Auto-train: updated model '%s' with %s new labels", model.filename, n_updated)
+            return
         logger.info("Auto-train: data changed, starting model training")
         model = train_model(db)
         logger.info("Auto-train complete: model '%s' (state=%s)", model.filename, model.state)
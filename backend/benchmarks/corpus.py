@@ -0,0 +1,214 @@
+"""Synthetic bank exports for the parser benchmarks.
+
+The files have the layout of real Belfius and ING CSV exports and MasterCard statement PDFs, with realistic
+value distributions: a pool of recurring counterparties, log-normal amounts, mostly debits, accented names.
+Everything is drawn from a seeded random generator, so a seed and a size always give the same bytes.
+"""
+
+import datetime
+import os
+import random
+from collections.abc import Iterator
+from decimal import Decimal
+
+FIRST_DATE = datetime.date(2015, 1, 1)
+
+_NAMES = [
+    "Delhaize Ixelles",
+    "Colruyt Gent",
+    "Proximus SA",
+    "Engie Electrabel",
+    "Société Générale",
+    "Café du Théâtre",
+    "Boulangerie Dupré",
+    "Pharmacie Van Damme",
+    "SNCB NMBS",
+    "Mutualité Chrétienne",
+    "Jean-Michel Lefèvre",
+    "Anna De Smet",
+    "Immo Gérance SPRL",
+    "Total Energies",
+    "Amazon EU",
+    "Spotify AB",
+]
+_WORDS = ["Achat", "Virement", "Domiciliation", "Loyer", "Facture", "Remboursement", "Courses", "Abonnement"]
+_CITIES = ["1000 Bruxelles", "9000 Gent", "2000 Antwerpen", "4000 Liège", "5000 Namur", "1348 Louvain-la-Neuve"]
+_MERCHANTS = [
+    ("SUPERMARKET BRUSSELS", "BRUXELLES", "BE"),
+    ("AMAZON EU", "LUXEMBOURG", "LU"),
+    ("CAFE CENTRAL", "WIEN", "AT"),
+    ("SHELL 1234", "NAMUR", "BE"),
+    ("BOOKSHOP PARIS", "PARIS", "FR"),
+    ("PARKING", "BRUXELLES", "BE"),
+]
+
+
+def iban(rng: random.Random) -> str:
+    """A Belgian IBAN with valid check digits, grouped by four like in the exports."""
+    bban = f"{rng.randrange(10**10):010d}"
+    bban += f"{int(bban) % 97 or 97:02d}"
+    check = 98 - int(bban + "111400") % 97  # BE00 moved to the end, letters as numbers
+    number = f"BE{check:02d}{bban}"
+    return " ".join(number[i : i + 4] for i in range(0, len(number), 4))
+
+
+def _counterparties(rng: random.Random, n: int = 200) -> list[tuple[str, str]]:
+    return [(iban(rng), f"{rng.choice(_NAMES)} {i}") for i in range(n)]
+
+
+def _amount(rng: random.Random) -> Decimal:
+    """Mostly small debits, some larger credits (salary, refunds)."""
+    value = Decimal(f"{min(rng.lognormvariate(3.2, 1.1), 9999.99):.2f}")
+    return value if rng.random() < 0.15 else -value
+
+
+def _fr_amount(amount: Decimal, thousands: str = "") -> str:
+    whole, cents = f"{abs(amount):.2f}".split(".")
+    if thousands and len(whole) > 3:
+        whole = whole[:-3] + thousands + whole[-3:]
+    return f"{'-' if amount < 0 else ''}{whole},{cents}"
+
+
+def _dates(rng: random.Random, n_rows: int) -> Iterator[datetime.date]:
+    """Non-decreasing booking dates, a few transactions a day."""
+    day = FIRST_DATE
+    for _ in range(n_rows):
+        if rng.random() < 0.3:
+            day += datetime.timedelta(days=1)
+        yield day
+
+
+def belfius_csv(n_rows: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    own = iban(rng)
+    others = _counterparties(rng)
+    lines = [f"Header line {i}" for i in range(1, 13)]
+    lines.append(
+        "Compte;Date comptable;N statement;N transaction;Compte contrepartie;Nom contrepartie;Num rue;Code postal;"
+        "Transaction;Date valeur;Montant;Devise;BIC;Code pays;Communication"
+    )
+    for i, when in enumerate(_dates(rng, n_rows)):
+        other, name = rng.choice(others)
+        valued = when + datetime.timedelta(days=rng.choice([0, 0, 0, 1]))
+        communication = f"{rng.choice(_WORDS)} {rng.randrange(10**6)}" if rng.random() < 0.7 else ""
+        lines.append(
+            f"{own};{when:%d/%m/%Y};{when.month:03d};{i % 1000:03d};{other};{name};{rng.randrange(1, 300)};"
+            f"{rng.choice(_CITIES)};{rng.choice(_WORDS)} REF. : {seed:x}{i:09X};{valued:%d/%m/%Y};"
+            f"{_fr_amount(_amount(rng))};EUR;GKCCBEBB;BE;{communication}"
+        )
+    return ("\n".join(lines) + "\n").encode("latin1", errors="replace")
+
+
+def ing_csv(n_rows: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    own = iban(rng).replace(" ", "")
+    others = _counterparties(rng)
+    lines = [
+        "Numéro de compte;Nom du compte;Compte partie adverse;Numéro de mouvement;Date comptable;Date valeur;"
+        "Montant;Devise;Libellés;Détails du mouvement;Message"
+    ]
+    for i, when in enumerate(_dates(rng, n_rows)):
+        other, name = rng.choice(others)
+        valued = when + datetime.timedelta(days=rng.choice([0, 0, 1]))
+        message = f"{rng.choice(_WORDS)} {name}" if rng.random() < 0.5 else ""
+        lines.append(
+            f"{own};Mon Compte;{other.replace(' ', '')};{i + 1:07d};{when:%d/%m/%Y};{valued:%d/%m/%Y};"
+            f"{_fr_amount(_amount(rng), thousands='.')};EUR;{rng.choice(_WORDS)};{name} {rng.randrange(10**6)};"
+            f"{message}"
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8-sig")
+
+
+# transaction rows per statement page, from the top of the table to the bottom of the page
+PDF_ROWS_PER_PAGE = 30
+
+
+def _pdf_escape(text: str) -> bytes:
+    return text.encode("cp1252").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _pdf_text(items: list[tuple[float, float, float, str]]) -> bytes:
+    return b"\n".join(
+        b"BT /F1 %g Tf 1 0 0 1 %g %g Tm (" % (size, x, y) + _pdf_escape(text) + b") Tj ET" for x, y, size, text in items
+    )
+
+
+def _pdf(pages: list[list[tuple[float, float, float, str]]], width: int = 700, height: int = 842) -> bytes:
+    """A minimal PDF with one Helvetica text object per item, pages in order."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (" ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))).encode(), len(pages)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, items in enumerate(pages):
+        content = _pdf_text(items)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % (width, height, 5 + 2 * i)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def mastercard_pdf(n_pages: int, seed: int = 0) -> bytes:
+    """A statement with a cover page and `n_pages` pages of PDF_ROWS_PER_PAGE transactions each."""
+    rng = random.Random(seed)
+    closing = datetime.date(2024, 1, 15)
+    start = datetime.date(2023, 12, 16)
+    cover = [(50, 800, 12, "Relevé de votre carte MasterCard"), (50, 770, 8, "Titulaire: J. Doe")]
+    pages = [cover]
+    for _ in range(n_pages):
+        page = [
+            (50, 800, 10, "Transactions - Carte 5412 **** **** 1234"),
+            (50, 780, 8, "Date de clôture"),
+            (250, 780, 8, f"{closing:%d/%m/%Y}"),
+            (50, 765, 8, "Date de débit"),
+            (250, 765, 8, f"{closing + datetime.timedelta(days=10):%d/%m/%Y}"),
+            (50, 745, 8, f"Transactions du {start:%d/%m/%Y} au {closing:%d/%m/%Y}"),
+        ]
+        days = sorted(rng.randrange(30) for _ in range(PDF_ROWS_PER_PAGE))
+        for row, day in enumerate(days):
+            y = 700 - 20 * row
+            valued = start + datetime.timedelta(days=day)
+            booked = min(valued + datetime.timedelta(days=rng.choice([0, 1, 2])), closing)
+            merchant, city, country = rng.choice(_MERCHANTS)
+            amount = min(Decimal(f"{rng.lognormvariate(2.5, 1.0):.2f}"), Decimal("999.99"))
+            sign = "+" if rng.random() < 0.05 else "-"
+            page += [
+                (50, y, 8, f"{booked:%d/%m}"),
+                (90, y, 8, f"{valued:%d/%m}"),
+                (140, y, 8, merchant),
+                (300, y, 8, city),
+                (390, y, 8, country),
+                (600, y, 8, f"{_fr_amount(amount)} EUR {sign}"),
+            ]
+        pages.append(page)
+    return _pdf(pages)
+
+
+def write_corpus(directory: str, n_rows: int, n_pages: int, seed: int = 0) -> dict[str, str]:
+    """Write the three exports into `directory`, unless already there. Returns their paths by parser name."""
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        "belfius": (f"belfius-{n_rows}-{seed}.csv", lambda: belfius_csv(n_rows, seed)),
+        "ing": (f"ing-{n_rows}-{seed}.csv", lambda: ing_csv(n_rows, seed)),
+        "mastercard": (f"mastercard-{n_pages}-{seed}.pdf", lambda: mastercard_pdf(n_pages, seed)),
+    }
+    paths = {}
+    for name, (filename, generate) in files.items():
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(generate())
+        paths[name] = path
+    return paths
@@ -0,0 +1,277 @@
+"""Parser, import and feature extraction throughput benchmarks.
+
+Generates (or reuses) a seeded corpus for each size, then measures rows per second and peak traced memory of the
+Belfius and ING CSV parsers, the MasterCard PDF parser, the full import (parsing, then `import_parsed_transactions`
+into a fresh in-memory SQLite database) and building the model features of the Belfius transactions, from scratch
+and from the feature store. Results are written as JSON, to be compared between releases:
+
+    python -m benchmarks.run --sizes 1k,100k,1M --pdf-pages 50 --output benchmarks/results/v1.2.json
+    python -m benchmarks.run --sizes 1k,100k --compare benchmarks/results/v1.2.json
+
+Speed and memory are measured in separate runs, tracing allocations slows Python code down a lot.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from types import SimpleNamespace
+from typing import Any
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.config import settings
+from app.database import Base
+from app.ml import feature_store
+from app.ml.feature_extractor import TransactionColumns, bank_csv_transformer
+from app.models import Currency
+from app.parsers import belfius, ing, mastercard
+from app.services.import_service import import_parsed_transactions
+from benchmarks.corpus import PDF_ROWS_PER_PAGE, write_corpus
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# relative slowdown (or memory increase) reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+@dataclass
+class Result:
+    name: str
+    rows: int
+    seconds: float
+    rows_per_second: float
+    peak_memory_bytes: int
+
+
+def parse_size(text: str) -> int:
+    """'1k' -> 1000, '1M' -> 1000000."""
+    text = text.strip()
+    factors = {"k": 10**3, "K": 10**3, "m": 10**6, "M": 10**6}
+    if text[-1:] in factors:
+        return int(float(text[:-1]) * factors[text[-1]])
+    return int(text)
+
+
+@contextmanager
+def _database() -> Iterator[Session]:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    try:
+        with Session(engine) as db:
+            db.add(Currency(symbol="€", short_name="EUR", long_name="Euro"))
+            db.commit()
+            yield db
+    finally:
+        engine.dispose()
+
+
+def _import(path: str, parse: Callable[[str], list[Any]], data_source: str) -> Callable[[], int]:
+    def run() -> int:
+        with _database() as db:
+            record = import_parsed_transactions(db, parse(path), data_source, filenames=[os.path.basename(path)])
+            db.commit()
+            return record.total_transactions
+
+    return run
+
+
+def _mastercard_transactions(path: str) -> list[Any]:
+    """Parsed transactions of a statement, as uploaded MasterCard files are imported."""
+    transactions, _, _ = mastercard.parse_files([path])
+    return list(mastercard.to_parsed_batch(transactions))
+
+
+def _belfius_columns(path: str) -> TransactionColumns:
+    """Model inputs of the transactions of a statement, accounts numbered in order of appearance."""
+    accounts: dict[str | None, int] = {}
+    transactions = [
+        SimpleNamespace(
+            description=t.description,
+            date=t.date,
+            amount=t.amount,
+            id_source=accounts.setdefault(t.source_number, len(accounts)),
+            id_dest=accounts.setdefault(t.dest_number, len(accounts)),
+        )
+        for t in belfius.parse_file(path)
+    ]
+    return TransactionColumns.from_transactions(transactions)
+
+
+def _features(path: str) -> Callable[[], int]:
+    """Fit the feature pipeline of the models on the transactions of a statement, as training does."""
+    columns = _belfius_columns(path)
+
+    def run() -> int:
+        bank_csv_transformer().fit_transform(columns)
+        return len(columns)
+
+    return run
+
+
+def _stored_features(path: str) -> Callable[[], int]:
+    """Build the features of a training from the feature store of the previous one, to which 1% of the transactions of
+    the statement were added."""
+    columns = _belfius_columns(path)
+    ids = np.arange(len(columns))
+    model_path = os.path.join(os.path.dirname(path), "models")
+    previous = ids < len(ids) * 0.99
+
+    @contextmanager
+    def store() -> Iterator[None]:
+        saved, settings.model_path = settings.model_path, model_path
+        try:
+            yield
+        finally:
+            settings.model_path = saved
+
+    with store():
+        feature_store.fit_transform("bank_csv", bank_csv_transformer, ids[previous], columns.take(previous))
+    store_path = os.path.join(model_path, "features", "bank_csv.joblib")
+    with open(store_path, "rb") as f:
+        stored = f.read()
+
+    def run() -> int:
+        with open(store_path, "wb") as f:
+            f.write(stored)
+        with store():
+            feature_store.fit_transform("bank_csv", bank_csv_transformer, ids, columns)
+        return len(columns)
+
+    return run
+
+
+def measure(name: str, run: Callable[[], int], repeat: int = 3) -> Result:
+    """Best time of `repeat` runs of `run` (which returns the number of rows it processed), then trace the memory of
+    another run."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(name, rows, round(seconds, 4), round(rows / seconds if seconds else 0.0, 1), peak)
+
+
+def benchmarks(n_rows: int, n_pages: int, seed: int, corpus_dir: str) -> dict[str, Callable[[], int]]:
+    paths = write_corpus(corpus_dir, n_rows, n_pages, seed)
+    return {
+        f"belfius.parse_file[{n_rows}]": lambda: len(belfius.parse_file(paths["belfius"])),
+        f"ing.parse_file[{n_rows}]": lambda: len(ing.parse_file(paths["ing"])),
+        f"mastercard.parse_pdf[{n_pages * PDF_ROWS_PER_PAGE}]": lambda: len(mastercard.parse_pdf(paths["mastercard"])),
+        f"import.belfius[{n_rows}]": _import(paths["belfius"], belfius.parse_file, "belfius"),
+        f"import.ing[{n_rows}]": _import(paths["ing"], ing.parse_file, "ing"),
+        f"import.mastercard[{n_pages * PDF_ROWS_PER_PAGE}]": _import(
+            paths["mastercard"], _mastercard_transactions, "mastercard"
+        ),
+        f"features.belfius[{n_rows}]": _features(paths["belfius"]),
+        f"features.stored.belfius[{n_rows}]": _stored_features(paths["belfius"]),
+    }
+
+
+def run_suite(
+    sizes: list[int],
+    n_pages: int,
+    seed: int = 0,
+    corpus_dir: str = CORPUS_DIR,
+    only: str | None = None,
+    repeat: int = 3,
+    log: Callable[[str], None] = lambda _: None,
+) -> dict[str, Any]:
+    """Run every benchmark (whose name contains `only`, if given) on the corpus of each size."""
+    results = []
+    for n_rows in sizes:
+        for name, run in benchmarks(n_rows, n_pages, seed, corpus_dir).items():
+            if only is not None and only not in name or any(r.name == name for r in results):
+                continue
+            result = measure(name, run, repeat)
+            log(f"{name:<40} {result.rows_per_second:>12,.0f} rows/s {result.peak_memory_bytes / 2**20:>10,.1f} MiB")
+            results.append(result)
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "seed": seed,
+        "pdf_pages": n_pages,
+        "repeat": repeat,
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Benchmarks of `current` slower, or using more memory, than in `previous` by more than `threshold`."""
+    before = {result["name"]: result for result in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        if result["rows_per_second"] < old["rows_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{result['name']}: {old['rows_per_second']:,.0f} -> {result['rows_per_second']:,.0f} rows/s"
+            )
+        if result["peak_memory_bytes"] > old["peak_memory_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{result['name']}: {old['peak_memory_bytes']:,} -> {result['peak_memory_bytes']:,} bytes peak memory"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k", help="CSV row counts, comma separated (e.g. 1k,100k,1M)")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="transaction pages of the MasterCard statement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs timed per benchmark, the best one is kept")
+    parser.add_argument("--only", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR, help="where generated files are kept between runs")
+    parser.add_argument("--output", help="JSON results file (default: results/<timestamp>.json)")
+    parser.add_argument("--compare", help="JSON results of a previous run: exit with 1 on regressions")
+    args = parser.parse_args(argv)
+
+    results = run_suite(
+        [parse_size(size) for size in args.sizes.split(",")],
+        args.pdf_pages,
+        seed=args.seed,
+        corpus_dir=args.corpus_dir,
+        only=args.only,
+        repeat=args.repeat,
+        log=print,
+    )
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ from contextlib import asynccontextmanager
 from decimal import Decimal
 
 os.environ.setdefault("BANKING_COOKIE_SECURE", "false")
+os.environ.setdefault("BANKING_PARSE_CACHE_DIR", "")
 
 import pytest
 from fastapi.testclient import TestClient
@@ -0,0 +1,75 @@
+"""Tests for the benchmark corpus generator and suite."""
+
+import io
+import json
+import random
+
+from app.parsers import belfius, ing, mastercard
+from benchmarks import corpus
+from benchmarks.run import compare, main, parse_size
+
+
+class TestCorpus:
+    def test_belfius(self):
+        transactions = belfius.parse_file(io.BytesIO(corpus.belfius_csv(500, seed=1)))
+        assert len(transactions) == 500
+        assert len({t.external_id for t in transactions}) == 500
+        assert all(t.amount > 0 and t.currency == "EUR" for t in transactions)
+
+    def test_ing(self):
+        transactions = ing.parse_file(io.BytesIO(corpus.ing_csv(500, seed=1)))
+        assert len(transactions) == 500
+        assert len({t.external_id for t in transactions}) == 500
+
+    def test_mastercard(self):
+        transactions = mastercard.parse_pdf(io.BytesIO(corpus.mastercard_pdf(2, seed=1)))
+        assert len(transactions) == 2 * corpus.PDF_ROWS_PER_PAGE
+        assert all(t["closing_date"].isoformat() == "2024-01-15" for t in transactions)
+
+    def test_seeded(self):
+        assert corpus.belfius_csv(100, seed=3) == corpus.belfius_csv(100, seed=3)
+        assert corpus.belfius_csv(100, seed=3) != corpus.belfius_csv(100, seed=4)
+        assert corpus.ing_csv(100, seed=3) == corpus.ing_csv(100, seed=3)
+        assert corpus.mastercard_pdf(1, seed=3) == corpus.mastercard_pdf(1, seed=3)
+
+    def test_iban_check_digits(self):
+        for _ in range(20):
+            number = corpus.iban(random.Random()).replace(" ", "")
+            rearranged = number[4:] + number[:4]
+            assert int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+class TestSuite:
+    def test_parse_size(self):
+        assert parse_size("1k") == 1000
+        assert parse_size("1M") == 1_000_000
+        assert parse_size("250") == 250
+
+    def test_run(self, tmp_path):
+        output = tmp_path / "results.json"
+        argv = ["--sizes", "50", "--pdf-pages", "1", "--repeat", "1", "--corpus-dir", str(tmp_path / "corpus")]
+        assert main([*argv, "--output", str(output)]) == 0
+
+        results = json.loads(output.read_text())
+        assert results["seed"] == 0
+        assert "python" in results["environment"]
+        by_name = {result["name"]: result for result in results["results"]}
+        assert set(by_name) == {
+            "belfius.parse_file[50]",
+            "ing.parse_file[50]",
+            "mastercard.parse_pdf[30]",
+            "import.belfius[50]",
+            "import.ing[50]",
+            "import.mastercard[30]",
+            "features.belfius[50]",
+            "features.stored.belfius[50]",
+        }
+        assert by_name["import.belfius[50]"]["rows"] == 50
+        assert all(result["rows_per_second"] > 0 and result["peak_memory_bytes"] > 0 for result in by_name.values())
+
+    def test_compare(self):
+        previous = {"results": [{"name": "a", "rows_per_second": 1000.0, "peak_memory_bytes": 100}]}
+        same = {"results": [{"name": "a", "rows_per_second": 950.0, "peak_memory_bytes": 105}]}
+        slower = {"results": [{"name": "a", "rows_per_second": 500.0, "peak_memory_bytes": 200}]}
+        assert compare(previous, same) == []
+        assert len(compare(previous, slower)) == 2
@@ -1,64 +1,103 @@
-"""Unit tests for import_service: resolve_account and find_duplicates."""
+"""Unit tests for import_service: account resolution, existence checks and find_duplicates."""
 
 import datetime
 from decimal import Decimal
 
-from app.models import Account, AccountAlias, Transaction
-from app.services.import_service import find_duplicates, resolve_account
+import pytest
 
+from app.models import (
+    Account,
+    AccountAlias,
+    CategorySplit,
+    ImportRecord,
+    LabelEvent,
+    MLModel,
+    TagRule,
+    Transaction,
+    TransactionGroup,
+    TransactionPrediction,
+    Wallet,
+    WalletAccount,
+)
+from app.parsers.common import ParsedTransaction
+from app.services import import_service
+from app.services.import_service import (
+    AccountResolver,
+    delete_import,
+    find_duplicates,
+    find_imported_external_ids,
+    import_batches,
+    import_parsed_transactions,
+    preview_batches,
+)
 
-class TestResolveAccount:
-    def test_creates_new_account_when_not_found(self, db, currency_eur):
-        account = resolve_account(db, "BE9999", "New Account", currency_eur.id)
-        assert account is not None
-        assert account.number == "BE9999"
-        assert account.name == "New Account"
-        assert account.id_currency == currency_eur.id
-        # Should be persisted
-        assert account.id is not None
 
-    def test_finds_existing_account_by_number(self, db, account_checking):
-        account = resolve_account(db, "BE1234", None, account_checking.id_currency)
-        assert account is not None
-        assert account.id == account_checking.id
+class TestAccountResolver:
+    def test_resolves_existing_by_number_and_name(self, db, account_checking, currency_eur):
+        resolver = AccountResolver(db)
+        assert resolver.resolve("BE1234", None, currency_eur.id) == account_checking.id
+        assert resolver.resolve(None, "Checking", currency_eur.id) == account_checking.id
+        assert resolver.pending_count == 0
 
-    def test_finds_existing_account_by_name(self, db, account_checking):
-        account = resolve_account(db, None, "Checking", account_checking.id_currency)
-        assert account is not None
-        assert account.id == account_checking.id
+    def test_precedence_number_before_alias_before_name(self, db, account_checking, account_savings, currency_eur):
+        db.add(AccountAlias(number="ALIAS001", name="Alias Name", id_account=account_savings.id))
+        db.flush()
+
+        resolver = AccountResolver(db)
+        # number wins over name
+        assert resolver.resolve("BE1234", "Savings", currency_eur.id) == account_checking.id
+        # alias number wins over name
+        assert resolver.resolve("ALIAS001", "Checking", currency_eur.id) == account_savings.id
+        # name wins over alias name
+        assert resolver.resolve(None, "Checking", currency_eur.id) == account_checking.id
+        assert resolver.resolve("UNKNOWN", "Alias Name", currency_eur.id) == account_savings.id
 
     def test_returns_none_when_both_number_and_name_are_none(self, db, currency_eur):
-        account = resolve_account(db, None, None, currency_eur.id)
-        assert account is None
+        assert AccountResolver(db).resolve(None, None, currency_eur.id) is None
 
-    def test_tracks_new_account_ids(self, db, currency_eur):
-        new_ids: set[int] = set()
-        account = resolve_account(db, "BE0001", "Brand New", currency_eur.id, _new_account_ids=new_ids)
-        assert account is not None
-        assert account.id in new_ids
+    def test_creates_missing_accounts_in_one_batch(self, db, currency_eur):
+        resolver = AccountResolver(db)
+        first = resolver.resolve("BE0001", None, currency_eur.id)
+        second = resolver.resolve(None, "Shop", currency_eur.id)
+        # later rows resolve to accounts staged earlier in the batch
+        assert resolver.resolve("BE0001", "Other", currency_eur.id) == first
+        assert resolver.resolve("BE0002", "Shop", currency_eur.id) == second
+        assert resolver.pending_count == 2
 
-    def test_does_not_track_existing_account(self, db, account_checking):
-        new_ids: set[int] = set()
-        resolve_account(db, "BE1234", None, account_checking.id_currency, _new_account_ids=new_ids)
-        assert len(new_ids) == 0
+        resolver.create_pending()
+        first_id, second_id = resolver.real_id(first), resolver.real_id(second)
+        assert resolver.new_account_ids == {first_id, second_id}
+        assert db.get(Account, first_id).number == "BE0001"
+        assert db.get(Account, second_id).name == "Shop"
+        assert resolver.lookup(None, "Shop") == second_id
+        assert resolver.real_id(first_id) == first_id
+
+    def test_does_not_track_existing_account(self, db, account_checking, currency_eur):
+        resolver = AccountResolver(db)
+        resolver.resolve("BE1234", None, currency_eur.id)
+        resolver.create_pending()
+        assert resolver.new_account_ids == set()
 
     def test_finds_account_by_alias_number(self, db, account_checking, currency_eur):
-        alias = AccountAlias(number="ALIAS001", name=None, id_account=account_checking.id)
-        db.add(alias)
+        db.add(AccountAlias(number="ALIAS001", name=None, id_account=account_checking.id))
         db.flush()
 
-        account = resolve_account(db, "ALIAS001", None, currency_eur.id)
-        assert account is not None
-        assert account.id == account_checking.id
+        assert AccountResolver(db).resolve("ALIAS001", None, currency_eur.id) == account_checking.id
 
     def test_finds_account_by_alias_name(self, db, account_checking, currency_eur):
-        alias = AccountAlias(number=None, name="Alias Name", id_account=account_checking.id)
-        db.add(alias)
+        db.add(AccountAlias(number=None, name="Alias Name", id_account=account_checking.id))
         db.flush()
 
-        account = resolve_account(db, None, "Alias Name", currency_eur.id)
-        assert account is not None
-        assert account.id == account_checking.id
+        assert AccountResolver(db).resolve(None, "Alias Name", currency_eur.id) == account_checking.id
+
+    def test_created_account_fields(self, db, currency_eur):
+        resolver = AccountResolver(db)
+        placeholder = resolver.resolve("BE9999", "New Account", currency_eur.id)
+        resolver.create_pending()
+
+        account = db.get(Account, resolver.real_id(placeholder))
+        assert (account.number, account.name, account.id_currency) == ("BE9999", "New Account", currency_eur.id)
+        assert account.initial_balance == 0
 
 
 class TestFindDuplicates:
@@ -93,6 +132,36 @@ class TestFindDuplicates:
         assert "new-001" in result
         assert result["new-001"] == existing.id
 
+    def test_matches_one_sided_transactions(self, db, account_checking, account_savings, currency_eur):
+        # card transactions have no counterpart account
+        existing = Transaction(
+            external_id="card-001",
+            id_source=account_checking.id,
+            id_dest=None,
+            date=datetime.date(2024, 7, 1),
+            amount=Decimal("-25.00"),
+            id_currency=currency_eur.id,
+            data_source="mastercard",
+            description="Existing card payment",
+        )
+        db.add(existing)
+        db.flush()
+
+        def card(external_id: str, id_dest: int | None) -> Transaction:
+            return Transaction(
+                external_id=external_id,
+                id_source=account_checking.id,
+                id_dest=id_dest,
+                date=datetime.date(2024, 7, 1),
+                amount=Decimal("-25.00"),
+                id_currency=currency_eur.id,
+                data_source="mastercard",
+                description="Card payment",
+            )
+
+        result = find_duplicates(db, [card("card-002", None), card("card-003", account_savings.id)])
+        assert result == {"card-002": existing.id}
+
     def test_returns_empty_when_no_matches(self, db, account_checking, account_savings, currency_eur):
         new_tx = Transaction(
             external_id="unique-001",
@@ -137,3 +206,403 @@ class TestFindDuplicates:
         assert dup_ext_id in ("batch-001", "batch-002")
         # Within-batch duplicates have None as parent id
         assert result[dup_ext_id] is None
+
+    def test_single_query_for_whole_batch(self, db, test_engine, account_checking, account_savings, currency_eur):
+        from sqlalchemy import event
+
+        batch = [
+            Transaction(
+                external_id=f"q-{i}",
+                id_source=account_checking.id,
+                id_dest=account_savings.id,
+                date=datetime.date(2024, 7, 1) + datetime.timedelta(days=i),
+                amount=Decimal("10.00"),
+                id_currency=currency_eur.id,
+                description=f"Row {i}",
+            )
+            for i in range(20)
+        ]
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(test_engine, "before_cursor_execute", count)
+        try:
+            find_duplicates(db, batch)
+        finally:
+            event.remove(test_engine, "before_cursor_execute", count)
+        assert len(statements) == 1
+
+    def test_mixes_database_and_batch_duplicates(self, db, account_checking, account_savings, currency_eur):
+        def make(ext_id, day, amount, id_dest=account_savings.id):
+            return Transaction(
+                external_id=ext_id,
+                id_source=account_checking.id,
+                id_dest=id_dest,
+                date=datetime.date(2024, 7, day),
+                amount=Decimal(amount),
+                id_currency=currency_eur.id,
+                description=ext_id,
+            )
+
+        existing = make("existing", 2, "30.00")
+        db.add(existing)
+        db.flush()
+
+        batch = [
+            make("db-dup", 2, "30"),
+            make("a", 3, "5.00"),
+            make("b", 3, "5.00"),
+            make("no-dest-1", 2, "30.00", id_dest=None),
+            make("no-dest-2", 2, "30.00", id_dest=None),
+            make("other-day", 4, "30.00"),
+        ]
+        result = find_duplicates(db, batch)
+        assert result == {"db-dup": existing.id, "a": None, "no-dest-1": None}
+
+
+class TestFindImportedExternalIds:
+    @staticmethod
+    def _parsed(external_id, day, source_number="BE1234", dest_number="BE5678"):
+        return ParsedTransaction(
+            external_id=external_id,
+            source_number=source_number,
+            source_name=None,
+            dest_number=dest_number,
+            dest_name=None,
+            date=datetime.date(2024, 6, day),
+            amount=Decimal("25.00"),
+            currency="EUR",
+            description="",
+            data_source="belfius",
+        )
+
+    def test_finds_existing_ids(self, db, sample_transaction):
+        parsed = [self._parsed("test-tx-001", 15), self._parsed("new-id", 10)]
+        assert find_imported_external_ids(db, parsed, AccountResolver(db)) == {"test-tx-001"}
+
+    def test_rows_after_account_watermark_are_not_looked_up(self, db, sample_transaction, monkeypatch):
+        checked = []
+        original_chunks = import_service._chunks
+
+        def recording_chunks(ids, size):
+            checked.extend(ids)
+            return original_chunks(ids, size)
+
+        monkeypatch.setattr(import_service, "_chunks", recording_chunks)
+
+        parsed = [self._parsed("old", 14), self._parsed("newer", 20), self._parsed("unknown", 20, "XX", "YY")]
+        assert find_imported_external_ids(db, parsed, AccountResolver(db)) == set()
+        # 'newer' is dated after every transaction of its accounts, 'unknown' has no known account
+        assert checked == ["old", "unknown"]
+
+    def test_import_checks_every_id_when_watermarks_are_stale(self, db, sample_transaction):
+        # imported before with another date, so the watermarks of its accounts take the row for new
+        parsed = [self._parsed("test-tx-001", 20), self._parsed("new-id", 21)]
+        assert find_imported_external_ids(db, parsed, AccountResolver(db)) == set()
+
+        record = import_parsed_transactions(db, parsed, "belfius")
+
+        assert (record.skipped_transactions, record.new_transactions) == (1, 1)
+        assert db.query(Transaction).filter(Transaction.external_id == "test-tx-001").one().id == sample_transaction.id
+        assert db.query(Transaction).filter(Transaction.external_id == "new-id").count() == 1
+
+    def test_checks_in_chunks(self, db, import_record, monkeypatch):
+        monkeypatch.setattr(import_service, "EXISTENCE_CHECK_CHUNK_SIZE", 1)
+        parsed = [self._parsed("import-tx-0", 15), self._parsed("import-tx-1", 15), self._parsed("other", 15)]
+        assert find_imported_external_ids(db, parsed, AccountResolver(db)) == {"import-tx-0", "import-tx-1"}
+
+
+class TestImportParsedTransactions:
+    @staticmethod
+    def _parsed(external_id, source_name, amount, day=1, description=""):
+        return ParsedTransaction(
+            external_id=external_id,
+            source_number="BE1234",
+            source_name=None,
+            dest_number=None,
+            dest_name=source_name,
+            date=datetime.date(2024, 7, day),
+            amount=Decimal(amount),
+            currency="EUR",
+            description=description,
+            data_source="belfius",
+        )
+
+    def test_statistics_duplicates_and_new_accounts(self, db, account_checking, account_savings, currency_eur):
+        existing = Transaction(
+            external_id="existing",
+            id_source=account_checking.id,
+            id_dest=account_savings.id,
+            date=datetime.date(2024, 7, 1),
+            amount=Decimal("10.00"),
+            id_currency=currency_eur.id,
+            data_source="belfius",
+        )
+        db.add(existing)
+        db.flush()
+
+        parsed = [
+            self._parsed("existing", "Savings", "10.00"),  # already imported
+            self._parsed("db-dup", "Savings", "10.00"),  # same key as 'existing'
+            self._parsed("shop-1", "Shop", "5.00", day=2),
+            self._parsed("shop-2", "Shop", "5.00", day=2),  # duplicate within the batch
+            self._parsed("cafe", "Cafe", "3.00", day=3),
+        ]
+        record = import_parsed_transactions(db, parsed, "belfius", filenames=["a.csv"])
+
+        assert record.total_transactions == 5
+        assert record.skipped_transactions == 1
+        assert record.new_transactions == 2
+        assert record.duplicate_transactions == 2
+        assert record.new_accounts == 2
+        assert record.date_earliest == datetime.date(2024, 7, 1)
+        assert record.date_latest == datetime.date(2024, 7, 3)
+
+        imported = {t.external_id: t for t in db.query(Transaction).filter_by(id_import=record.id)}
+        assert set(imported) == {"db-dup", "shop-1", "shop-2", "cafe"}
+        assert imported["db-dup"].id_duplicate_of == existing.id
+        assert imported["shop-1"].id_duplicate_of is None
+        assert imported["shop-1"].id_dest == imported["shop-2"].id_dest
+        assert db.get(Account, imported["cafe"].id_dest).name == "Cafe"
+
+    def test_applies_tag_rules_to_non_duplicates(self, db, account_checking, currency_eur, category_food):
+        db.add(TagRule(name="Groceries", id_category=category_food.id, match_description="market", priority=1))
+        db.flush()
+
+        parsed = [
+            self._parsed("m-1", "Market", "12.30", description="Super market"),
+            self._parsed("m-2", "Bakery", "2.10", description="Bread"),
+        ]
+        record = import_parsed_transactions(db, parsed, "belfius")
+        assert record.auto_tagged == 1
+
+        tagged = db.query(Transaction).filter_by(external_id="m-1").one()
+        assert tagged.auto_tagged_at_import is True
+        assert tagged.is_reviewed is True
+        assert [(cs.id_category, cs.amount) for cs in tagged.category_splits] == [(category_food.id, Decimal("12.30"))]
+        untagged = db.query(Transaction).filter_by(external_id="m-2").one()
+        assert untagged.auto_tagged_at_import is False
+        assert untagged.category_splits == []
+
+
+class TestImportBatches:
+    _parsed = staticmethod(TestImportParsedTransactions._parsed)
+
+    def _batches(self):
+        return [
+            [self._parsed("a", "Shop", "5.00"), self._parsed("b", "Cafe", "3.00", day=2)],
+            [self._parsed("a", "Shop", "5.00"), self._parsed("c", "Shop", "5.00")],  # 'a' again, 'c' duplicates it
+            [self._parsed("d", "Bar", "7.00", day=9)],
+        ]
+
+    def test_statistics_accumulate_across_batches(self, db, account_checking, currency_eur):
+        record = import_batches(db, self._batches(), "belfius")
+
+        assert record.checkpoint is None
+        assert record.total_transactions == 5
+        assert record.skipped_transactions == 1
+        assert record.new_transactions == 3
+        assert record.duplicate_transactions == 1
+        assert record.new_accounts == 3
+        assert record.date_earliest == datetime.date(2024, 7, 1)
+        assert record.date_latest == datetime.date(2024, 7, 9)
+
+        imported = {t.external_id: t for t in db.query(Transaction).filter_by(id_import=record.id)}
+        assert set(imported) == {"a", "b", "c", "d"}
+        # the account created by the first batch is reused by the second one
+        assert imported["c"].id_dest == imported["a"].id_dest
+        assert imported["c"].id_duplicate_of == imported["a"].id
+
+    def test_import_parsed_transactions_in_batches(self, db, account_checking, currency_eur):
+        parsed = [row for batch in self._batches() for row in batch]
+        record = import_parsed_transactions(db, parsed, "belfius", batch_size=2)
+        assert (record.new_transactions, record.duplicate_transactions, record.skipped_transactions) == (3, 1, 1)
+
+    def test_resume_after_failure(self, db, account_checking, currency_eur):
+        def failing():
+            batches = self._batches()
+            yield batches[0]
+            yield batches[1]
+            raise RuntimeError("connection lost")
+
+        with pytest.raises(RuntimeError):
+            import_batches(db, failing(), "belfius")
+
+        record = db.query(ImportRecord).one()
+        assert record.checkpoint == 4
+        assert (record.new_transactions, record.duplicate_transactions) == (2, 1)
+
+        resumed = import_batches(db, self._batches(), "belfius", resume=record)
+
+        assert resumed.id == record.id
+        assert resumed.checkpoint is None
+        assert resumed.total_transactions == 5
+        assert resumed.new_transactions == 3
+        assert resumed.new_accounts == 3
+        assert db.query(Transaction).filter_by(id_import=record.id).count() == 4
+
+    def test_fails_without_currency(self, db):
+        with pytest.raises(ValueError, match="No currency"):
+            import_batches(db, [[self._parsed("a", "Shop", "5.00")]], "belfius")
+
+    def test_cannot_resume_completed_import(self, db, currency_eur):
+        record = import_batches(db, [[self._parsed("a", "Shop", "5.00")]], "belfius")
+        with pytest.raises(ValueError):
+            import_batches(db, [], "belfius", resume=record)
+
+
+class TestDeleteImport:
+    _parsed = staticmethod(TestImportParsedTransactions._parsed)
+
+    def test_removes_everything_the_import_brought_in(self, db, account_checking, currency_eur, category_food):
+        db.add(TagRule(name="Bars", id_category=category_food.id, match_description="beer", priority=1))
+        db.flush()
+        first = import_batches(
+            db, [[self._parsed("a", "Shop", "5.00"), self._parsed("b", "Cafe", "3.00", day=2)]], "belfius"
+        )
+        record = import_batches(
+            db,
+            [[self._parsed("c", "Shop", "5.00"), self._parsed("d", "Bar", "7.00", day=9, description="beer")]],
+            "belfius",
+        )
+        assert {a.name for a in db.query(Account).filter_by(id_import=first.id)} == {"Shop", "Cafe"}
+        assert {a.name for a in db.query(Account).filter_by(id_import=record.id)} == {"Bar"}
+
+        a, c, d = (db.query(Transaction).filter_by(external_id=e).one() for e in "acd")
+        assert c.id_duplicate_of == a.id
+        c.id_duplicate_of = None
+        a.id_duplicate_of = c.id  # an earlier import pointing into the removed one
+        group = TransactionGroup(name="Night out")
+        db.add(group)
+        db.flush()
+        d.id_transaction_group = a.id_transaction_group = group.id
+        a.effective_amount = Decimal("1.00")
+        db.add(CategorySplit(id_group=group.id, id_category=category_food.id, amount=Decimal("12.00")))
+        model = MLModel(filename="model.pkl", state="valid")
+        db.add(model)
+        db.flush()
+        db.add_all(TransactionPrediction(id_transaction=t.id, id_model=model.id, top_k=[]) for t in (a, c))
+        db.commit()
+
+        labelled, id_group = d.id, group.id
+        assert db.query(LabelEvent).filter_by(kind="label", id_transaction=labelled).count() == 1  # tagged by rule
+
+        deletion = delete_import(db, record)
+
+        assert (deletion.transactions, deletion.category_splits, deletion.duplicates_cleared) == (2, 1, 1)
+        assert (deletion.groups_dissolved, deletion.accounts) == (1, 1)
+        assert db.get(ImportRecord, record.id) is None
+        assert {t.external_id for t in db.query(Transaction)} == {"a", "b"}
+        a = db.query(Transaction).filter_by(external_id="a").one()
+        assert (a.id_duplicate_of, a.id_transaction_group, a.effective_amount) == (None, None, None)
+        assert db.query(TransactionGroup).count() == 0
+        assert db.query(CategorySplit).count() == 0
+        assert [p.id_transaction for p in db.query(TransactionPrediction)] == [a.id]
+        unlabelled = {(e.id_transaction, e.id_group) for e in db.query(LabelEvent).filter_by(kind="unlabel")}
+        assert unlabelled == {(labelled, None), (None, id_group)}
+        assert {a.name for a in db.query(Account).filter_by(id_import=first.id)} == {"Shop", "Cafe"}
+        assert db.query(Account).filter_by(name="Bar").count() == 0
+
+    def test_keeps_accounts_used_elsewhere(self, db, account_checking, currency_eur):
+        record = import_batches(
+            db, [[self._parsed("a", "Shop", "5.00"), self._parsed("b", "Cafe", "3.00", day=2)]], "belfius"
+        )
+        shop = db.query(Account).filter_by(name="Shop").one()
+        wallet = Wallet(name="Main")
+        db.add(wallet)
+        db.flush()
+        db.add(WalletAccount(id_wallet=wallet.id, id_account=shop.id))
+        db.commit()
+
+        deletion = delete_import(db, record)
+
+        assert deletion.accounts == 1
+        assert db.query(Account).filter_by(name="Cafe").count() == 0
+        assert db.get(Account, shop.id).id_import is None
+
+
+class TestPreviewBatches:
+    _parsed = staticmethod(TestImportParsedTransactions._parsed)
+    STATISTICS = (
+        "total_transactions",
+        "new_transactions",
+        "duplicate_transactions",
+        "skipped_transactions",
+        "new_accounts",
+        "auto_tagged",
+        "date_earliest",
+        "date_latest",
+    )
+
+    def _setup(self, db, account_checking, account_savings, currency_eur, category_food):
+        db.add(TagRule(name="Groceries", id_category=category_food.id, match_description="market", priority=1))
+        db.add(
+            Transaction(
+                external_id="existing",
+                id_source=account_checking.id,
+                id_dest=account_savings.id,
+                date=datetime.date(2024, 7, 1),
+                amount=Decimal("10.00"),
+                id_currency=currency_eur.id,
+                data_source="belfius",
+            )
+        )
+        db.flush()
+        return [
+            [
+                self._parsed("existing", "Savings", "10.00"),  # already imported
+                self._parsed("db-dup", "Savings", "10.00", description="market"),  # same key as 'existing'
+                self._parsed("shop-1", "Shop", "5.00", day=2, description="market"),
+                self._parsed("shop-2", "Shop", "5.00", day=2),  # duplicate within the batch
+            ],
+            [
+                self._parsed("shop-1", "Shop", "5.00", day=2),  # repeated from the first batch
+                self._parsed("shop-3", "Shop", "5.00", day=2, description="market"),  # duplicate of the first batch
+                self._parsed("cafe", "Cafe", "3.00", day=3, description="market"),
+            ],
+        ]
+
+    def test_matches_import_without_writing(self, db, account_checking, account_savings, currency_eur, category_food):
+        batches = self._setup(db, account_checking, account_savings, currency_eur, category_food)
+        counts = (db.query(Transaction).count(), db.query(Account).count())
+
+        preview = preview_batches(db, batches, "belfius")
+
+        assert not db.new and not db.dirty
+        assert (db.query(Transaction).count(), db.query(Account).count()) == counts
+        record = import_batches(db, batches, "belfius")
+        assert {k: getattr(preview, k) for k in self.STATISTICS} == {k: getattr(record, k) for k in self.STATISTICS}
+        assert preview.auto_tagged == 2
+
+    def test_one_sided_duplicate_of_earlier_batch(self, db, account_checking, currency_eur):
+        # card payments have no counterpart account; batches of one row, as with batch_size=1
+        batches = [[self._parsed("card-1", None, "25.00")], [self._parsed("card-2", None, "25.00")]]
+
+        preview = preview_batches(db, batches, "mastercard_pdf")
+        record = import_batches(db, batches, "mastercard_pdf")
+        assert (preview.new_transactions, preview.duplicate_transactions) == (1, 1)
+        assert {k: getattr(preview, k) for k in self.STATISTICS} == {k: getattr(record, k) for k in self.STATISTICS}
+
+    def test_details(self, db, account_checking, account_savings, currency_eur, category_food):
+        batches = self._setup(db, account_checking, account_savings, currency_eur, category_food)
+        preview = preview_batches(db, batches, "belfius", sample_size=5)
+
+        assert preview.skipped_ids == ["existing", "shop-1"]
+        assert {(d.external_id, d.id_duplicate_of) for d in preview.duplicates} == {
+            ("db-dup", db.query(Transaction).filter_by(external_id="existing").one().id),
+            ("shop-1", None),
+            ("shop-3", None),
+        }
+        assert [(a.number, a.name) for a in preview.accounts] == [(None, "Shop"), (None, "Cafe")]
+        assert [(r.external_id, r.status) for r in preview.sample] == [
+            ("existing", "skipped"),
+            ("db-dup", "duplicate"),
+            ("shop-1", "duplicate"),
+            ("shop-2", "new"),
+            ("shop-1", "skipped"),
+        ]
+        shop = preview.sample[2]
+        assert (shop.id_source, shop.id_dest) == (account_checking.id, None)  # the shop account would be created
+        assert shop.id_category == category_food.id
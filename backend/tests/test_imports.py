@@ -1,10 +1,249 @@
 """Tests for import endpoints."""
 
 import datetime
+import os
 from decimal import Decimal
 
 import pytest
+from sqlalchemy.orm import sessionmaker
+
 from app.models import ImportRecord, Transaction
+from app.services.import_jobs import get_job
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def job_sessions(db, monkeypatch):
+    """Run import jobs on the test connection so their writes are rolled back with the test."""
+    factory = sessionmaker(
+        bind=db.connection(), autoflush=False, expire_on_commit=False, join_transaction_mode="create_savepoint"
+    )
+    monkeypatch.setattr("app.database.SessionLocal", factory)
+
+
+def _fixture(filename):
+    with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+        return f.read()
+
+
+def _upload(client, auth_headers, filename, format, content=None, query=""):
+    if content is None:
+        content = _fixture(filename)
+    return client.post(
+        f"/api/v2/imports/upload?format={format}{query}",
+        headers=auth_headers,
+        files=[("files", (filename, content, "text/csv"))],
+    )
+
+
+class TestUpload:
+    def test_upload_returns_job_and_imports_in_background(self, client, auth_headers, currency_eur, job_sessions):
+        r = _upload(client, auth_headers, "belfius_sample.csv", "belfius")
+        assert r.status_code == 202
+        job_id = r.json()["id"]
+        get_job(job_id).wait(timeout=30)
+
+        r = client.get(f"/api/v2/imports/jobs/{job_id}", headers=auth_headers)
+        assert r.status_code == 200
+        job = r.json()
+        assert job["status"] == "done"
+        assert job["error"] is None
+        assert job["rows_total"] == job["rows_processed"] == 2
+        assert {"parse", "resolve", "dedupe", "rules", "insert"} <= set(job["timings"])
+
+        record = client.get(f"/api/v2/imports/{job['id_import']}", headers=auth_headers).json()
+        assert record["filenames"] == ["belfius_sample.csv"]
+        assert record["new_transactions"] == 2
+        assert set(record["timings"]) == set(job["timings"])
+
+    def test_upload_rejects_mismatching_format(self, client, auth_headers, currency_eur):
+        r = _upload(client, auth_headers, "belfius_sample.csv", "ing")
+        assert r.status_code == 400
+
+    def test_upload_rejects_unknown_format(self, client, auth_headers, currency_eur):
+        r = _upload(client, auth_headers, "ing_sample.csv", "unknown")
+        assert r.status_code == 400
+
+    def test_upload_leaves_out_files_not_accepted_by_format(self, client, auth_headers, currency_eur, job_sessions):
+        r = client.post(
+            "/api/v2/imports/upload?format=camt053",
+            headers=auth_headers,
+            files=[
+                ("files", ("notes.txt", b"not a statement", "text/plain")),
+                ("files", ("statement.xml", _fixture("camt053_sample.xml"), "application/xml")),
+            ],
+        )
+        assert r.status_code == 202
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        assert job.status == "done"
+        record = client.get(f"/api/v2/imports/{job.id_import}", headers=auth_headers).json()
+        assert record["filenames"] == ["statement.xml"]
+
+    def test_upload_rejects_when_no_file_accepted_by_format(self, client, auth_headers, db, currency_eur):
+        r = _upload(client, auth_headers, "notes.txt", "camt053", content=b"not a statement")
+        assert r.status_code == 400
+        assert db.query(ImportRecord).count() == 0
+
+    def test_mastercard_requires_account(self, client, auth_headers, currency_eur):
+        r = _upload(client, auth_headers, "ing_sample.csv", "mastercard_pdf")
+        assert r.status_code == 400
+
+    def test_failed_job_reports_error(self, client, auth_headers, currency_eur, job_sessions):
+        # right header, truncated row: parsing fails inside the job
+        content = "Numéro de compte;Nom\nBE12;Truncated\n".encode("utf-8-sig")
+        r = _upload(client, auth_headers, "broken.csv", "ing", content=content)
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        data = client.get(f"/api/v2/imports/jobs/{job.id}", headers=auth_headers).json()
+        assert data["status"] == "failed"
+        assert data["error"]
+        assert data["id_import"] is None
+
+    def test_resume_requires_unfinished_import(self, client, auth_headers, import_record):
+        r = _upload(client, auth_headers, "belfius_sample.csv", "belfius", query=f"&resume={import_record.id}")
+        assert r.status_code == 400
+        r = _upload(client, auth_headers, "belfius_sample.csv", "belfius", query="&resume=999")
+        assert r.status_code == 404
+
+    def test_reupload_is_skipped(self, client, auth_headers, currency_eur, job_sessions):
+        first = get_job(_upload(client, auth_headers, "belfius_sample.csv", "belfius").json()["id"])
+        first.wait(timeout=30)
+
+        r = _upload(client, auth_headers, "belfius_sample.csv", "belfius")
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        data = client.get(f"/api/v2/imports/jobs/{job.id}", headers=auth_headers).json()
+        assert data["status"] == "done"
+        assert data["id_import"] == first.id_import
+        assert data["skipped_files"] == [{"filename": "belfius_sample.csv", "id_import": first.id_import}]
+        assert len(client.get("/api/v2/imports", headers=auth_headers).json()) == 1
+
+    def test_only_known_files_are_skipped(self, client, auth_headers, currency_eur, job_sessions):
+        with open(os.path.join(FIXTURES_DIR, "belfius_sample.csv"), "rb") as f:
+            content = f.read()
+        get_job(_upload(client, auth_headers, "old.csv", "belfius", content=content).json()["id"]).wait(timeout=30)
+
+        r = client.post(
+            "/api/v2/imports/upload?format=belfius",
+            headers=auth_headers,
+            files=[
+                ("files", ("renamed.csv", content, "text/csv")),
+                ("files", ("new.csv", content.replace(b"50,00", b"51,00"), "text/csv")),
+                ("files", ("new_copy.csv", content.replace(b"50,00", b"51,00"), "text/csv")),
+            ],
+        )
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        assert job.status == "done"
+        assert [(s.filename, s.id_import is None) for s in job.skipped_files] == [
+            ("renamed.csv", False),
+            ("new_copy.csv", True),
+        ]
+        record = client.get(f"/api/v2/imports/{job.id_import}", headers=auth_headers).json()
+        assert record["filenames"] == ["new.csv"]
+
+    def test_preview(self, client, auth_headers, currency_eur, job_sessions):
+        r = client.post(
+            "/api/v2/imports/preview?format=belfius",
+            headers=auth_headers,
+            files=[("files", ("belfius_sample.csv", _fixture("belfius_sample.csv"), "text/csv"))],
+        )
+        assert r.status_code == 200
+        preview = r.json()
+        assert [row["status"] for row in preview["sample"]] == ["new", "new"]
+        assert preview["skipped_files"] == []
+        assert client.get("/api/v2/imports", headers=auth_headers).json() == []
+
+        job = get_job(_upload(client, auth_headers, "belfius_sample.csv", "belfius").json()["id"])
+        job.wait(timeout=30)
+        record = client.get(f"/api/v2/imports/{job.id_import}", headers=auth_headers).json()
+        for key in ("total_transactions", "new_transactions", "new_accounts", "date_earliest", "date_latest"):
+            assert preview[key] == record[key]
+
+        r = client.post(
+            "/api/v2/imports/preview?format=belfius",
+            headers=auth_headers,
+            files=[("files", ("again.csv", _fixture("belfius_sample.csv"), "text/csv"))],
+        )
+        preview = r.json()
+        assert preview["total_transactions"] == 0
+        assert preview["skipped_files"] == [{"filename": "again.csv", "id_import": job.id_import}]
+
+    def test_mixed_formats(self, client, auth_headers, db, currency_eur, job_sessions):
+        r = client.post(
+            "/api/v2/imports/upload",
+            headers=auth_headers,
+            files=[
+                ("files", ("ing.csv", _fixture("ing_sample.csv"), "text/csv")),
+                ("files", ("belfius.csv", _fixture("belfius_sample.csv"), "text/csv")),
+            ],
+        )
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        assert job.status == "done"
+
+        record = client.get(f"/api/v2/imports/{job.id_import}", headers=auth_headers).json()
+        assert record["format"] == "mixed"
+        assert record["files"] == [
+            {"filename": "ing.csv", "format": "ing"},
+            {"filename": "belfius.csv", "format": "belfius"},
+        ]
+        sources = [t.data_source for t in db.query(Transaction).filter_by(id_import=job.id_import)]
+        assert sorted(set(sources)) == ["belfius", "ing"]
+        assert len(sources) == record["total_transactions"]
+
+    def test_structured_statements(self, client, auth_headers, db, currency_eur, job_sessions):
+        r = client.post(
+            "/api/v2/imports/upload",
+            headers=auth_headers,
+            files=[
+                ("files", ("statement.xml", _fixture("camt053_sample.xml"), "application/xml")),
+                ("files", ("statement.sta", _fixture("mt940_sample.sta"), "text/plain")),
+                ("files", ("statement.ofx", _fixture("ofx_sample.ofx"), "application/x-ofx")),
+            ],
+        )
+        job = get_job(r.json()["id"])
+        job.wait(timeout=30)
+        assert job.status == "done", job.error
+
+        record = client.get(f"/api/v2/imports/{job.id_import}", headers=auth_headers).json()
+        assert [f["format"] for f in record["files"]] == ["camt053", "mt940", "ofx"]
+        assert record["total_transactions"] == 10
+        # the CAMT.053 and OFX statements are of the same account: the salary in both is flagged as a duplicate
+        camt = db.query(Transaction).filter_by(external_id="BE68539007547034/REF-0001").one()
+        ofx = db.query(Transaction).filter_by(external_id="BE68539007547034/20240701-0001").one()
+        assert (camt.data_source, ofx.data_source) == ("camt053", "ofx")
+        assert camt.source.number == "BE71096123456769"
+        assert ofx.id_duplicate_of == camt.id
+
+    def test_auto_format_single_bank(self, client, auth_headers, currency_eur, job_sessions):
+        r = client.post(
+            "/api/v2/imports/preview",
+            headers=auth_headers,
+            files=[("files", ("export.csv", _fixture("ing_sample.csv"), "text/csv"))],
+        )
+        assert r.status_code == 200
+        assert r.json()["format"] == "ing"
+        assert r.json()["files"] == [{"filename": "export.csv", "format": "ing"}]
+
+    def test_auto_format_rejects_unrecognized_file(self, client, auth_headers, currency_eur):
+        r = _upload(client, auth_headers, "notes.csv", "auto", content=b"date;amount\n")
+        assert r.status_code == 400
+        assert "notes.csv" in r.json()["detail"]
+
+    def test_auto_format_mastercard_requires_account(self, client, auth_headers, currency_eur):
+        r = client.post(
+            "/api/v2/imports/upload",
+            headers=auth_headers,
+            files=[("files", ("statement.pdf", _fixture("mastercard_sample.pdf"), "application/pdf"))],
+        )
+        assert r.status_code == 400
+
+    def test_unknown_job(self, client, auth_headers, currency_eur):
+        r = client.get("/api/v2/imports/jobs/does-not-exist", headers=auth_headers)
+        assert r.status_code == 404
 
 
 class TestListImports:
@@ -73,6 +312,26 @@ class TestGetImport:
         assert r.status_code == 404
 
 
+class TestDeleteImport:
+    def test_delete(self, client, auth_headers, db, import_record, account_checking):
+        r = client.delete(f"/api/v2/imports/{import_record.id}", headers=auth_headers)
+        assert r.status_code == 200
+        assert r.json() == {
+            "transactions": 2,
+            "category_splits": 0,
+            "duplicates_cleared": 0,
+            "groups_dissolved": 0,
+            "accounts": 0,
+        }
+        assert client.get(f"/api/v2/imports/{import_record.id}", headers=auth_headers).status_code == 404
+        assert db.query(Transaction).count() == 0
+        assert client.get(f"/api/v2/accounts/{account_checking.id}", headers=auth_headers).status_code == 200
+
+    def test_delete_not_found(self, client, auth_headers, currency_eur):
+        r = client.delete("/api/v2/imports/99999", headers=auth_headers)
+        assert r.status_code == 404
+
+
 class TestImportTransactions:
     def test_returns_linked_transactions(self, client, auth_headers, import_record):
         r = client.get(f"/api/v2/imports/{import_record.id}/transactions", headers=auth_headers)
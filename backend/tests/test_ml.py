@@ -1,14 +1,17 @@
 """Tests for ML endpoints and feature extraction."""
 
 import datetime
+import re
 from decimal import Decimal
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pytest
+from scipy import sparse
 from sqlalchemy.orm import Session
 
-from app.models import Account, Category, CategorySplit, Currency, MLModel, Transaction
+from app.models import Account, Category, CategorySplit, Currency, MLModel, Transaction, TransactionGroup
 from tests.conftest import categorize
 
 
@@ -51,6 +54,97 @@ class TestDescriptionPreprocessor:
         result = pp.transform([tx])
         assert "123/4567/89012" not in result[0]
 
+    def test_loads_patterns_compiled_one_by_one(self):
+        import pickle
+
+        from app.ml.feature_extractor import REMOVE_PATTERNS, DescriptionPreprocessor
+
+        # as pickled in models saved before the patterns were combined
+        compiled = [re.compile(p, re.IGNORECASE | re.UNICODE) for p in REMOVE_PATTERNS]
+        pp = DescriptionPreprocessor.__new__(DescriptionPreprocessor)
+        pp.__dict__.update(remove_patterns=REMOVE_PATTERNS, _compiled=compiled)
+        loaded = pickle.loads(pickle.dumps(pp))
+        assert loaded.transform([SimpleNamespace(description="Payment REF. : ABC123DEF456")]) == ["Payment "]
+        # they keep removing the patterns one after the other, as when they were trained
+        assert loaded.transform([SimpleNamespace(description="REF. :05/0312/05/2023")]) == ["REF. :05/"]
+
+    def test_combined_pattern(self):
+        from app.ml.feature_extractor import DescriptionPreprocessor
+
+        # one pass of the combined pattern, which cleans some descriptions differently from one pass per pattern
+        pp = DescriptionPreprocessor().fit(None)
+        assert pp.transform([SimpleNamespace(description="REF. :05/0312/05/2023")]) == ["REF. :/"]
+        assert pp.transform([SimpleNamespace(description="Achat 9h05 le 2024-01-15")]) == ["Achat  le "]
+
+
+class TestFeatures:
+    @staticmethod
+    def _transactions() -> list[SimpleNamespace]:
+        return [
+            SimpleNamespace(
+                description="Achat 9h05 REF. : ABC123DEF456",
+                date=datetime.date(2024, 2, 29),
+                amount=Decimal("-12.50"),
+                id_source=1,
+                id_dest=None,
+            ),
+            SimpleNamespace(
+                description="Paiement 08:15 et 09:30 carte",
+                date=None,
+                amount=Decimal("100.00"),
+                id_source=2,
+                id_dest=1,
+            ),
+            SimpleNamespace(
+                description="Achat carte", date=datetime.date(1999, 12, 31), amount=0, id_source=1, id_dest=2
+            ),
+        ]
+
+    def test_columns(self):
+        from app.ml.feature_extractor import TransactionColumns
+
+        columns = TransactionColumns.from_transactions(self._transactions())
+        assert len(columns) == 3
+        assert columns.amount.tolist() == [-12.5, 100.0, 0.0]
+        assert columns.id_dest.tolist() == [-1, 1, 2]
+        assert np.isnat(columns.date[1])
+        assert TransactionColumns.from_transactions(columns) is columns
+
+    def test_transformers(self):
+        from app.ml.feature_extractor import AccountsOneHot, DateTransformer, HourMinuteTransformer
+
+        transactions = self._transactions()
+        assert DateTransformer().transform(transactions).tolist() == [[2024, 2, 29, 3], [-1] * 4, [1999, 12, 31, 4]]
+        assert HourMinuteTransformer().transform(transactions).tolist() == [[9, 5], [9, 30], [-1, -1]]
+        accounts = AccountsOneHot().fit(transactions).transform(transactions)
+        assert sparse.issparse(accounts)
+        assert accounts.shape == (3, 5)
+
+    def test_hour_minute_matches_greedy_patterns(self):
+        from app.ml.feature_extractor import HourMinuteTransformer
+
+        # the last time of the first line, hh:mm first, as the ".*hh:mm" then ".*hHmm" matches it replaces found
+        descriptions = ["le 12:34:56", "9h05 puis 12:30", "12:30 puis 9h15", "a 12h30", "a\n10:20", "9h05 et 10h45"]
+        transactions = [SimpleNamespace(description=description) for description in descriptions]
+        assert HourMinuteTransformer().transform(transactions).tolist() == [
+            [34, 56],
+            [12, 30],
+            [12, 30],
+            [2, 30],
+            [-1, -1],
+            [0, 45],
+        ]
+
+    def test_union_is_sparse(self):
+        from app.ml.feature_extractor import TransactionColumns, bank_csv_transformer
+
+        transactions = self._transactions() * 2
+        transformer = bank_csv_transformer().fit(transactions)
+        features = transformer.transform(transactions)
+        assert sparse.issparse(features)
+        columns = TransactionColumns.from_transactions(transactions)
+        assert (transformer.transform(columns) != features).nnz == 0
+
 
 class TestListModels:
     def test_list_empty(self, client, auth_headers, currency_eur):
@@ -103,7 +197,7 @@ class TestTrainEndpoint:
 
 
 class TestPredictEndpoint:
-    @patch("app.ml.predictor.predict_categories")
+    @patch("app.services.prediction_service.get_predictions")
     def test_predict_success(
         self, mock_predict, client, auth_headers, db, category_food, account_checking, currency_eur
     ):
@@ -143,7 +237,7 @@ class TestPredictEndpoint:
         assert resp.status_code == 200
         assert resp.json()["predictions"] == []
 
-    @patch("app.ml.predictor.predict_categories")
+    @patch("app.services.prediction_service.get_predictions")
     def test_predict_no_model(self, mock_predict, client, auth_headers, db, account_checking, currency_eur):
         from app.ml.predictor import NoValidModelError
 
@@ -277,8 +371,309 @@ class TestShouldTrain:
         assert should_train(db) is True
 
 
+class TestTrainModel:
+    @pytest.fixture
+    def labelled(self, db, tmp_path, monkeypatch, category_food, category_salary, account_checking, currency_eur):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "model_path", str(tmp_path))
+        for i in range(60):
+            category, description = (category_food, "grocery") if i % 2 else (category_salary, "employer")
+            t = Transaction(
+                external_id=f"tm-{i}",
+                id_source=account_checking.id,
+                date=datetime.date(2024, 1, 1 + i % 28),
+                amount=Decimal("10.00"),
+                id_currency=currency_eur.id,
+                description=f"{description} {i}",
+            )
+            db.add(t)
+            db.flush()
+            categorize(db, t, category)
+        db.commit()
+        return tmp_path
+
+    @patch("app.ml.trainer.fill_predictions")
+    def test_grid_search(self, mock_fill, db, labelled):
+        from app.ml.artifact import load_artifact
+        from app.ml.trainer import train_model
+
+        model = train_model(db, n_estimators=5)
+
+        assert model.state == "valid"
+        metadata = model.metadata_
+        assert (metadata["search"], metadata["n_candidates"], metadata["budget_exhausted"]) == ("grid", 12, False)
+        assert set(metadata["params"]) == {"min_samples_leaf", "max_features"}
+        assert set(metadata["timings"]) == {"features", "search", "refit"}
+        forest = load_artifact(str(labelled / model.filename)).pipeline.named_steps["model"]
+        assert (forest.n_estimators, forest.n_jobs) == (5, 1)
+        assert forest.get_params()["min_samples_leaf"] == metadata["params"]["min_samples_leaf"]
+        assert metadata["features"] == {"refitted": True, "n_extracted": 60, "drift": 1.0}
+        mock_fill.assert_called_once_with(db)
+
+        # nothing changed: features of the previous training are reused
+        assert train_model(db, n_estimators=5).metadata_["features"] == {
+            "refitted": False,
+            "n_extracted": 0,
+            "drift": 0.0,
+        }
+
+    @pytest.mark.parametrize("search", ["halving_grid", "halving_random"])
+    @patch("app.ml.trainer.fill_predictions")
+    def test_parallel_halving_search(self, mock_fill, search, db, labelled, monkeypatch):
+        from app.config import settings
+        from app.ml.trainer import train_model
+
+        monkeypatch.setattr(settings, "ml_search", search)
+        monkeypatch.setattr(settings, "ml_n_jobs", 2)
+        model = train_model(db, n_estimators=5)
+
+        assert model.state == "valid"
+        assert model.metadata_["search"] == search
+        assert all(type(value) is int for value in model.metadata_["params"].values())
+
+    @patch("app.ml.trainer.fill_predictions")
+    def test_search_budget(self, mock_fill, db, labelled, monkeypatch):
+        from app.config import settings
+        from app.ml.trainer import train_model
+
+        monkeypatch.setattr(settings, "ml_search_budget", 1e-6)
+        model = train_model(db, n_estimators=5)
+
+        assert model.state == "valid"
+        assert (model.metadata_["n_candidates"], model.metadata_["budget_exhausted"]) == (1, True)
+
+    @patch("app.ml.trainer.fill_predictions")
+    def test_incremental_update(self, mock_fill, db, labelled, monkeypatch, category_food, account_checking):
+        from app.config import settings
+        from app.ml.artifact import load_artifact
+        from app.ml.trainer import should_train, train_model, update_model
+
+        monkeypatch.setattr(settings, "ml_incremental", True)
+        base = train_model(db)
+        assert base.metadata_["incremental"] is True
+        assert update_model(db).metadata_["n_updated"] == 0
+
+        new = Transaction(
+            external_id="tm-new",
+            id_source=account_checking.id,
+            date=datetime.date(2024, 3, 1),
+            amount=Decimal("10.00"),
+            id_currency=account_checking.id_currency,
+            description="grocery new",
+        )
+        db.add(new)
+        db.flush()
+        categorize(db, new, category_food)
+        db.commit()
+        assert should_train(db) is True
+
+        updated = update_model(db)
+        assert (updated.state, base.state) == ("valid", "invalid")
+        assert (updated.metadata_["n_updates"], updated.metadata_["n_updated"]) == (2, 1)
+        assert updated.metadata_["n_samples"] == 61
+        assert updated.metadata_["trained_at"] == base.metadata_["trained_at"]
+        assert should_train(db) is False
+        artifact = load_artifact(str(labelled / updated.filename))
+        assert artifact.decode(artifact.pipeline.predict([new]))[0] == category_food.id
+
+    @patch("app.ml.trainer.fill_predictions")
+    def test_update_needs_full_training(self, mock_fill, db, labelled, monkeypatch):
+        from app.config import settings
+        from app.ml.trainer import train_model, update_model
+
+        assert update_model(db) is None  # no model
+        train_model(db, n_estimators=5)
+        assert update_model(db) is None  # not incremental
+
+        monkeypatch.setattr(settings, "ml_incremental", True)
+        train_model(db)
+        db.add(Category(name="Leisure"))
+        db.commit()
+        assert update_model(db) is None
+
+        model = train_model(db)
+        model.metadata_ = {**model.metadata_, "trained_at": "2020-01-01T00:00:00+00:00"}
+        db.commit()
+        assert update_model(db) is None
+
+
+class TestTrainingData:
+    def _transaction(self, db, account, currency, i, **kwargs) -> Transaction:
+        t = Transaction(
+            external_id=f"td-{i}",
+            id_source=account.id,
+            date=datetime.date(2024, 3, i),
+            amount=Decimal("-12.50"),
+            id_currency=currency.id,
+            description=f"shop {i}",
+            **kwargs,
+        )
+        db.add(t)
+        db.flush()
+        return t
+
+    def test_loads_first_split_and_group_labels(
+        self, db, category_food, category_salary, account_checking, currency_eur
+    ):
+        from app.ml.trainer import count_labelled, load_training_data
+
+        split = self._transaction(db, account_checking, currency_eur, 1)
+        db.add_all(
+            [
+                CategorySplit(id_transaction=split.id, id_category=category_food.id, amount=Decimal("-10.00")),
+                CategorySplit(id_transaction=split.id, id_category=category_salary.id, amount=Decimal("-2.50")),
+            ]
+        )
+        group = TransactionGroup(name="refund")
+        db.add(group)
+        db.flush()
+        grouped = self._transaction(db, account_checking, currency_eur, 2, id_transaction_group=group.id)
+        db.add(CategorySplit(id_group=group.id, id_category=category_salary.id, amount=Decimal("-12.50")))
+        self._transaction(db, account_checking, currency_eur, 3)
+        db.commit()
+
+        ids, columns, category_ids = load_training_data(db, batch_size=1)
+
+        order = np.argsort(ids)
+        assert list(ids[order]) == [split.id, grouped.id]
+        assert list(columns.description[order]) == ["shop 1", "shop 2"]
+        assert list(category_ids[order]) == [category_food.id, category_salary.id]
+        assert list(columns.date[order]) == [np.datetime64("2024-03-01"), np.datetime64("2024-03-02")]
+        assert list(columns.amount) == [-12.5, -12.5]
+        assert list(columns.id_source) == [account_checking.id] * 2
+        assert list(columns.id_dest) == [-1, -1]
+        assert count_labelled(db) == 2
+
+        _, columns, category_ids = load_training_data(db, where=Transaction.id == grouped.id)
+        assert (list(columns.description), list(category_ids)) == (["shop 2"], [category_salary.id])
+
+    def test_empty(self, db):
+        from app.ml.trainer import count_labelled, load_training_data
+
+        ids, columns, category_ids = load_training_data(db)
+
+        assert (len(ids), len(columns), len(category_ids), count_labelled(db)) == (0, 0, 0, 0)
+
+
+SHOPS = ["bakery", "garage", "pharmacy", "cinema", "market"]
+
+
+class TestFeatureStore:
+    @pytest.fixture
+    def store(self, tmp_path, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "model_path", str(tmp_path))
+        monkeypatch.setattr(settings, "ml_feature_drift", 0.2)
+        return tmp_path / "features"
+
+    @staticmethod
+    def _columns(descriptions: list[str]):
+        from app.ml.feature_extractor import TransactionColumns
+
+        n = len(descriptions)
+        return TransactionColumns.from_lists(
+            description=descriptions,
+            date=[datetime.date(2024, 1, 1 + i % 28) for i in range(n)],
+            amount=[-1.5 * i for i in range(n)],
+            id_source=[1 + i % 2 for i in range(n)],
+            id_dest=[None] * n,
+        )
+
+    def test_reuses_stored_features(self, store):
+        from app.ml.feature_extractor import bank_csv_transformer
+        from app.ml.feature_store import fit_transform
+
+        ids = np.arange(1, 21)
+        columns = self._columns([f"payment {SHOPS[i % 5]}" for i in range(20)])
+        transformer, features, details = fit_transform("bank_csv", bank_csv_transformer, ids, columns)
+        assert (details["refitted"], details["n_extracted"]) == (True, 20)
+        assert (store / "bank_csv.joblib").exists()
+
+        # one transaction changed, one added, and order changed
+        columns = self._columns([f"payment {SHOPS[i % 5]}" for i in range(20)] + ["payment bakery"])
+        columns.description[3] = "payment market"
+        order = np.arange(21)[::-1]
+        ids = np.append(ids, 21)[order]
+        columns = columns.take(order)
+        reused, features, details = fit_transform("bank_csv", bank_csv_transformer, ids, columns)
+
+        assert (details["refitted"], details["n_extracted"], details["drift"]) == (False, 2, 0.1364)
+        assert (features != sparse.csr_matrix(transformer.transform(columns))).nnz == 0
+        assert reused.transformer_list[0][1]._tfidf.vocabulary_ == transformer.transformer_list[0][1]._tfidf.vocabulary_
+
+    def test_refits_after_drift(self, store):
+        from app.ml.feature_extractor import bank_csv_transformer
+        from app.ml.feature_store import fit_transform
+
+        fit_transform("bank_csv", bank_csv_transformer, np.arange(10), self._columns(["bakery"] * 5 + ["garage"] * 5))
+
+        columns = self._columns(["bakery"] * 5 + ["pharmacy"] * 5)
+        transformer, features, details = fit_transform("bank_csv", bank_csv_transformer, np.arange(10), columns)
+
+        assert (details["refitted"], details["n_extracted"], details["drift"]) == (True, 10, 0.6667)
+        assert "pharmacy" in transformer.transformer_list[0][1]._tfidf.vocabulary_
+
+    def test_ignores_unreadable_store(self, store):
+        from app.ml.feature_extractor import bank_csv_transformer
+        from app.ml.feature_store import fit_transform
+
+        store.mkdir()
+        (store / "bank_csv.joblib").write_bytes(b"garbage")
+
+        _, _, details = fit_transform(
+            "bank_csv", bank_csv_transformer, np.arange(4), self._columns(["bakery", "garage"] * 2)
+        )
+
+        assert details["refitted"] is True
+
+
+class TestLabelJournal:
+    @staticmethod
+    def _events(db: Session, after: int) -> list[tuple]:
+        from app.models import LabelEvent
+
+        events = db.query(LabelEvent).filter(LabelEvent.id > after).order_by(LabelEvent.id)
+        return [(e.kind, e.id_transaction, e.id_group, e.id_category) for e in events]
+
+    def test_split_changes(self, client, auth_headers, db, sample_transaction, category_food, category_salary):
+        from app.ml.trainer import journal_head
+
+        t, head = sample_transaction, journal_head(db)
+        resp = client.put(f"/api/v2/transactions/{t.id}/category/{category_food.id}", headers=auth_headers)
+        assert resp.status_code == 200
+        resp = client.put(f"/api/v2/transactions/{t.id}/category/{category_salary.id}", headers=auth_headers)
+        assert resp.status_code == 200
+        resp = client.delete(f"/api/v2/transactions/{t.id}/category-splits", headers=auth_headers)
+        assert resp.status_code == 200
+
+        assert self._events(db, head) == [
+            ("label", t.id, None, category_food.id),
+            ("unlabel", t.id, None, category_food.id),
+            ("label", t.id, None, category_salary.id),
+            ("unlabel", t.id, None, category_salary.id),
+        ]
+
+    def test_tree_changes(self, client, auth_headers, db, category_food, category_salary):
+        from app.ml.trainer import journal_head
+
+        head = journal_head(db)
+        resp = client.post("/api/v2/categories", headers=auth_headers, json={"name": "Leisure", "color": "#00FF00"})
+        leisure = resp.json()["id"]
+        client.put(f"/api/v2/categories/{leisure}", headers=auth_headers, json={"color": "#0000FF"})
+        client.put(f"/api/v2/categories/{leisure}", headers=auth_headers, json={"id_parent": category_food.id})
+        client.delete(f"/api/v2/categories/{category_salary.id}", headers=auth_headers)
+
+        assert self._events(db, head) == [
+            ("tree", None, None, leisure),
+            ("tree", None, None, leisure),
+            ("tree", None, None, category_salary.id),
+        ]
+
+
 class TestPredictStaleCategory:
-    @patch("app.ml.predictor.predict_categories")
+    @patch("app.services.prediction_service.get_predictions")
     def test_stale_category_returns_null(self, mock_predict, client, auth_headers, db, account_checking, currency_eur):
         """When model predicts a category_id that no longer exists, return null."""
         t = Transaction(
@@ -305,3 +700,343 @@ class TestPredictStaleCategory:
         assert pred["category_id"] is None
         assert pred["category_name"] is None
         assert pred["probability"] == 0.0
+
+
+def _train_pipeline(labels: dict[str, int]):
+    """A small pipeline of the trained shape, mapping description keywords to encoded categories."""
+    from sklearn.ensemble import ExtraTreesClassifier
+    from sklearn.pipeline import Pipeline
+
+    from app.ml.feature_extractor import bank_csv_transformer
+
+    X, y = [], []
+    for i in range(20):
+        for word, label in labels.items():
+            X.append(
+                SimpleNamespace(
+                    description=f"{word} payment {i}",
+                    date=datetime.date(2024, 1, 1 + i),
+                    amount=Decimal("10.00"),
+                    id_source=None,
+                    id_dest=None,
+                )
+            )
+            y.append(label)
+    pipeline = Pipeline([("features", bank_csv_transformer()), ("model", ExtraTreesClassifier(n_estimators=5))])
+    return pipeline.fit(X, y)
+
+
+@pytest.fixture
+def ml_db(tmp_path, monkeypatch):
+    """A file database (shared with the worker process) with two categories and a valid model."""
+    from joblib import dump
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.config import settings
+    from app.database import Base
+    from app.ml import predictor
+    from app.ml.artifact import ModelArtifact, save_artifact
+
+    url = f"sqlite:///{tmp_path / 'ml.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "database_url", url)
+    monkeypatch.setattr(settings, "model_path", str(tmp_path))
+    session = sessionmaker(bind=engine, expire_on_commit=False)()
+    food, salary = Category(name="Food"), Category(name="Salary")
+    session.add_all([food, salary])
+    session.commit()
+    pipeline = _train_pipeline({"grocery": 0, "employer": 1})
+    for filename, category_ids in [("model-1.pkl", [food.id, salary.id]), ("model-2.pkl", [salary.id, food.id])]:
+        artifact = ModelArtifact(pipeline, np.array(category_ids), "fingerprint", "fine")
+        save_artifact(artifact, str(tmp_path / filename))
+    # saved before artifacts were bundled: labels are decoded with the category tree, in id order
+    dump(pipeline, tmp_path / "legacy.pkl")
+    session.add(MLModel(filename="model-1.pkl", state="valid", metadata_={"class_level": "fine"}))
+    session.commit()
+    try:
+        yield SimpleNamespace(session=session, food=food, salary=salary)
+    finally:
+        predictor.shutdown_inference_worker()
+        session.close()
+        engine.dispose()
+
+
+class TestInferenceWorker:
+    @staticmethod
+    def _transaction(description: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            id=1,
+            description=description,
+            date=datetime.date(2024, 2, 1),
+            amount=Decimal("10.00"),
+            id_source=None,
+            id_dest=None,
+        )
+
+    def test_worker_stays_warm(self, ml_db):
+        from app.ml import predictor
+
+        cat_id, prob = predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        assert cat_id == ml_db.food.id
+        assert 0 < prob <= 1
+        pid = predictor._worker.process.pid
+
+        results = predictor.predict_categories(
+            ml_db.session, [self._transaction("employer payment"), self._transaction("grocery payment")]
+        )
+        assert [cat_id for cat_id, _ in results] == [ml_db.salary.id, ml_db.food.id]
+        assert predictor._worker.process.pid == pid
+        assert predictor._worker.requests == 2
+
+    def test_newer_model_is_swapped_in(self, ml_db):
+        from app.ml import predictor
+
+        assert predictor.predict_category(ml_db.session, self._transaction("grocery payment"))[0] == ml_db.food.id
+        pid = predictor._worker.process.pid
+
+        ml_db.session.add(MLModel(filename="model-2.pkl", state="valid", metadata_={"class_level": "fine"}))
+        ml_db.session.commit()
+        assert predictor.predict_category(ml_db.session, self._transaction("grocery payment"))[0] == ml_db.salary.id
+        assert predictor._worker.process.pid == pid
+
+    def test_recycled_after_max_requests(self, ml_db, monkeypatch):
+        from app.config import settings
+        from app.ml import predictor
+
+        monkeypatch.setattr(settings, "inference_max_requests", 2)
+        predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        process = predictor._worker.process
+        predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        assert predictor._worker is None
+        assert not process.is_alive()
+
+        assert predictor.predict_category(ml_db.session, self._transaction("grocery payment"))[0] == ml_db.food.id
+        assert predictor._worker.process.pid != process.pid
+
+    def test_recycled_past_memory_limit(self, ml_db, monkeypatch):
+        from app.config import settings
+        from app.ml import predictor
+
+        monkeypatch.setattr(settings, "inference_memory_limit_mb", 1)
+        predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        assert predictor._worker is None
+
+    def test_failed_request_keeps_worker(self, ml_db):
+        from app.ml import predictor
+        from app.ml.predictor import InferenceError
+
+        predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        pid = predictor._worker.process.pid
+        ml_db.session.add(MLModel(filename="missing.pkl", state="valid", metadata_={"class_level": "fine"}))
+        ml_db.session.commit()
+
+        with pytest.raises(InferenceError, match="missing.pkl"):
+            predictor.predict_category(ml_db.session, self._transaction("grocery payment"))
+        assert predictor._worker.process.pid == pid
+
+    def test_predicts_without_database(self, ml_db, monkeypatch):
+        from app.config import settings
+        from app.ml import predictor
+
+        monkeypatch.setattr(settings, "database_url", "sqlite:////nonexistent/banking.db")
+        assert predictor.predict_category(ml_db.session, self._transaction("employer payment"))[0] == ml_db.salary.id
+
+    def test_legacy_pipeline(self, ml_db):
+        from app.ml import predictor
+
+        ml_db.session.add(MLModel(filename="legacy.pkl", state="valid", metadata_={"class_level": "fine"}))
+        ml_db.session.commit()
+        assert predictor.predict_category(ml_db.session, self._transaction("employer payment"))[0] == ml_db.salary.id
+
+
+class TestPredictionTable:
+    @staticmethod
+    def _transactions(session: Session, descriptions: list[str], id_import: int | None = None) -> list[Transaction]:
+        if session.get(Currency, 1) is None:
+            session.add(Currency(id=1, symbol="€", short_name="EUR", long_name="Euro"))
+        transactions = [
+            Transaction(
+                external_id=f"t-{description}-{i}",
+                date=datetime.date(2024, 2, 1),
+                amount=Decimal("10.00"),
+                id_currency=1,
+                description=description,
+                id_import=id_import,
+            )
+            for i, description in enumerate(descriptions)
+        ]
+        session.add_all(transactions)
+        session.commit()
+        return transactions
+
+    def test_fill_stores_uncategorised(self, ml_db):
+        from app.models import TransactionPrediction
+        from app.services.prediction_service import fill_predictions
+
+        grocery, employer, done = self._transactions(
+            ml_db.session, ["grocery payment", "employer payment", "grocery payment"]
+        )
+        ml_db.session.add(CategorySplit(id_transaction=done.id, id_category=ml_db.food.id, amount=done.amount))
+        ml_db.session.commit()
+
+        assert fill_predictions(ml_db.session, batch_size=1) == 2
+        rows = {p.id_transaction: p for p in ml_db.session.query(TransactionPrediction)}
+        assert set(rows) == {grocery.id, employer.id}
+        assert rows[grocery.id].id_category == ml_db.food.id
+        assert rows[employer.id].id_category == ml_db.salary.id
+        ranking = rows[grocery.id].top_k
+        assert [cat_id for cat_id, _ in ranking] == [ml_db.food.id, ml_db.salary.id]
+        assert ranking[0][1] == rows[grocery.id].probability >= ranking[1][1]
+        assert fill_predictions(ml_db.session) == 0
+
+    def test_fill_import_only(self, ml_db):
+        from app.models import ImportRecord, TransactionPrediction
+        from app.services.prediction_service import fill_predictions
+
+        record = ImportRecord(format="belfius", filenames=["statement.csv"])
+        ml_db.session.add(record)
+        ml_db.session.commit()
+        self._transactions(ml_db.session, ["grocery payment"])
+        [imported] = self._transactions(ml_db.session, ["employer payment"], id_import=record.id)
+
+        assert fill_predictions(ml_db.session, id_import=record.id) == 1
+        assert [p.id_transaction for p in ml_db.session.query(TransactionPrediction)] == [imported.id]
+
+    def test_newer_model_replaces_predictions(self, ml_db):
+        from app.models import TransactionPrediction
+        from app.services.prediction_service import fill_predictions
+
+        [grocery] = self._transactions(ml_db.session, ["grocery payment"])
+        fill_predictions(ml_db.session)
+        newer = MLModel(filename="model-2.pkl", state="valid", metadata_={"class_level": "fine"})
+        ml_db.session.add(newer)
+        ml_db.session.commit()
+
+        assert fill_predictions(ml_db.session) == 1
+        [prediction] = ml_db.session.query(TransactionPrediction).all()
+        assert (prediction.id_model, prediction.id_category) == (newer.id, ml_db.salary.id)
+
+    def test_get_reads_stored_and_predicts_misses(self, ml_db):
+        from app.models import TransactionPrediction
+        from app.services.prediction_service import fill_predictions, get_predictions
+
+        grocery, employer = self._transactions(ml_db.session, ["grocery payment", "employer payment"])
+        fill_predictions(ml_db.session)
+        ml_db.session.query(TransactionPrediction).filter_by(id_transaction=employer.id).delete()
+        ml_db.session.query(TransactionPrediction).filter_by(id_transaction=grocery.id).update({"probability": 0.5})
+        ml_db.session.commit()
+
+        results = get_predictions(ml_db.session, [grocery, employer])
+        ml_db.session.commit()
+
+        assert results[0] == (ml_db.food.id, 0.5)
+        assert results[1][0] == ml_db.salary.id
+        assert ml_db.session.query(TransactionPrediction).count() == 2
+        with patch("app.services.prediction_service.predict_top_k") as mock_predict:
+            assert get_predictions(ml_db.session, [employer]) == [results[1]]
+        mock_predict.assert_not_called()
+
+    def test_store_keeps_predictions_of_other_session(self, ml_db):
+        from app.models import TransactionPrediction
+        from app.services.prediction_service import _store
+
+        grocery, employer = self._transactions(ml_db.session, ["grocery payment", "employer payment"])
+        model = ml_db.session.query(MLModel).one()
+        ml_db.session.add(TransactionPrediction(id_transaction=grocery.id, id_model=model.id, probability=0.5))
+        ml_db.session.commit()
+
+        rankings = [[(ml_db.food.id, 0.9)], [(ml_db.salary.id, 0.8)]]
+        assert _store(ml_db.session, model, [grocery, employer], rankings) == 1
+        ml_db.session.commit()
+        rows = {p.id_transaction: p for p in ml_db.session.query(TransactionPrediction)}
+        assert (rows[grocery.id].id_category, rows[grocery.id].probability) == (None, 0.5)
+        assert (rows[employer.id].id_category, rows[employer.id].probability) == (ml_db.salary.id, 0.8)
+
+    def test_editing_model_inputs_drops_prediction(self, client, auth_headers, db, account_checking, currency_eur):
+        from app.models import TransactionPrediction
+
+        t = Transaction(
+            external_id="manual-1",
+            id_source=account_checking.id,
+            date=datetime.date(2024, 1, 1),
+            amount=Decimal("25.00"),
+            id_currency=currency_eur.id,
+            description="Grocery shopping",
+            data_source="manual",
+        )
+        model = MLModel(filename="model.pkl", state="valid", metadata_={"class_level": "fine"})
+        db.add_all([t, model])
+        db.flush()
+        db.add(TransactionPrediction(id_transaction=t.id, id_model=model.id, probability=0.9))
+        db.flush()
+
+        resp = client.put(f"/api/v2/transactions/{t.id}", headers=auth_headers, json={"notes": "weekly"})
+        assert resp.status_code == 200
+        assert db.query(TransactionPrediction).count() == 1
+        resp = client.put(f"/api/v2/transactions/{t.id}", headers=auth_headers, json={"description": "Rent"})
+        assert resp.status_code == 200
+        assert db.query(TransactionPrediction).count() == 0
+
+    def test_get_without_model(self, db):
+        from app.ml.predictor import NoValidModelError
+        from app.services.prediction_service import get_predictions
+
+        with pytest.raises(NoValidModelError):
+            get_predictions(db, [SimpleNamespace(id=1)])
+
+    @patch("app.services.prediction_service.get_predictions")
+    def test_listing_embeds_predictions(
+        self, mock_predict, client, auth_headers, db, category_food, account_checking, currency_eur
+    ):
+        transactions = [
+            Transaction(
+                external_id=f"list-{i}",
+                id_source=account_checking.id,
+                date=datetime.date(2024, 1, 1 + i),
+                amount=Decimal("25.00"),
+                id_currency=currency_eur.id,
+                description="Grocery shopping",
+            )
+            for i in range(2)
+        ]
+        db.add_all(transactions)
+        db.flush()
+        categorize(db, transactions[0], category_food)
+        mock_predict.return_value = [(category_food.id, 0.81234)]
+
+        resp = client.get("/api/v2/transactions", headers=auth_headers, params={"with_predictions": True})
+        assert resp.status_code == 200
+        predictions = {t["id"]: t["prediction"] for t in resp.json()}
+        assert predictions[transactions[0].id] is None
+        assert predictions[transactions[1].id]["category_name"] == "Food"
+        assert predictions[transactions[1].id]["probability"] == 0.8123
+        assert [t.id for t in mock_predict.call_args.args[1]] == [transactions[1].id]
+
+        resp = client.get("/api/v2/transactions", headers=auth_headers)
+        assert all("prediction" not in t or t["prediction"] is None for t in resp.json())
+
+
+class TestModelArtifact:
+    def test_decode(self):
+        from app.ml.artifact import ModelArtifact
+
+        artifact = ModelArtifact(
+            pipeline=None, category_ids=np.array([12, 7, 30]), category_fingerprint="", class_level="fine"
+        )
+        assert artifact.decode(np.array([2, 0, 1, 1])) == [30, 12, 7, 7]
+
+    def test_encoder_classes(self, db: Session):
+        from app.ml.feature_extractor import CategoryEncoder
+
+        parent = Category(name="Parent")
+        db.add(parent)
+        db.flush()
+        children = [Category(name=f"Child {i}", id_parent=parent.id) for i in range(2)]
+        db.add_all(children)
+        db.flush()
+
+        encoder = CategoryEncoder(db, level="fine")
+        ids = [children[1].id, children[0].id]
+        assert encoder.classes_[encoder.transform(ids)].tolist() == ids
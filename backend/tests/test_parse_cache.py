@@ -0,0 +1,87 @@
+"""Tests for the on-disk parse cache."""
+
+import io
+import os
+
+import pytest
+
+from app.config import settings
+from app.parsers import mastercard
+from app.services import parse_cache
+from app.services.parse_cache import map_cached
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _read_all(source) -> bytes:
+    return source.read()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "parse_cache_dir", str(tmp_path))
+    return tmp_path
+
+
+class _CountingMap:
+    def __init__(self):
+        self.parsed = 0
+
+    def __call__(self, parse, sources):
+        for source in sources:
+            self.parsed += 1
+            yield parse(source)
+
+
+class TestMapCached:
+    def test_cached_files_are_not_parsed_again(self, cache_dir):
+        counting = _CountingMap()
+        assert list(map_cached(_read_all, [io.BytesIO(b"a")], ["aa11"], map_files=counting)) == [b"a"]
+        assert counting.parsed == 1
+
+        # keyed by content hash: the stale source content is not read again
+        sources = [io.BytesIO(b"ignored"), io.BytesIO(b"b")]
+        assert list(map_cached(_read_all, sources, ["aa11", "bb22"], map_files=counting)) == [b"a", b"b"]
+        assert counting.parsed == 2
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "parse_cache_dir", "")
+        counting = _CountingMap()
+        for _ in range(2):
+            assert list(map_cached(_read_all, [io.BytesIO(b"a")], ["aa11"], map_files=counting)) == [b"a"]
+        assert counting.parsed == 2
+
+    def test_corrupt_entry_is_ignored(self, cache_dir):
+        list(map_cached(_read_all, [io.BytesIO(b"a")], ["aa11"]))
+        [entry] = (cache_dir / "aa").iterdir()
+        entry.write_bytes(b"not a pickle")
+        assert list(map_cached(_read_all, [io.BytesIO(b"a")], ["aa11"])) == [b"a"]
+
+    def test_unpicklable_result_is_not_cached(self, cache_dir):
+        def _unpicklable(source):
+            return lambda: source.read()
+
+        [result] = map_cached(_unpicklable, [io.BytesIO(b"a")], ["aa11"])
+        assert result() == b"a"
+        assert list(cache_dir.rglob("*")) == [cache_dir / "aa"]
+
+    def test_mastercard_statement(self, cache_dir):
+        filepath = os.path.join(FIXTURES_DIR, "mastercard_sample.pdf")
+        expected = mastercard.parse_pdf(filepath)
+        list(map_cached(mastercard.parse_pdf, [filepath], ["cc33"]))
+        assert parse_cache.load(mastercard.parse_pdf, "cc33") == expected
+
+    def test_least_recently_used_entries_are_evicted(self, cache_dir, monkeypatch):
+        monkeypatch.setattr(settings, "parse_cache_max_mb", 1)
+        payload = b"x" * 400 * 1024
+        for age, content_hash in [(30, "aa11"), (20, "bb22")]:
+            list(map_cached(_read_all, [io.BytesIO(payload)], [content_hash]))
+            [entry] = (cache_dir / content_hash[:2]).iterdir()
+            os.utime(entry, (entry.stat().st_mtime - age,) * 2)
+
+        # loading refreshes "aa11", so "bb22" is the least recently used entry once the cache is full
+        assert parse_cache.load(_read_all, "aa11") == payload
+        list(map_cached(_read_all, [io.BytesIO(payload)], ["cc33"]))
+        assert parse_cache.load(_read_all, "bb22") is None
+        assert parse_cache.load(_read_all, "aa11") == payload
+        assert parse_cache.load(_read_all, "cc33") == payload
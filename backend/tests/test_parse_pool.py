@@ -0,0 +1,64 @@
+"""Tests for the parsing process pool."""
+
+import io
+import os
+import time
+
+import pytest
+
+from app.config import settings
+from app.parsers import ing
+from app.services import parse_pool
+from app.services.parse_pool import ParseTimeoutError, map_files
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _first_line(source) -> str:
+    time.sleep(0.05 if source.read(1) == b"0" else 0)
+    return source.readline().decode().strip()
+
+
+def _slow_parse(source) -> None:
+    time.sleep(30)
+
+
+def _hungry_parse(source) -> int:
+    return len(bytearray(512 * 1024 * 1024))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "parse_workers", 2)
+    monkeypatch.setattr(settings, "parse_timeout", 1.0)
+    monkeypatch.setattr(settings, "parse_memory_limit_mb", 256)
+    parse_pool.shutdown_parse_pool()
+    yield
+    parse_pool.shutdown_parse_pool()
+
+
+class TestMapFiles:
+    def test_results_keep_input_order(self, pool):
+        sources = [io.BytesIO(f"{i % 2}file {i}\n".encode()) for i in range(6)]
+        assert list(map_files(_first_line, sources)) == [f"file {i}" for i in range(6)]
+
+    def test_parse_files_matches_sequential_parsing(self, pool):
+        filepath = os.path.join(FIXTURES_DIR, "ing_sample.csv")
+        sources = [filepath, open(filepath, "rb"), filepath]
+        try:
+            assert ing.parse_files(sources, map_files=map_files) == ing.parse_files(sources)
+        finally:
+            sources[1].close()
+
+    def test_timeout(self, pool):
+        with pytest.raises(ParseTimeoutError):
+            list(map_files(_slow_parse, [io.BytesIO(b"x")]))
+
+    def test_memory_cap(self, pool):
+        with pytest.raises(MemoryError):
+            list(map_files(_hungry_parse, [io.BytesIO(b"x")]))
+
+    def test_inline_when_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "parse_workers", 0)
+        assert list(map_files(_first_line, [io.BytesIO(b"0a\n")])) == ["a"]
+        assert parse_pool._pool is None
@@ -1,13 +1,29 @@
 """Tests for bank file parsers."""
 
+import io
 import os
+import random
+import tracemalloc
 from datetime import date
 from decimal import Decimal
 
+import numpy as np
+import pandas as pd
 import pytest
 
-from app.parsers import belfius, ing
-from app.parsers.common import sanitize, sanitize_number, parse_date_str
+from app.parsers import belfius, camt053, ing, mastercard, mt940, ofx
+from app.parsers.registry import MIXED, data_source_of, sniff_format
+from app.parsers.common import (
+    ABSENT,
+    AmountColumn,
+    SNIFF_SIZE,
+    ParsedBatch,
+    ParsedTransaction,
+    rebatch,
+    sanitize,
+    sanitize_number,
+    parse_date_str,
+)
 
 from app.models import ImportRecord, Transaction
 
@@ -170,6 +186,31 @@ class TestBelfiusParser:
         assert "bic" in meta
         assert "country_code" in meta
 
+    def test_parse_file_object(self):
+        filepath = os.path.join(FIXTURES_DIR, "belfius_sample.csv")
+        with open(filepath, "rb") as f:
+            stream = io.BytesIO(f.read())
+        stream.read(10)  # parsers rewind file objects
+
+        assert belfius.parse_file(stream) == belfius.parse_file(filepath)
+        assert not stream.closed
+
+    def test_check_file(self):
+        with open(os.path.join(FIXTURES_DIR, "belfius_sample.csv"), "rb") as f:
+            assert belfius.check_file(f)
+        assert not belfius.check_file(io.BytesIO(b"header\n" * 12 + b"Numero de compte;Date\n"))
+
+
+class _CountingStream(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
 
 class TestIngParser:
     def test_parse_file(self):
@@ -212,6 +253,25 @@ class TestIngParser:
         assert "transaction_nb" in meta
         assert "communication" in meta
 
+    def test_parse_file_object(self):
+        filepath = os.path.join(FIXTURES_DIR, "ing_sample.csv")
+        with open(filepath, "rb") as f:
+            assert ing.parse_file(f) == ing.parse_file(filepath)
+
+    def test_check_file_reads_only_the_head(self):
+        with open(os.path.join(FIXTURES_DIR, "ing_sample.csv"), "rb") as f:
+            header, row = f.read().splitlines(keepends=True)[:2]
+        # multibyte characters straddling the sniff boundary must not break decoding
+        stream = _CountingStream(header + row * 50_000 + "é".encode() * SNIFF_SIZE)
+
+        assert ing.check_file(stream)
+        assert stream.bytes_read == SNIFF_SIZE
+        assert stream.tell() == 0
+
+    def test_check_file_rejects_other_format(self):
+        with open(os.path.join(FIXTURES_DIR, "belfius_sample.csv"), "rb") as f:
+            assert not ing.check_file(f)
+
     def test_large_amount_with_dot_separator(self):
         """ING uses dots for thousands (1.250,00 = 1250.00)."""
         filepath = os.path.join(FIXTURES_DIR, "ing_sample.csv")
@@ -220,6 +280,504 @@ class TestIngParser:
         assert t2.amount == Decimal("1250.00")
 
 
+class TestSniffFormat:
+    @pytest.mark.parametrize(
+        "filename, expected",
+        [
+            ("belfius_sample.csv", "belfius"),
+            ("ing_sample.csv", "ing"),
+            ("mastercard_sample.pdf", "mastercard_pdf"),
+            ("camt053_sample.xml", "camt053"),
+            ("mt940_sample.sta", "mt940"),
+            ("ofx_sample.ofx", "ofx"),
+        ],
+    )
+    def test_fixtures(self, filename, expected):
+        with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+            assert sniff_format(f) == expected
+            assert f.tell() == 0
+
+    def test_ing_with_bom(self):
+        with open(os.path.join(FIXTURES_DIR, "ing_sample.csv"), "rb") as f:
+            content = f.read()
+        assert sniff_format(io.BytesIO("\ufeff".encode() + content)) == "ing"
+
+    def test_unknown(self):
+        assert sniff_format(io.BytesIO(b"")) is None
+        assert sniff_format(io.BytesIO(b"date;amount\n2024-01-01;3\n")) is None
+        # too short to hold the Belfius header row
+        assert sniff_format(io.BytesIO(b"Compte;Date\n")) is None
+        assert sniff_format(io.BytesIO(bytes(range(256)) * 20)) is None
+
+    def test_data_source_of(self):
+        assert data_source_of(["mastercard_pdf", "mastercard_pdf"]) == "mastercard"
+        assert data_source_of(["belfius", "mastercard_pdf"]) == MIXED
+
+
+def _messy_text(rng: random.Random) -> str:
+    words = ["ACHAT", "Bancontact", "REF. : AB12", "Virement", "\xa0", "  ", "\t", "caf\xe9", "a;b", 'x "y"']
+    return " ".join(rng.choice(words) for _ in range(rng.randint(0, 4)))
+
+
+def _messy_date(rng: random.Random) -> str:
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.choice([2023, 2024])
+    return rng.choice(
+        [f"{day:02d}/{month:02d}/{year}", f"{day:02d}-{month:02d}-{year}", f"{day:02d}/{month:02d}/{year % 100}"]
+    )
+
+
+def _csv_line(fields: list[str]) -> str:
+    return ";".join('"' + f.replace('"', '""') + '"' if any(c in f for c in ';"') else f for f in fields)
+
+
+class TestColumnarParsers:
+    """The columnar parsers must produce exactly what the row parsers produce."""
+
+    @pytest.mark.parametrize("thousands", [None, "."])
+    def test_amount_column_matches_decimal(self, thousands):
+        values = ["-1234,50", "12,5", "0,00", "-0,00", "5,", ",5", "+3,004", "-2,995", "007,10", "1.234,56", " 4,20 ",
+                  "1E3", "9999999999999999,99"]
+        if thousands is None:
+            values.remove("1.234,56")
+        amounts = AmountColumn.parse(pd.Series(values, dtype=object), thousands=thousands)
+        for i, value in enumerate(values):
+            amount = Decimal((value.replace(thousands, "") if thousands else value).replace(",", "."))
+            assert amounts.cents[i] == int(amount.scaleb(2).quantize(Decimal(1), rounding="ROUND_HALF_UP"))
+            assert amounts.sign[i] == amount.compare(0)
+            assert amounts.text.iat[i] == str(amount.copy_abs())
+            assert amounts.fixed().iat[i] == f"{amount.copy_abs():.2f}"
+
+    def test_amount_column_rejects_invalid_amounts(self):
+        with pytest.raises(ArithmeticError):
+            AmountColumn.parse(pd.Series(["1,00", "abc"], dtype=object))
+
+    def test_belfius_matches_row_parser(self, tmp_path):
+        rng = random.Random(0)
+        lines = [f"Header line {i}" for i in range(12)] + ["Compte;Date comptable;..."]
+        for i in range(2500):
+            amount = f"{rng.choice(['-', ''])}{rng.randint(0, 5000)},{rng.randint(0, 99):02d}"
+            ref = rng.choice(["", f"REF. : R{i}", f"Virement REF. : X{i} suite", "REF. :"])
+            lines.append(
+                _csv_line(
+                    [
+                        rng.choice(["BE12 3456 7890 1234", " BE98\xa07654 ", ""]),
+                        _messy_date(rng),
+                        str(rng.randint(1, 12)),
+                        rng.choice([str(i), "  "]),
+                        rng.choice(["BE98 7654 3210 9876", "", "NL01\tINGB"]),
+                        _messy_text(rng),
+                        _messy_text(rng),
+                        _messy_text(rng),
+                        ref,
+                        _messy_date(rng),
+                        amount,
+                        rng.choice(["EUR", " EUR "]),
+                        rng.choice(["GKCCBEBB", ""]),
+                        rng.choice(["BE", ""]),
+                        _messy_text(rng),
+                    ]
+                )
+            )
+        filepath = tmp_path / "belfius.csv"
+        filepath.write_text("\n".join(lines) + "\n", encoding="latin1")
+
+        chunks = list(belfius.parse_file_columns(filepath, chunk_size=1000))
+        assert [len(c) for c in chunks] == [1000, 1000, 500]
+        assert [t for c in chunks for t in c.rows()] == belfius.parse_file(filepath)
+
+    def test_ing_matches_row_parser(self, tmp_path):
+        rng = random.Random(1)
+        lines = ["Numéro de compte;Nom du compte;Compte partie adverse;..."]
+        for i in range(2500):
+            amount = f"{rng.choice(['-', ''])}{rng.choice(['', '1.'])}{rng.randint(0, 999)},{rng.randint(0, 99):02d}"
+            if i % 100 == 0:
+                amount = "0,00"
+            lines.append(
+                _csv_line(
+                    [
+                        rng.choice(["BE12 3456 7890 1234", " BE98\xa07654 "]),
+                        _messy_text(rng),
+                        rng.choice(["BE98 7654 3210 9876", "", "NL01\tINGB"]),
+                        rng.choice([str(i), " ", f"{i} / 2"]),
+                        _messy_date(rng),
+                        _messy_date(rng),
+                        amount,
+                        rng.choice(["EUR", " EUR "]),
+                        _messy_text(rng),
+                        _messy_text(rng),
+                        _messy_text(rng),
+                    ]
+                )
+            )
+        filepath = tmp_path / "ing.csv"
+        filepath.write_text("\n".join(lines) + "\n", encoding="utf-8-sig")
+
+        columnar = [t for c in ing.parse_file_columns(filepath, chunk_size=1000) for t in c.rows()]
+        expected = ing.parse_file(filepath)
+        assert len(expected) < 2500  # zero amounts are skipped
+        assert columnar == expected
+
+    def test_iter_batches(self):
+        filepath = os.path.join(FIXTURES_DIR, "belfius_sample.csv")
+        batches = list(belfius.iter_batches([filepath, filepath, filepath], batch_size=4))
+        assert [len(b) for b in batches] == [4, 2]
+        assert [t for b in batches for t in b.rows()] == belfius.parse_file(filepath) * 3
+
+    def test_parse_files_columnar(self):
+        filepath = os.path.join(FIXTURES_DIR, "belfius_sample.csv")
+        with open(filepath, "rb") as f:
+            assert belfius.parse_files([f, filepath], columnar=True) == belfius.parse_files([filepath, filepath])
+
+
+def _parsed(i: int, **raw_metadata) -> ParsedTransaction:
+    return ParsedTransaction(
+        external_id=f"ext-{i}",
+        source_number="BE1234" if i % 2 else None,
+        source_name=None if i % 2 else "Shop",
+        dest_number=None,
+        dest_name="Me",
+        date=date(2024, 1, 1 + i),
+        amount=Decimal(f"{i}.{i:02d}"),
+        currency="EUR",
+        description=f"payment {i}",
+        data_source="test",
+        raw_metadata=raw_metadata,
+    )
+
+
+class TestParsedBatch:
+    def test_round_trip(self):
+        transactions = [_parsed(i, index=i) for i in range(5)]
+        batch = ParsedBatch.from_transactions(transactions)
+        assert len(batch) == 5
+        assert batch.rows() == transactions
+        assert batch.date.dtype == np.int32
+        assert batch.amount.tolist() == [0, 101, 202, 303, 404]
+
+    def test_rows_are_views(self):
+        batch = ParsedBatch.from_transactions([_parsed(i) for i in range(3)])
+        row = batch[-1]
+        assert row.index == 2
+        assert row.date == date(2024, 1, 3)
+        assert row.amount == Decimal("2.02")
+        assert row.data_source == "test"
+        assert [r.external_id for r in batch] == ["ext-0", "ext-1", "ext-2"]
+        with pytest.raises(IndexError):
+            batch[3]
+
+    def test_equal_strings_are_shared(self):
+        batch = ParsedBatch.from_transactions([_parsed(i) for i in range(3)])
+        assert batch.currency[0] is batch.currency[2]
+
+    def test_slice_and_concat(self):
+        first = ParsedBatch.from_transactions([_parsed(i, a=i) for i in range(3)])
+        second = ParsedBatch.from_transactions([_parsed(i, b=i) for i in range(3, 5)])
+        merged = ParsedBatch.concat([first, second])
+        assert merged.metadata["a"] == [0, 1, 2, ABSENT, ABSENT]
+        assert merged.rows() == first.rows() + second.rows()
+        assert merged[1:4].rows() == merged.rows()[1:4]
+        assert merged[3].raw_metadata == {"b": 3}
+
+    def test_rebatch(self):
+        transactions = [_parsed(i) for i in range(7)]
+        chunks = [ParsedBatch.from_transactions(transactions[i : i + 2]) for i in range(0, 7, 2)]
+        batches = list(rebatch(chunks, 3))
+        assert [len(b) for b in batches] == [3, 3, 1]
+        assert [t for b in batches for t in b.rows()] == transactions
+
+    def test_sub_cent_amounts_rounded_half_away_from_zero(self):
+        transactions = [_parsed(i) for i in range(4)]
+        for transaction, amount in zip(transactions, ["1.005", "-1.005", "1.0049", "2.345678"]):
+            transaction.amount = Decimal(amount)
+        batch = ParsedBatch.from_transactions(transactions)
+        assert batch.amount.tolist() == [101, -101, 100, 235]
+
+    def test_smaller_than_parsed_transactions(self, tmp_path):
+        lines = [";".join(["header"] * 15)] * 13
+        for i in range(5000):
+            lines.append(
+                f"BE12 3456 7890 1234;{i % 28 + 1:02d}/06/2024;001;{i};BE98 7654 3210 9876;John Doe;"
+                f"Main street;1000 Brussels;VIREMENT REF. : {i:08d};{i % 28 + 1:02d}/06/2024;-{i},50;EUR;"
+                f"GKCCBEBB;BE;Payment {i % 10}"
+            )
+        filepath = tmp_path / "belfius.csv"
+        filepath.write_text("\n".join(lines) + "\n", encoding="latin1")
+
+        def retained(parse):
+            tracemalloc.start()
+            try:
+                result = parse()  # noqa: F841 - kept alive while measuring
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+
+        rows = retained(lambda: belfius.parse_file(filepath))
+        batches = retained(lambda: list(belfius.parse_file_columns(filepath)))
+        assert batches * 2 < rows
+
+
+class TestMastercardParser:
+    # expected values captured from the previous HTML/BeautifulSoup based engine
+    EXPECTED_EXTERNAL_IDS = [
+        "mastercard/-45.20/SUPERMARKETBRUSSELS/2024-01-15/2024-01-25/2023-12-18/2023-12-17/BE/SUPERMARKETBRUSSELS/0",
+        "mastercard/-1234.56/AMAZONEU/2024-01-15/2024-01-25/2023-12-20/2023-12-19/LU/AMAZONEU(ViaPayPal)/1",
+        "mastercard/-18.43/HOTELNEWYORK/2024-01-15/2024-01-25/2024-01-02/2023-12-31/US/HOTELNEWYORK/2",
+        "mastercard/12.00/REFUNDSHOP/2024-01-15/2024-01-25/2024-01-05/2024-01-05/BE/REFUNDSHOP/3",
+        "mastercard/-7.50/CAFECENTRAL/2024-01-15/2024-01-25/2024-01-10/2024-01-09/AT/CAFECENTRAL/4",
+        "mastercard/-3.00/PARKING/2024-01-15/2024-01-25/2024-01-12/2024-01-11/BE/PARKING/5",
+    ]
+
+    def test_parse_files(self):
+        filepath = os.path.join(FIXTURES_DIR, "mastercard_sample.pdf")
+        transactions, account_names, account2currency = mastercard.parse_files([filepath])
+
+        # the cover page has no transactions, the two others are parsed in order
+        assert [t["external_id"] for t in transactions] == self.EXPECTED_EXTERNAL_IDS
+        assert [t["index"] for t in transactions] == list(range(6))
+        assert account_names == {
+            "SUPERMARKET BRUSSELS",
+            "AMAZON EU",
+            "HOTEL NEW YORK",
+            "REFUND SHOP",
+            "CAFE CENTRAL",
+            "PARKING",
+        }
+        assert account2currency["HOTEL NEW YORK"] == "USD"
+        assert account2currency["PARKING"] == "EUR"
+
+    def test_transaction_fields(self):
+        transactions = mastercard.parse_pdf(os.path.join(FIXTURES_DIR, "mastercard_sample.pdf"))
+
+        # multi-line merchant box, amount box one pixel below the row
+        amazon = transactions[1]
+        assert amazon["account"] == "AMAZON EU"
+        assert amazon["country_or_site"] == "AMAZON EU\n(Via PayPal)"
+        assert amazon["amount"] == Decimal("-1234.56")
+        assert amazon["when"] == date(2023, 12, 20)
+        assert amazon["value_date"] == date(2023, 12, 19)
+        assert amazon["closing_date"] == date(2024, 1, 15)
+        assert amazon["debit_date"] == date(2024, 1, 25)
+
+        # foreign currency row across the year boundary
+        hotel = transactions[2]
+        assert hotel["when"] == date(2024, 1, 2)
+        assert hotel["value_date"] == date(2023, 12, 31)
+        assert hotel["original_amount"] == "20.00"
+        assert hotel["original_currency"] == "USD"
+        assert hotel["rate_to_final"] == "1,0850"
+
+        assert transactions[3]["amount"] == Decimal("12.00")
+
+    def test_parse_file_object(self):
+        filepath = os.path.join(FIXTURES_DIR, "mastercard_sample.pdf")
+        with open(filepath, "rb") as f:
+            assert mastercard.parse_pdf(f) == mastercard.parse_pdf(filepath)
+
+    def test_iter_batches(self):
+        filepath = os.path.join(FIXTURES_DIR, "mastercard_sample.pdf")
+        batches = list(mastercard.iter_batches([filepath], batch_size=4))
+        assert [len(b) for b in batches] == [4, 2]
+        rows = [row for b in batches for row in b]
+        assert [row.external_id for row in rows] == self.EXPECTED_EXTERNAL_IDS
+        assert rows[0].dest_name == "SUPERMARKET BRUSSELS"
+        assert rows[3].source_name == "REFUND SHOP"
+        assert rows[3].amount == Decimal("12.00")
+        assert "original_amount" not in rows[0].raw_metadata
+        assert rows[2].raw_metadata["original_currency"] == "USD"
+
+    def test_find_row(self):
+        row_tops = [100, 120, 122]
+        assert mastercard._find_row(row_tops, 120) == 1
+        assert mastercard._find_row(row_tops, 101) == 0
+        assert mastercard._find_row(row_tops, 121) == 1  # tie: the upper row wins
+        assert mastercard._find_row(row_tops, 110) == -1
+        assert mastercard._find_row(row_tops, 99) == 0
+        assert mastercard._find_row([], 99) == -1
+
+
+def _peak_memory(parse):
+    tracemalloc.start()
+    try:
+        parse()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestCamt053Parser:
+    FILEPATH = os.path.join(FIXTURES_DIR, "camt053_sample.xml")
+
+    def test_parse_file(self):
+        transactions = camt053.parse_file(self.FILEPATH)
+        # the pending entry is left out
+        assert len(transactions) == 4
+        salary, energy, cafe, cafe_again = transactions
+
+        assert salary.external_id == "BE68539007547034/REF-0001"
+        assert (salary.source_number, salary.source_name) == ("BE71096123456769", "Employer SA")
+        assert (salary.dest_number, salary.dest_name) == ("BE68539007547034", None)
+        assert (salary.date, salary.amount, salary.currency) == (date(2024, 7, 1), Decimal("2500.00"), "EUR")
+        assert salary.description == "Salary July 2024"
+        assert salary.raw_metadata["end_to_end_id"] == "SALARY-07"
+        assert salary.raw_metadata["statement_id"] == "2024-07-BE68539007547034"
+
+        assert (energy.source_number, energy.dest_number, energy.dest_name) == (
+            "BE68539007547034",
+            "BE43068999999501",
+            "Energy Co",
+        )
+        assert energy.description == "+++090/9337/55493+++"
+        assert energy.raw_metadata["valued_at"] == "2024-07-02"
+        assert energy.raw_metadata["end_to_end_id"] is None
+
+        # same fields, no booking reference: told apart by their order
+        assert cafe.date == date(2024, 7, 5)
+        assert cafe.description == "Card payment Cafe"
+        assert cafe_again.external_id == cafe.external_id + "/1"
+
+    def test_file_object_and_batches(self):
+        with open(self.FILEPATH, "rb") as f:
+            assert camt053.parse_file(f) == camt053.parse_file(self.FILEPATH)
+        [batch] = list(camt053.iter_batches([self.FILEPATH]))
+        assert batch.data_source == "camt053"
+        assert batch.rows() == camt053.parse_file(self.FILEPATH)
+
+    def test_constant_memory(self, tmp_path):
+        with open(self.FILEPATH, encoding="utf-8") as f:
+            content = f.read()
+        head, rest = content.split("<Ntry>", 1)
+        entry = "<Ntry>" + rest.split("</Ntry>", 1)[0] + "</Ntry>"
+        tail = "</Stmt>" + content.split("</Stmt>", 1)[1]
+
+        def peak(n_entries):
+            entries = "".join(entry.replace("REF-0001", f"REF-{i}") for i in range(n_entries))
+            filepath = tmp_path / f"camt_{n_entries}.xml"
+            filepath.write_text(head + entries + tail, encoding="utf-8")
+            return _peak_memory(lambda: sum(1 for _ in camt053.iter_transactions(filepath)))
+
+        assert peak(20_000) < 2 * peak(1000)
+
+
+class TestMt940Parser:
+    FILEPATH = os.path.join(FIXTURES_DIR, "mt940_sample.sta")
+
+    def test_parse_file(self):
+        salary, energy, cafe, cafe_again = mt940.parse_file(self.FILEPATH)
+
+        assert salary.external_id == "NL20INGB0001234567/2024-07-01/2024-07-01/2500.00/B4G01PGN4G2V"
+        assert (salary.source_number, salary.source_name) == ("NL32INGB0000012345", "Employer BV")
+        assert salary.dest_number == "NL20INGB0001234567"
+        assert (salary.amount, salary.currency, salary.description) == (Decimal("2500.00"), "EUR", "Salary July 2024")
+        assert salary.raw_metadata["end_to_end_id"] == "SALARY-07"
+
+        # the information field is wrapped in the middle of a key
+        assert (energy.source_number, energy.dest_number, energy.dest_name) == (
+            "NL20INGB0001234567",
+            "NL86INGB0002445588",
+            "Energy Co",
+        )
+        assert energy.description == "1234567890"
+
+        assert (cafe.dest_number, cafe.description) == (None, "Card payment Cafe")
+        assert cafe_again.external_id == cafe.external_id + "/1"
+
+    @pytest.mark.parametrize(
+        "line, incoming, when",
+        [
+            ("2407010701C2500,00NTRFNONREF", True, date(2024, 7, 1)),
+            ("2401020102RD10,00NTRFNONREF", True, date(2024, 1, 2)),
+            ("2401011231D10,00NTRFNONREF", False, date(2023, 12, 31)),
+            ("240701D5,NMSCNONREF", False, date(2024, 7, 1)),
+        ],
+    )
+    def test_statement_line(self, line, incoming, when):
+        content = f":20:X\n:25:BE68539007547034\n:60F:C240101EUR0,00\n:61:{line}\n:86:Test\n-\n"
+        [t] = mt940.parse_file(io.BytesIO(content.encode()))
+        assert (t.dest_number == "BE68539007547034") == incoming
+        assert t.date == when
+
+    def test_german_information_field(self):
+        info = (
+            "166?00SEPA-UEBERWEISUNG?109310?20EREF+E2E-42?21SVWZ+Rent July"
+            "?30GENODEF1?31DE89370400440532013000?32Landlord GmbH"
+        )
+        content = (
+            ":20:X\n:25:12345678/0123456789\n:60F:C240101EUR0,00\n"
+            f":61:2407010701D800,00NTRFNONREF\n:86:{info}\n-\n"
+        )
+        [t] = mt940.parse_file(io.BytesIO(content.encode()))
+        assert t.source_number == "0123456789"
+        assert (t.dest_number, t.dest_name) == ("DE89370400440532013000", "Landlord GmbH")
+        assert t.description == "Rent July"
+        assert t.raw_metadata["end_to_end_id"] == "E2E-42"
+
+    def test_continuation_line_starting_with_dash(self):
+        content = (
+            "{1:F01BANKBEBBAXXX0000000000}{4:\n:20:X\n:25:BE68539007547034\n:60F:C240101EUR0,00\n"
+            ":61:2407010701D10,00NTRFNONREF\n:86:Invoice 42\n- paid in full\n-}{5:{CHK:123456789ABC}}\n"
+        )
+        [t] = mt940.parse_file(io.BytesIO(content.encode()))
+        assert t.description == "Invoice 42 - paid in full"
+
+    def test_unsorted_statement_ids_stay_unique(self):
+        lines = [
+            f":61:{day}{day[2:]}D10,00NMSCNONREF\n:86:Cafe\n" for day in ["240701", "240702", "240701", "240701"]
+        ]
+        content = ":20:X\n:25:BE68539007547034\n:60F:C240101EUR0,00\n" + "".join(lines) + "-\n"
+        first, other_day, again, third = mt940.parse_file(io.BytesIO(content.encode()))
+        assert other_day.external_id != first.external_id
+        assert (again.external_id, third.external_id) == (first.external_id + "/1", first.external_id + "/2")
+
+
+class TestOfxParser:
+    FILEPATH = os.path.join(FIXTURES_DIR, "ofx_sample.ofx")
+
+    def test_parse_sgml_file(self):
+        salary, energy = ofx.parse_file(self.FILEPATH)
+
+        assert salary.external_id == "BE68539007547034/20240701-0001"
+        assert (salary.source_number, salary.source_name) == ("BE71096123456769", "Employer SA")
+        assert salary.dest_number == "BE68539007547034"
+        assert (salary.date, salary.amount) == (date(2024, 7, 1), Decimal("2500.00"))
+        assert salary.description == "Salary July 2024"
+
+        assert (energy.source_number, energy.dest_name) == ("BE68539007547034", "Energy Co & Gas")
+        assert energy.amount == Decimal("42.50")
+
+    def test_xml_file_read_in_chunks(self, monkeypatch):
+        content = (
+            '<?xml version="1.0" encoding="UTF-8"?><?OFX OFXHEADER="200" VERSION="220"?>'
+            "<OFX><CREDITCARDMSGSRSV1><CCSTMTTRNRS><CCSTMTRS><CURDEF>USD</CURDEF>"
+            "<CCACCTFROM><ACCTID>4111 1111</ACCTID></CCACCTFROM><BANKTRANLIST>"
+            + "".join(
+                f"<STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20240702</DTPOSTED><TRNAMT>-{i}.25</TRNAMT>"
+                f"<FITID>F{i}</FITID><PAYEE><NAME>Shop {i}</NAME></PAYEE><MEMO>Caf\u00e9</MEMO></STMTTRN>"
+                for i in range(1, 40)
+            )
+            + "</BANKTRANLIST></CCSTMTRS></CCSTMTTRNRS></CREDITCARDMSGSRSV1></OFX>"
+        )
+        monkeypatch.setattr(ofx, "READ_SIZE", 100)
+        transactions = ofx.parse_file(io.BytesIO(content.encode()))
+
+        assert len(transactions) == 39
+        t = transactions[-1]
+        assert (t.external_id, t.source_number, t.dest_name) == ("41111111/F39", "41111111", "Shop 39")
+        assert (t.amount, t.currency, t.description) == (Decimal("39.25"), "USD", "Caf\u00e9")
+
+
+    def test_sgml_empty_leaf(self):
+        content = (
+            "OFXHEADER:100\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>EUR\n"
+            "<BANKACCTFROM><ACCTID>BE68539007547034</BANKACCTFROM><BANKTRANLIST>\n"
+            "<STMTTRN>\n<TRNTYPE>DEBIT\n<MEMO>\n<DTPOSTED>20240702\n<TRNAMT>-5.00\n<NAME>Shop\n</STMTTRN>\n"
+            "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+        )
+        [t] = ofx.parse_file(io.BytesIO(content.encode()))
+        assert (t.date, t.amount, t.dest_name) == (date(2024, 7, 2), Decimal("5.00"), "Shop")
+        assert t.description == "Shop"
+        assert t.raw_metadata["memo"] is None
+
+
 class TestImportService:
     """Integration tests for the import service with the test DB."""
 
@@ -251,10 +251,12 @@ const messages = {
       uploading: 'Uploading...',
       upload: 'Upload',
       importSuccess: 'Import completed successfully.',
+      alreadyImported: 'Already imported files were skipped',
       viewDetails: 'View details',
       history: 'Import History',
       dateTime: 'Date/Time',
       format: 'Format',
+      autoDetect: 'Detect automatically',
       files: 'Files',
       newTransactions: 'New',
       duplicates: 'Duplicates',
@@ -267,6 +269,7 @@ const messages = {
       duplicateOf: 'Duplicate of',
       noDuplicates: 'No duplicates detected in this import.',
       noAutoTagged: 'No transactions were auto-tagged in this import.',
+      deleteConfirm: 'Delete this import with its transactions and the accounts it created?',
     },
     transactionDetail: {
       openFullPage: 'Open full page',
@@ -605,10 +608,12 @@ const messages = {
       uploading: 'Envoi en cours...',
       upload: 'Envoyer',
       importSuccess: 'Import terminé avec succès.',
+      alreadyImported: 'Les fichiers déjà importés ont été ignorés',
       viewDetails: 'Voir les détails',
       history: 'Historique des imports',
       dateTime: 'Date/Heure',
       format: 'Format',
+      autoDetect: 'Détection automatique',
       files: 'Fichiers',
       newTransactions: 'Nouvelles',
       duplicates: 'Doublons',
@@ -621,6 +626,7 @@ const messages = {
       duplicateOf: 'Doublon de',
       noDuplicates: 'Aucun doublon détecté dans cet import.',
       noAutoTagged: 'Aucune transaction auto-taggée dans cet import.',
+      deleteConfirm: 'Supprimer cet import avec ses transactions et les comptes qu\'il a créés ?',
     },
     transactionDetail: {
       openFullPage: 'Ouvrir la page complète',
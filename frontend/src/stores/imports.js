@@ -27,6 +27,37 @@ export const useImportStore = defineStore('imports', () => {
     return data
   }
 
+  async function fetchImportJob(jobId) {
+    const { data } = await api.get(`/imports/jobs/${jobId}`)
+    return data
+  }
+
+  async function waitForImportJob(jobId, { interval = 1000 } = {}) {
+    for (;;) {
+      const job = await fetchImportJob(jobId)
+      if (job.status === 'done' || job.status === 'failed') return job
+      await new Promise((resolve) => setTimeout(resolve, interval))
+    }
+  }
+
+  async function previewImport(files, format) {
+    const formData = new FormData()
+    for (const file of files) {
+      formData.append('files', file)
+    }
+    const { data } = await api.post(`/imports/preview?format=${format}`, formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    })
+    return data
+  }
+
+  async function deleteImport(id) {
+    const { data } = await api.delete(`/imports/${id}`)
+    imports.value = imports.value.filter((i) => i.id !== id)
+    if (currentImport.value?.id === id) currentImport.value = null
+    return data
+  }
+
   async function fetchImportTransactions(id, params = {}) {
     const { data } = await api.get(`/imports/${id}/transactions`, { params })
     importTransactions.value = data
@@ -61,6 +92,10 @@ export const useImportStore = defineStore('imports', () => {
     loading,
     fetchImports,
     fetchImport,
+    fetchImportJob,
+    waitForImportJob,
+    previewImport,
+    deleteImport,
     fetchImportTransactions,
     fetchImportDuplicates,
     fetchImportAutoTagged,
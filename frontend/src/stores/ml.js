@@ -27,8 +27,15 @@ export const useMLStore = defineStore('ml', () => {
     return data.predictions
   }
 
+  // Keep the predictions embedded in transactions listed with `with_predictions`
+  function setPredictions(transactions) {
+    for (const tx of transactions) {
+      if (tx.prediction) predictions.value[tx.id] = tx.prediction
+    }
+  }
+
   return {
     models, predictions,
-    fetchModels, trainModel, predictTransactions,
+    fetchModels, trainModel, predictTransactions, setPredictions,
   }
 })
@@ -5,6 +5,8 @@ import { useImportStore } from '../../src/stores/imports'
 vi.mock('../../src/services/api', () => ({
   default: {
     get: vi.fn(),
+    post: vi.fn(),
+    delete: vi.fn(),
   },
 }))
 
@@ -52,6 +54,44 @@ describe('useImportStore', () => {
     })
   })
 
+  describe('waitForImportJob', () => {
+    it('polls the job until it is finished', async () => {
+      api.get
+        .mockResolvedValueOnce({ data: { id: 'abc', status: 'running', stage: 'parse' } })
+        .mockResolvedValueOnce({ data: { id: 'abc', status: 'done', stage: 'done', id_import: 7 } })
+
+      const job = await store.waitForImportJob('abc', { interval: 0 })
+
+      expect(job.id_import).toBe(7)
+      expect(api.get).toHaveBeenCalledTimes(2)
+      expect(api.get).toHaveBeenCalledWith('/imports/jobs/abc')
+    })
+
+    it('returns failed jobs without polling further', async () => {
+      api.get.mockResolvedValueOnce({ data: { id: 'abc', status: 'failed', error: 'boom' } })
+
+      const job = await store.waitForImportJob('abc', { interval: 0 })
+
+      expect(job.error).toBe('boom')
+      expect(api.get).toHaveBeenCalledTimes(1)
+    })
+  })
+
+  describe('previewImport', () => {
+    it('posts the files to the preview endpoint', async () => {
+      const preview = { total_transactions: 2, new_transactions: 2, sample: [] }
+      api.post.mockResolvedValueOnce({ data: preview })
+      const file = new File(['a;b'], 'export.csv')
+
+      const result = await store.previewImport([file], 'belfius')
+
+      expect(result).toEqual(preview)
+      const [url, formData] = api.post.mock.calls[0]
+      expect(url).toBe('/imports/preview?format=belfius')
+      expect(formData.getAll('files')).toHaveLength(1)
+    })
+  })
+
   describe('fetchImport', () => {
     it('fetches a single import by id and stores it', async () => {
       const importData = { id: 1, filename: 'export.csv', created_at: '2024-01-01' }
@@ -103,4 +143,20 @@ describe('useImportStore', () => {
       expect(result).toEqual(accountList)
     })
   })
+
+  describe('deleteImport', () => {
+    it('deletes the import and drops it from the list', async () => {
+      store.imports = [{ id: 1 }, { id: 2 }]
+      store.currentImport = { id: 1 }
+      const counts = { transactions: 3, category_splits: 0, duplicates_cleared: 0, groups_dissolved: 0, accounts: 1 }
+      api.delete.mockResolvedValueOnce({ data: counts })
+
+      const result = await store.deleteImport(1)
+
+      expect(api.delete).toHaveBeenCalledWith('/imports/1')
+      expect(store.imports).toEqual([{ id: 2 }])
+      expect(store.currentImport).toBeNull()
+      expect(result).toEqual(counts)
+    })
+  })
 })
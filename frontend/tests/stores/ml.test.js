@@ -70,4 +70,15 @@ describe('useMLStore', () => {
       expect(api.post).not.toHaveBeenCalled()
     })
   })
+
+  describe('setPredictions', () => {
+    it('stores the predictions embedded in listed transactions', () => {
+      const prediction = { transaction_id: 10, category_id: 1, category_name: 'Food', category_color: '#FF0000', probability: 0.85 }
+
+      store.setPredictions([{ id: 10, prediction }, { id: 20, prediction: null }])
+
+      expect(store.predictions[10]).toEqual(prediction)
+      expect(store.predictions[20]).toBeUndefined()
+    })
+  })
 })